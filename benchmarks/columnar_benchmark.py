@@ -0,0 +1,82 @@
+import argparse
+import io
+import math
+import os
+import random
+import sys
+import time
+
+# Benchmark: columnar (DataFrame) transform vs the row path (date normalization, map_values + ledger generation)
+# Usage: python benchmarks/columnar_benchmark.py --rows 200000
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions', '8-data-ingestion'))
+import columnar
+import rule_matcher
+import main as ingestion
+
+COMPANIES = ['SOCAR Georgia Gas', 'SOCAR Gas Export', 'TelavGas', 'SGG-003 Telavi Branch']
+DESCRIPTIONS = ['Social gas sales', 'Transport cost social', 'Pipeline maintenance', 'Office rent', 'Meter repair', 'Bank interest']
+GL_CODES = ['4001', '4100', '5100', '5200', '1200', '2100', '3000']
+CURRENCIES = ['GEL', 'GEL', 'GEL', 'USD', 'EUR']
+DEPARTMENTS = ['Technical', 'Finance', 'Operations', 'HQ']
+
+def print_header(text):
+    print(f"\n{'='*50}\n{text}\n{'='*50}")
+
+def make_csv(rows, rng):
+    """CSV shaped like the SGG ledger exports (dd.mm.yyyy dates, trans_no, Company)."""
+    out = io.StringIO()
+    out.write("date,trans_no,Company,GL Account,Description,Amount,Currency,Department\n")
+    for i in range(rows):
+        out.write(f"{rng.randint(1, 28):02d}.07.2024,{100000 + i},{rng.choice(COMPANIES)},{rng.choice(GL_CODES)},"
+                  f"{rng.choice(DESCRIPTIONS)},{rng.uniform(1, 50000):.2f},{rng.choice(CURRENCIES)},{rng.choice(DEPARTMENTS)}\n")
+    return out.getvalue().encode('utf-8')
+
+def run_rows(data, matcher):
+    """The stream mode row path: row tuples, dates normalized to ISO, then map + ledger."""
+    plan, rows, _ = ingestion.read_rows(io.BytesIO(data), 'bench.csv')
+    rows = ingestion.normalize_row_dates(plan, rows, ingestion.date_normalizer_for(plan))
+    return ingestion.transform_values(plan, rows, matcher)
+
+def run_columnar(data, matcher):
+    return [columnar.transform_frame(frame, matcher) for frame in columnar.read_csv_frames(io.BytesIO(data))]
+
+def same(a, b):
+    return a.keys() == b.keys() and all(
+        a[k] == b[k] or (isinstance(a[k], float) and math.isnan(a[k]) and math.isnan(b[k])) for k in a
+    )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    data = make_csv(args.rows, rng)
+    matcher = rule_matcher.compile_rules({'pipeline': 'COGS > Pipeline Transport', 'meter': 'Expenses > Metering'})
+
+    print_header(f"Columnar transform benchmark: {args.rows:,} rows ({len(data) / 1e6:.1f} MB)")
+
+    start = time.perf_counter()
+    row_ledger = run_rows(data, matcher)
+    row_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frames = run_columnar(data, matcher)
+    col_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    col_ledger = [record for frame in frames for record in columnar.to_records(frame)]
+    records_s = time.perf_counter() - start
+
+    assert len(row_ledger) == len(col_ledger), "Ledger sizes differ"
+    assert all(same(a, b) for a, b in zip(row_ledger, col_ledger)), "Columnar output diverged from the row path"
+
+    print(f"row path (parse+map+ledger):      {row_s:8.2f} s  {args.rows / row_s:12,.0f} rows/s")
+    print(f"columnar (parse+map+ledger):      {col_s:8.2f} s  {args.rows / col_s:12,.0f} rows/s  ({row_s / col_s:.1f}x)")
+    print(f"columnar + dict materialisation:  {col_s + records_s:8.2f} s  {args.rows / (col_s + records_s):12,.0f} rows/s  ({row_s / (col_s + records_s):.1f}x)")
+    print("outputs identical")
+
+if __name__ == "__main__":
+    main()
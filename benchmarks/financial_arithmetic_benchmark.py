@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Benchmark: float vs exact minor-unit (int64 tetri) arithmetic in calculate_metrics
+# Amounts are generated as whole tetri, so the exact totals are known; each mode is timed on
+# the same float columns and its result compared field by field with the exact decimals.
+# Usage: python benchmarks/financial_arithmetic_benchmark.py --sizes 1000000 10000000 --max-amount 500000 1000000000
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions', '5-financial-engine'))
+import metrics
+
+CATEGORIES = ['Assets', 'Liabilities', 'Equity', 'Revenue', 'Sales', 'Expenses', 'Operating Expenses', 'COGS',
+              'Marketing', 'Unmapped']
+SUB_CATEGORIES = ['Depreciation', 'Interest Expense', 'Income Tax', 'Social Gas Sales', 'Operating Expenses', '']
+
+def print_header(text):
+    print(f"\n{'='*50}\n{text}\n{'='*50}")
+
+def make_columns(rows, max_amount, seed):
+    rng = np.random.default_rng(seed)
+    tetri = rng.integers(-max_amount * 100, max_amount * 100, rows, dtype=np.int64)
+    categories = np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), rows)].tolist()
+    sub_categories = np.array(SUB_CATEGORIES, dtype=object)[rng.integers(0, len(SUB_CATEGORIES), rows)].tolist()
+    return tetri, categories, sub_categories
+
+def exact_metrics(tetri, categories, sub_categories):
+    """The metrics in whole tetri, summed with Python integers."""
+    totals = dict.fromkeys(list(metrics.BUCKETS) + [name for name, _ in metrics.DETAILS], 0)
+    for amount, category, sub_category in zip(tetri.tolist(), categories, sub_categories):
+        bucket = metrics.CATEGORY_BUCKETS.get(category)
+        if bucket:
+            totals[bucket] += amount
+        for name, marker in metrics.DETAILS:
+            if marker in sub_category:
+                totals[name] += amount
+    net_income = totals['revenue'] - totals['cogs'] - totals['expenses']
+    totals['equity'] += net_income
+    totals['net_income'] = net_income
+    totals['ebitda'] = net_income + totals['interest'] + totals['tax'] + totals['depreciation']
+    return totals
+
+def errors(result, exact):
+    """(fields off by at least a tetri, largest error in tetri)."""
+    diffs = [abs(round(result[name] * 100) - exact[name]) for name in exact]
+    return sum(1 for d in diffs if d), max(diffs)
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--max-amount', type=int, nargs='+', default=[500000, 1000000000], help='largest |amount| in GEL')
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    print_header("calculate_metrics: float vs minor-unit arithmetic")
+    print(f"{'rows':>12}{'max GEL':>15}{'mode':>7}{'sec':>8}{'fields off':>12}{'max err':>9}")
+    for rows in args.sizes:
+        for max_amount in args.max_amount:
+            tetri, categories, sub_categories = make_columns(rows, max_amount, args.seed)
+            exact = exact_metrics(tetri, categories, sub_categories)
+            amounts = (tetri / 100).tolist()
+            for mode in ('float', 'minor'):
+                result, sec = timed(metrics.calculate_metrics_columns, amounts, categories, sub_categories, arithmetic=mode)
+                off, worst = errors(result, exact)
+                print(f"{rows:>12,}{max_amount:>15,}{mode:>7}{sec:>8.2f}{off:>12}{worst:>9}")
+            del amounts, categories, sub_categories
+
+if __name__ == '__main__':
+    main()
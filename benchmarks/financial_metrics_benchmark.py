@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Benchmark: vectorized calculate_metrics vs the row-at-a-time loop it replaced
+# Transaction dicts (the API input) are built up to --max-dict-rows; larger sizes are run on
+# columns (the loop walking zipped columns), since 10M dicts do not fit in a function's memory.
+# Usage: python benchmarks/financial_metrics_benchmark.py --sizes 1000000 10000000
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions', '5-financial-engine'))
+import metrics
+
+CATEGORIES = ['Assets', 'Liabilities', 'Equity', 'Revenue', 'Sales', 'Expenses', 'Operating Expenses', 'COGS',
+              'Marketing', 'Unmapped']
+SUB_CATEGORIES = ['Depreciation', 'Interest Expense', 'Income Tax', 'Social Gas Sales', 'Operating Expenses', '']
+
+def print_header(text):
+    print(f"\n{'='*50}\n{text}\n{'='*50}")
+
+def loop_totals(rows):
+    """The former calculate_metrics loop over (amount, category, sub_category) rows."""
+    totals = dict.fromkeys(["assets", "liabilities", "equity", "revenue", "expenses", "cogs",
+                            "depreciation", "interest", "tax"], 0.0)
+    for amount, cat, sub_cat in rows:
+        try:
+            amt = float(amount)
+        except:
+            amt = 0.0
+        target_bucket = None
+        if cat in ["Assets", "Capital Expenditures"]: target_bucket = "assets"
+        elif cat in ["Liabilities"]: target_bucket = "liabilities"
+        elif cat in ["Equity", "Retained Earnings"]: target_bucket = "equity"
+        elif cat in ["Revenue", "Sales"]: target_bucket = "revenue"
+        elif cat in ["Expenses", "Operating Expenses", "Human Resources", "Marketing"]: target_bucket = "expenses"
+        elif cat in ["COGS"]: target_bucket = "cogs"
+        if target_bucket:
+            totals[target_bucket] += amt
+        if "Depreciation" in sub_cat: totals["depreciation"] += amt
+        if "Interest" in sub_cat: totals["interest"] += amt
+        if "Tax" in sub_cat: totals["tax"] += amt
+    return metrics._finish(totals)
+
+def make_columns(rows, seed):
+    rng = np.random.default_rng(seed)
+    amounts = np.round(rng.uniform(-5e5, 5e5, rows), 2).tolist()
+    categories = np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), rows)].tolist()
+    sub_categories = np.array(SUB_CATEGORIES, dtype=object)[rng.integers(0, len(SUB_CATEGORIES), rows)].tolist()
+    return amounts, categories, sub_categories
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--max-dict-rows', type=int, default=2000000, help='largest size run on transaction dicts')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    print_header("calculate_metrics: row loop vs vectorized")
+    print(f"{'rows':>12}{'input':>9}{'loop s':>9}{'vector s':>10}{'speedup':>9}  identical")
+    for rows in args.sizes:
+        amounts, categories, sub_categories = make_columns(rows, args.seed)
+        if rows <= args.max_dict_rows:
+            transactions = [{'amount': a, 'category': c, 'sub_category': s, 'entry_type': 'Debit'}
+                            for a, c, s in zip(amounts, categories, sub_categories)]
+            expected, loop_sec = timed(loop_totals, ((t.get('amount', 0), t.get('category', ''), t.get('sub_category', ''))
+                                                     for t in transactions))
+            result, vector_sec = timed(metrics.calculate_metrics, transactions)
+            kind = 'dicts'
+            del transactions
+        else:
+            expected, loop_sec = timed(loop_totals, zip(amounts, categories, sub_categories))
+            result, vector_sec = timed(metrics.calculate_metrics_columns, amounts, categories, sub_categories)
+            kind = 'columns'
+        print(f"{rows:>12,}{kind:>9}{loop_sec:>9.2f}{vector_sec:>10.2f}{loop_sec / vector_sec:>8.1f}x  {result == expected}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import itertools
+import random
+import threading
+import time
+
+# In-memory Firestore stand-in for benchmarks: collections, document refs and
+# write batches with an injectable per-commit latency (no network, no emulator).
+
+NO_DATA = {}  # shared placeholder when documents are not retained
+
+class FakeDocumentRef:
+    def __init__(self, store, collection, doc_id):
+        self._store = store
+        self.collection_name = collection
+        self.id = doc_id
+
+    def get(self):
+        return FakeSnapshot(self.id, self._store.read(self.collection_name, self.id))
+
+    def set(self, data, merge=False):
+        self._store.write(self.collection_name, self.id, data, merge)
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeCollection:
+    def __init__(self, store, name):
+        self._store = store
+        self._name = name
+
+    def document(self, doc_id=None):
+        if doc_id is None:
+            doc_id = f"auto-{next(self._store.auto_ids)}"
+        return FakeDocumentRef(self._store, self._name, doc_id)
+
+    def stream(self):
+        for doc_id, data in list(self._store.collections.get(self._name, {}).items()):
+            yield FakeSnapshot(doc_id, data)
+
+
+class FakeBatch:
+    def __init__(self, store):
+        self._store = store
+        self._ops = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._ops.append((doc_ref, data, merge))
+
+    def commit(self):
+        self._store.simulate_latency()
+        for doc_ref, data, merge in self._ops:
+            self._store.write(doc_ref.collection_name, doc_ref.id, data, merge)
+        self._store.commits += 1
+
+
+class InMemoryFirestore:
+    """
+    Client exposing the subset of google.cloud.firestore.Client that the
+    ingestion path uses. `latency_ms` (+/- `jitter_ms`) is slept on every
+    batch commit and document read to mimic the round trip. With
+    `retain_data=False` only document ids are kept, so million-row runs
+    measure the pipeline rather than the fake's own memory.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 0, retain_data: bool = True):
+        self.latency_ms = latency_ms
+        self.retain_data = retain_data
+        self.jitter_ms = jitter_ms
+        self.collections = {}
+        self.commits = 0
+        self.auto_ids = itertools.count()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def simulate_latency(self):
+        if self.latency_ms or self.jitter_ms:
+            with self._lock:
+                delay = self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+            time.sleep(max(0.0, delay) / 1000.0)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, refs):
+        self.simulate_latency()
+        return [FakeSnapshot(ref.id, self.read(ref.collection_name, ref.id)) for ref in refs]
+
+    def read(self, collection, doc_id):
+        with self._lock:
+            return self.collections.get(collection, {}).get(doc_id)
+
+    def write(self, collection, doc_id, data, merge=False):
+        with self._lock:
+            docs = self.collections.setdefault(collection, {})
+            if not self.retain_data:
+                docs[doc_id] = NO_DATA
+            elif merge and doc_id in docs:
+                docs[doc_id] = dict(docs[doc_id], **data)
+            else:
+                docs[doc_id] = dict(data)
+
+    def count(self, collection) -> int:
+        return len(self.collections.get(collection, {}))
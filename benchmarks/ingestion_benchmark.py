@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Benchmark suite: parse -> date normalization -> map_values (via the file's column plan) -> generate_ledger_entries_for_row -> store_data
+# on CSV/XLSX files shaped like `July SGG (1).csv`, against an in-memory Firestore.
+# Each (format, size) runs in a fresh process so its peak RSS is its own.
+# Usage: python benchmarks/ingestion_benchmark.py --sizes 10000 100000 1000000 --formats csv xlsx --latency-ms 20
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+INGESTION_DIR = os.path.join(BENCH_DIR, '..', 'functions', '8-data-ingestion')
+
+# Same columns as `July SGG (1).csv`
+HEADER = ['date', 'trans_no', 'Company', 'Amount_debit_curr', 'Debit']
+COMPANIES = ['SOCAR Georgia Gas', 'SOCAR Gas Export', 'TelavGas', 'SGG-003 Telavi Branch', 'Test Company']
+DEBIT_TEXTS = ['Social gas sales', 'Transport cost social', 'Pipeline maintenance', 'Office rent', 'Meter repair']
+
+STAGES = ['parse', 'dates', 'map_row', 'ledger', 'store_data']
+
+def print_header(text):
+    print(f"\n{'='*50}\n{text}\n{'='*50}")
+
+def make_rows(count, seed):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield [f"{rng.randint(1, 28):02d}.07.2024", 12345 + i, rng.choice(COMPANIES),
+               f"{rng.uniform(1, 50000):.2f}", f"{rng.choice(DEBIT_TEXTS)} {rng.randint(1, 400)}"]
+
+def write_csv(path, count, seed):
+    import csv
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(make_rows(count, seed))
+
+def write_xlsx(path, count, seed):
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('July SGG')
+    ws.append(HEADER)
+    for row in make_rows(count, seed):
+        ws.append(row)
+    wb.save(path)
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def run_case(fmt, rows, latency_ms, seed, chunk_rows):
+    """One (format, size) case; runs in its own process."""
+    sys.path.insert(0, BENCH_DIR)
+    sys.path.insert(0, INGESTION_DIR)
+    import firestore_fake
+    import main as ingestion
+
+    client = firestore_fake.InMemoryFirestore(latency_ms=latency_ms, retain_data=False, seed=seed)
+    ingestion.get_db = lambda: client
+    matcher = ingestion.rule_matcher.compile_rules({'pipeline': 'COGS > Pipeline Transport', 'meter': 'Expenses > Metering'})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"July SGG.{fmt}")
+        (write_csv if fmt == 'csv' else write_xlsx)(path, rows, seed)
+        filename = os.path.basename(path)
+        baseline_rss = peak_rss_mb()
+
+        # Stages run chunk by chunk (as in stream mode) and their times are summed,
+        # so memory stays bounded and each stage's cost is measured separately
+        elapsed = dict.fromkeys(STAGES, 0.0)
+        counts = dict.fromkeys(STAGES, 0)
+        writer = ingestion.bulk_writer.BulkWriter(client)
+        ids = ingestion.dedup.RecordIds(filename)
+
+        with open(path, 'rb') as f:
+            # Same reader as ingest_data: row tuples laid out by a cached column plan
+            plan, rows_iter, _ = ingestion.read_rows(f, filename)
+            dates = ingestion.date_normalizer_for(plan)
+            chunks = ingestion.iter_chunks(rows_iter, chunk_rows)
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                elapsed['parse'] += time.perf_counter() - start
+                if chunk is None:
+                    break
+
+                start = time.perf_counter()
+                chunk = list(ingestion.normalize_row_dates(plan, chunk, dates, batch_rows=len(chunk)))
+                elapsed['dates'] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                mapped = [ingestion.map_values(plan, r, matcher) for r in chunk]
+                elapsed['map_row'] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                ledger = [e for m in mapped for e in ingestion.generate_ledger_entries_for_row(m)]
+                elapsed['ledger'] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                ingestion.store_data(ledger, filename, writer=writer, ids=ids)
+                elapsed['store_data'] += time.perf_counter() - start
+
+                counts['parse'] += len(chunk)
+                counts['dates'] += len(chunk)
+                counts['map_row'] += len(chunk)
+                counts['ledger'] += len(chunk)
+                counts['store_data'] += len(ledger)
+
+            # Draining the last in-flight commits is part of storing
+            start = time.perf_counter()
+            writer.close()
+            elapsed['store_data'] += time.perf_counter() - start
+
+        result = {
+            'format': fmt,
+            'rows': rows,
+            'file_mb': round(os.path.getsize(path) / 1e6, 1),
+            'stages': {
+                name: {
+                    'sec': round(elapsed[name], 3),
+                    'rows_per_sec': round(counts[name] / elapsed[name], 1) if elapsed[name] > 0 else 0.0
+                } for name in STAGES
+            },
+            'baseline_rss_mb': round(baseline_rss, 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'date_stats': dates.stats(),
+            'documents': client.count('financial_transactions'),
+            'commits': writer.stats()['commits']
+        }
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--formats', nargs='+', choices=['csv', 'xlsx'], default=['csv', 'xlsx'])
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated latency per batch commit')
+    parser.add_argument('--chunk-rows', type=int, default=2000, help='raw rows per chunk (stream mode default)')
+    parser.add_argument('--seed', type=int, default=5)
+    parser.add_argument('--json', help='write results to this file for regression comparison')
+    args = parser.parse_args()
+
+    print_header(f"Ingestion benchmark (commit latency {args.latency_ms} ms)")
+    print(f"{'case':<14}{'stage':<12}{'sec':>9}{'rows/s':>13}")
+
+    results = []
+    for fmt in args.formats:
+        for rows in args.sizes:
+            # max_tasks_per_child=1: a fresh interpreter per case keeps peak RSS comparable
+            with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+                result = pool.submit(run_case, fmt, rows, args.latency_ms, args.seed, args.chunk_rows).result()
+            results.append(result)
+            case = f"{fmt} {rows:,}"
+            for name in STAGES:
+                s = result['stages'][name]
+                print(f"{case:<14}{name:<12}{s['sec']:>9.2f}{s['rows_per_sec']:>13,.0f}")
+                case = ''
+            print(f"{'':<14}peak RSS {result['peak_rss_mb']:.1f} MB (baseline {result['baseline_rss_mb']:.1f} MB), "
+                  f"{result['documents']:,} docs in {result['commits']:,} commits ({result['file_mb']} MB file)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+if __name__ == '__main__':
+    main()
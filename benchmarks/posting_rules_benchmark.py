@@ -0,0 +1,86 @@
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+
+# Benchmark: `process` of large batches - per-transaction if/elif posting with entry dicts
+# vs the compiled posting rules applied to the whole batch with a columnar response
+# Usage: python benchmarks/posting_rules_benchmark.py --sizes 100000 1000000
+
+ENGINE_DIR = os.path.join(os.path.dirname(__file__), '..', 'functions', '5-financial-engine')
+sys.path.insert(0, ENGINE_DIR)
+import ledger
+
+CATEGORIES = ['Revenue', 'Sales', 'Expenses', 'COGS', 'Operating Expenses', 'Assets', 'Capital Expenditures',
+              'Liabilities', 'Equity', 'Unmapped']
+SUB_CATEGORIES = ['Social Gas Sales', 'Depreciation', 'Operating Expenses', 'Current Assets', '']
+
+def print_header(text):
+    print(f"\n{'='*50}\n{text}\n{'='*50}")
+
+def branch_double_entry(txn):
+    """The former apply_double_entry: if/elif on category, a pair of new dicts per transaction."""
+    try:
+        amount = float(txn.get("amount", 0))
+    except (ValueError, TypeError):
+        amount = 0.0
+    category = txn.get("category", "Unknown")
+    entries = []
+    if category in ["Revenue", "Sales"]:
+        entries.append({"account": "Assets:Cash", "type": "Debit", "amount": amount})
+        entries.append({"account": "Revenue:Sales", "type": "Credit", "amount": amount})
+    elif category in ["Expenses", "COGS", "Operating Expenses"]:
+        entries.append({"account": "Expenses:General", "type": "Debit", "amount": amount})
+        entries.append({"account": "Assets:Cash", "type": "Credit", "amount": amount})
+    elif category in ["Assets", "Capital Expenditures"]:
+        entries.append({"account": "Assets:PPE", "type": "Debit", "amount": amount})
+        entries.append({"account": "Assets:Cash", "type": "Credit", "amount": amount})
+    else:
+        entries.append({"account": "Uncategorized", "type": "Debit", "amount": amount})
+        entries.append({"account": "Assets:Cash", "type": "Credit", "amount": amount})
+    return entries
+
+def load_engine_main():
+    spec = importlib.util.spec_from_file_location('financial_engine_main', os.path.join(ENGINE_DIR, 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def make_transactions(rows, rng):
+    return [{'amount': round(rng.uniform(1, 50000), 2), 'category': rng.choice(CATEGORIES),
+             'sub_category': rng.choice(SUB_CATEGORIES), 'company_id': 'SGG-001'} for _ in range(rows)]
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def main():
+    import flask
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--seed', type=int, default=4)
+    args = parser.parse_args()
+
+    engine = load_engine_main()
+    app = flask.Flask(__name__)
+    print_header("process: branch loop + entry dicts vs compiled rules + columnar")
+    print(f"{'rows':>10}{'loop s':>9}{'batch s':>9}{'entries MB':>12}{'columnar MB':>13}{'handler s':>11}")
+    for rows in args.sizes:
+        transactions = make_transactions(rows, random.Random(args.seed))
+        old, loop_sec = timed(lambda: json.dumps([e for t in transactions for e in branch_double_entry(t)]))
+        new, batch_sec = timed(lambda: json.dumps(ledger.post_batch(transactions)))
+
+        # The deployed handler end to end: JSON body in, columnar JSON out (opted into with 'format')
+        request_body = json.dumps({'action': 'process', 'transactions': transactions, 'format': 'columnar'})
+        with app.test_request_context(data=request_body, content_type='application/json'):
+            response, handler_sec = timed(lambda: engine.process_transaction(flask.request))
+        assert response.status_code == 200 and 'ledger' in response.get_json()
+        print(f"{rows:>10,}{loop_sec:>9.2f}{batch_sec:>9.2f}{len(old) / 1e6:>12.1f}{len(new) / 1e6:>13.1f}{handler_sec:>11.2f}")
+
+if __name__ == '__main__':
+    main()
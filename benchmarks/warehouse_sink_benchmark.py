@@ -0,0 +1,62 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Benchmark: warehouse sink throughput (buffer -> Parquet batch -> local load) by batch size
+# Usage: python benchmarks/warehouse_sink_benchmark.py --rows 1000000 --flush-rows 1000 10000 100000
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions', '8-data-ingestion'))
+import ledger_entries
+import warehouse_sink
+
+COMPANIES = ['SGG-001', 'SGG-002', 'SGG-003']
+SUB_CATEGORIES = [('Revenue', 'Social Gas Sales'), ('COGS', 'Cost of Social Gas'), ('Expenses', 'Operating Expenses'),
+                  ('Assets', 'Current Assets'), ('Liabilities', 'Current Liabilities')]
+
+def print_header(text):
+    print(f"\n{'='*50}\n{text}\n{'='*50}")
+
+def make_ledger(rows, rng):
+    """Two legs per mapped row, as generate_ledger_entries_for_row produces them."""
+    ledger = []
+    for i in range(rows // 2):
+        category, sub_category = rng.choice(SUB_CATEGORIES)
+        row = {'date': f"2024-07-{rng.randint(1, 28):02d}", 'company_id': rng.choice(COMPANIES),
+               'category': category, 'sub_category': sub_category, 'department': 'General',
+               'description': f"Entry {i}", 'amount_gel': round(rng.uniform(1, 50000), 2)}
+        ledger.append(ledger_entries.LedgerEntry(row, 'Debit', sub_category))
+        ledger.append(ledger_entries.LedgerEntry(row, 'Credit', 'Cash'))
+    return ledger
+
+def run(ledger, flush_rows, chunk_rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        sink = warehouse_sink.WarehouseSink(warehouse_sink.LocalParquetLoader(tmp), flush_rows=flush_rows, flush_sec=3600)
+        ids = [f"{i:024x}" for i in range(len(ledger))]
+        start = time.perf_counter()
+        for offset in range(0, len(ledger), chunk_rows):
+            sink.add(ledger[offset:offset + chunk_rows], ids[offset:offset + chunk_rows], 'july.csv')
+        stats = sink.close()
+        stats['total_sec'] = time.perf_counter() - start
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000, help='ledger entries')
+    parser.add_argument('--flush-rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--chunk-rows', type=int, default=4000, help='entries per store_data call (stream chunk)')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    ledger = make_ledger(args.rows, random.Random(args.seed))
+    print_header(f"Warehouse sink: {len(ledger):,} entries")
+    print(f"{'flush rows':>12}{'batches':>9}{'MB':>9}{'load s':>9}{'total s':>9}{'rows/s':>12}")
+    for flush_rows in args.flush_rows:
+        stats = run(ledger, flush_rows, args.chunk_rows)
+        print(f"{flush_rows:>12,}{stats['batches']:>9,}{stats['bytes_loaded'] / 1e6:>9.1f}{stats['load_sec']:>9.2f}"
+              f"{stats['total_sec']:>9.2f}{stats['rows_loaded'] / stats['total_sec']:>12,.0f}")
+
+if __name__ == '__main__':
+    main()
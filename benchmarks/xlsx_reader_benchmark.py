@@ -0,0 +1,82 @@
+import argparse
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Benchmark: full openpyxl workbook load vs the streaming read-only XLSX reader
+# Usage: python benchmarks/xlsx_reader_benchmark.py --rows 50000
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions', '8-data-ingestion'))
+import main as ingestion
+
+COMPANIES = ['SOCAR Georgia Gas', 'SOCAR Gas Export', 'TelavGas']
+DESCRIPTIONS = ['Social gas sales', 'Transport cost social', 'Pipeline maintenance', 'Office rent']
+GL_CODES = ['4001', '4100', '5100', '1200', '2100']
+
+def print_header(text):
+    print(f"\n{'='*50}\n{text}\n{'='*50}")
+
+def make_xlsx(rows, rng):
+    """Workbook shaped like an SGG ledger export: title block, then header on row 4."""
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('GL')
+    ws.append(['SOCAR Georgia Gas - General Ledger'])
+    ws.append(['Period: July 2024'])
+    ws.append([])
+    ws.append(['Date', 'trans_no', 'Company', 'GL Account', 'Description', 'Amount', 'Currency'])
+    for i in range(rows):
+        ws.append([f"{rng.randint(1, 28):02d}.07.2024", 100000 + i, rng.choice(COMPANIES), rng.choice(GL_CODES),
+                   rng.choice(DESCRIPTIONS), round(rng.uniform(1, 50000), 2), 'GEL'])
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+def read_full(data):
+    """Previous implementation: whole workbook object model in memory."""
+    import openpyxl
+    wb = openpyxl.load_workbook(io.BytesIO(data), data_only=True)
+    rows_iter = wb.active.iter_rows(values_only=True)
+    for _ in range(3):
+        next(rows_iter)
+    headers = [str(h) for h in next(rows_iter) if h is not None]
+    return sum(1 for row in rows_iter if dict(zip(headers, row)))
+
+def read_streaming(data):
+    reader = ingestion.iter_xlsx_records(io.BytesIO(data))
+    count = sum(1 for _ in reader)
+    return count, reader.stats()
+
+def measure(fn, *args):
+    """Timed run, then a separate traced run for peak memory (tracemalloc skews timings)."""
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    data = make_xlsx(args.rows, random.Random(args.seed))
+    print_header(f"XLSX reader benchmark: {args.rows:,} rows ({len(data) / 1e6:.1f} MB)")
+
+    full_rows, full_sec, full_peak = measure(read_full, data)
+    (stream_rows, stats), stream_sec, stream_peak = measure(read_streaming, data)
+    assert full_rows == stream_rows == args.rows, (full_rows, stream_rows)
+
+    print(f"full load_workbook:   {full_sec:7.2f} s  {args.rows / full_sec:10,.0f} rows/s  peak {full_peak / 1e6:7.1f} MB")
+    print(f"streaming read-only:  {stream_sec:7.2f} s  {args.rows / stream_sec:10,.0f} rows/s  peak {stream_peak / 1e6:7.1f} MB")
+    print(f"reader stats: {stats}")
+
+if __name__ == '__main__':
+    main()
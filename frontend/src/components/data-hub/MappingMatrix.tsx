@@ -10,7 +10,7 @@ import { cn } from '@/lib/utils';
 import * as XLSX from 'xlsx';
 import { toast } from 'sonner';
 import { db } from '@/lib/firebase';
-import { collection, doc, setDoc, onSnapshot } from 'firebase/firestore';
+import { collection, doc, setDoc, onSnapshot, increment } from 'firebase/firestore';
 import { useEffect } from 'react';
 
 // Mock Data (Initial State)
@@ -67,6 +67,11 @@ const MappingMatrix = () => {
                 })
             );
             await Promise.all(promises);
+            // Bump the version marker so warm ingestion instances reload their rule cache
+            await setDoc(doc(db, 'system_config', 'mapping_rules_version'), {
+                version: increment(1),
+                updatedAt: new Date().toISOString()
+            }, { merge: true });
             toast.success("Mapping rules synchronized with backend");
         } catch (error) {
             console.error("Save error", error);
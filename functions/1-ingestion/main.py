@@ -1,8 +1,10 @@
 import os
+import io
 import json
 import logging
 from firebase_functions import storage_fn, options
 from google.cloud import pubsub_v1, storage
+import blob_stream
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -11,6 +13,8 @@ logger = logging.getLogger(__name__)
 # Initialize
 PROJECT_ID = os.environ.get("GCP_PROJECT")
 TOPIC_ID = "files-to-process"
+# Characters read from an upload to tell JSON from CSV
+PEEK_CHARS = 4096
 
 # Lazy Globals
 publisher = None
@@ -23,6 +27,18 @@ def get_publisher_topic():
         topic_path = publisher.topic_path(PROJECT_ID, TOPIC_ID)
     return publisher, topic_path
 
+def read_json_payload(text_stream):
+    """
+    The whole payload if the stream holds JSON, else None. Only the leading
+    characters are read to decide, so CSV uploads are not downloaded in full.
+    """
+    head = text_stream.read(PEEK_CHARS)
+    while head and head.isspace():
+        head = text_stream.read(PEEK_CHARS)
+    if not head.lstrip().startswith(('{', '[')):
+        return None
+    return head + text_stream.read()
+
 def heal_and_normalize_data(raw_text):
     """
     Advanced Feature: Uses AI to fix CSV formatting errors, remove currency symbols, 
@@ -59,14 +75,15 @@ def process_file_upload(event: storage_fn.CloudEvent[storage_fn.StorageObjectDat
 
     logger.info(f"[INGESTION] Processing {file_name} from bucket {bucket_name}...")
     
-    # 1. Download File
+    # 1. Stream File (ranged reads; only JSON payloads are read in full)
     storage_client = storage.Client()
     blob = storage_client.bucket(bucket_name).blob(file_name)
-    content = blob.download_as_string().decode("utf-8")
+    with io.TextIOWrapper(blob_stream.open_blob(blob), encoding="utf-8") as text_stream:
+        content = read_json_payload(text_stream)
 
     # 2. AI Transformation (The Advanced Part)
     logger.info("[INGESTION] Running Self-Healing AI...")
-    clean_data = heal_and_normalize_data(content)
+    clean_data = heal_and_normalize_data(content) if content is not None else None
     
     if clean_data:
         # 3. Publish CLEAN data to the pipeline
@@ -5,6 +5,7 @@ import csv
 import io
 from firebase_functions import pubsub_fn, options
 from google.cloud import firestore
+import bulk_writer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -75,15 +76,14 @@ def transform_and_load_data(event: pubsub_fn.CloudEvent[pubsub_fn.MessagePublish
         # 2. Load to Firestore
         if transformed_data:
             db_client = get_db()
-            batch = db_client.batch()
             collection_ref = db_client.collection("financial_records")
             
-            for item in transformed_data:
-                doc_ref = collection_ref.document()
-                batch.set(doc_ref, item)
+            with bulk_writer.BulkWriter(db_client) as writer:
+                for item in transformed_data:
+                    doc_ref = collection_ref.document()
+                    writer.set(doc_ref, item)
             
-            batch.commit()
-            logger.info(f"[TRANSFORMATION] Successfully loaded {len(transformed_data)} records to Firestore.")
+            logger.info(f"[TRANSFORMATION] Successfully loaded {len(transformed_data)} records to Firestore: {writer.stats()}")
         else:
             logger.info("[TRANSFORMATION] No data to load.")
 
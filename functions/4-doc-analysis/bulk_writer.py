@@ -0,0 +1,178 @@
+# Bulk Writer - concurrent Firestore batch commits with retry and throughput stats
+
+import logging
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Firestore allows 500 writes per batch; stay below for field transforms
+BATCH_SIZE = 400
+WRITE_CONCURRENCY = int(os.environ.get('FIRESTORE_WRITE_CONCURRENCY', '4'))
+MAX_RETRIES = int(os.environ.get('FIRESTORE_WRITE_MAX_RETRIES', '5'))
+BASE_BACKOFF_SEC = 0.25
+MAX_BACKOFF_SEC = 8.0
+
+
+def is_retryable(error: Exception) -> bool:
+    """Contention (ABORTED), quota (RESOURCE_EXHAUSTED) and transient transport errors."""
+    from google.api_core import exceptions
+    return isinstance(error, (
+        exceptions.Aborted,
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+        exceptions.DeadlineExceeded,
+    ))
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class BulkWriter:
+    """
+    Buffers `set` operations into batches and keeps up to `max_in_flight`
+    batch commits running at once. Callers block only when that many commits
+    are outstanding, so memory stays bounded while round trips overlap.
+
+    Usage:
+        with BulkWriter(client) as writer:
+            for doc_ref, data in docs:
+                writer.set(doc_ref, data)
+        writer.stats()
+    """
+
+    def __init__(self, client, batch_size: int = BATCH_SIZE, max_in_flight: int = WRITE_CONCURRENCY,
+                 max_retries: int = MAX_RETRIES, base_backoff_sec: float = BASE_BACKOFF_SEC, sleep=time.sleep):
+        self._client = client
+        self._batch_size = batch_size
+        self._max_retries = max_retries
+        self._base_backoff_sec = base_backoff_sec
+        self._sleep = sleep
+
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='bulk-writer')
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._stats_lock = threading.Lock()
+        self._pending = []
+        self._futures = []
+        self._error = None
+        self._closed = False
+
+        self._started_at = time.perf_counter()
+        self._finished_at = None
+        self._latencies = []
+        self.rows_written = 0
+        self.commits = 0
+        self.retries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(raise_errors=exc_type is None)
+        return False
+
+    def set(self, doc_ref, data: dict):
+        self._pending.append((doc_ref, data))
+        if len(self._pending) >= self._batch_size:
+            self._submit()
+
+    def _submit(self):
+        ops, self._pending = self._pending, []
+        if not ops:
+            return
+        self._raise_if_failed()
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._commit_with_retry, ops)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _commit_with_retry(self, ops):
+        attempt = 0
+        while True:
+            # A fresh batch per attempt; explicit document refs make replays idempotent
+            batch = self._client.batch()
+            for doc_ref, data in ops:
+                batch.set(doc_ref, data)
+
+            start = time.perf_counter()
+            try:
+                batch.commit()
+            except Exception as e:
+                if attempt >= self._max_retries or not is_retryable(e):
+                    with self._stats_lock:
+                        if self._error is None:
+                            self._error = e
+                    logger.error(f"Bulk write failed after {attempt} retries: {e}")
+                    raise
+                attempt += 1
+                with self._stats_lock:
+                    self.retries += 1
+                backoff = min(MAX_BACKOFF_SEC, self._base_backoff_sec * (2 ** (attempt - 1)))
+                self._sleep(backoff * (0.5 + random.random() / 2))
+                continue
+
+            latency = time.perf_counter() - start
+            with self._stats_lock:
+                self._latencies.append(latency)
+                self.rows_written += len(ops)
+                self.commits += 1
+            return len(ops)
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    def flush(self):
+        """Submits the partial batch and waits for every outstanding commit."""
+        self._submit()
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.exception()
+        self._raise_if_failed()
+
+    def close(self, raise_errors: bool = True):
+        if self._closed:
+            return
+        try:
+            if raise_errors:
+                self.flush()
+            else:
+                self._pending = []
+                for future in self._futures:
+                    future.exception()
+        finally:
+            self._closed = True
+            self._finished_at = time.perf_counter()
+            self._pool.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            rows, commits, retries = self.rows_written, self.commits, self.retries
+        elapsed = (self._finished_at or time.perf_counter()) - self._started_at
+        return {
+            'rows_written': rows,
+            'commits': commits,
+            'retries': retries,
+            'elapsed_sec': round(elapsed, 3),
+            'rows_per_sec': round(rows / elapsed, 1) if elapsed > 0 else 0.0,
+            'commit_latency_ms': {
+                'p50': round(percentile(latencies, 50) * 1000, 1),
+                'p95': round(percentile(latencies, 95) * 1000, 1),
+                'p99': round(percentile(latencies, 99) * 1000, 1),
+                'max': round(latencies[-1] * 1000, 1) if latencies else 0.0
+            }
+        }
@@ -1,6 +1,7 @@
 from firebase_functions import storage_fn
 from firebase_admin import initialize_app, firestore
 import google.cloud.firestore as firestore_lib
+import bulk_writer
 
 # Initialize Firebase Admin
 initialize_app()
@@ -29,27 +30,21 @@ def process_document_upload(event: storage_fn.CloudEvent[storage_fn.StorageObjec
     chunks = [p for p in full_text.split('\n\n') if len(p) > 5]
 
     db = get_db()
-    batch = db.batch()
     
     print(f"[RAG] Vectorizing {len(chunks)} chunks from {file_name}...")
 
     # 3. Vectorize & Index (STUBBED)
-    for i, chunk in enumerate(chunks):
-        # STUB: Dummy 768-dim vector
-        vector = [0.0] * 768 # Placeholder
-        
-        doc_ref = db.collection("knowledge_base").document()
-        batch.set(doc_ref, {
-            "content": chunk,
-            "embedding": vector, 
-            "source_file": file_name,
-            "created_at": firestore_lib.SERVER_TIMESTAMP
-        })
-        
-        # Commit batches
-        if (i + 1) % 400 == 0:
-            batch.commit()
-            batch = db.batch()
+    with bulk_writer.BulkWriter(db) as writer:
+        for chunk in chunks:
+            # STUB: Dummy 768-dim vector
+            vector = [0.0] * 768 # Placeholder
             
-    batch.commit()
-    print("[RAG] Document indexed successfully.")
+            doc_ref = db.collection("knowledge_base").document()
+            writer.set(doc_ref, {
+                "content": chunk,
+                "embedding": vector, 
+                "source_file": file_name,
+                "created_at": firestore_lib.SERVER_TIMESTAMP
+            })
+            
+    print(f"[RAG] Document indexed successfully. {writer.stats()}")
@@ -0,0 +1,124 @@
+# Context Metrics Cache - warm-instance LRU of metrics per (company_id, period, data version)
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_CACHE_SIZE = int(os.environ.get('CONTEXT_METRICS_CACHE_SIZE', '512'))
+# Within this window a cached context is served without re-reading its data version
+CONTEXT_CACHE_TTL_SEC = float(os.environ.get('CONTEXT_METRICS_CACHE_TTL_SEC', '30'))
+
+
+class ContextMetricsCache:
+    """
+    Metrics of a (company_id, period) context for `metrics` requests that
+    carry no transactions (the AI query's Truth Engine call).
+
+    A lookup reads the context's `metric_aggregates` document, whose
+    `version` every ingestion bumps; the result is cached under
+    (company_id, period, version), so new data misses and unchanged data
+    hits. Contexts ingested before aggregates existed have no document
+    (version 0) and fall back to `query_columns`, an indexed query of the
+    period's Debit legs. Within the TTL a cached context is answered from
+    memory without any read; the least recently used entries are evicted
+    beyond `max_entries`.
+    """
+
+    def __init__(self, read_aggregate, query_columns, max_entries: int = CONTEXT_CACHE_SIZE,
+                 ttl_sec: float = CONTEXT_CACHE_TTL_SEC, clock=time.monotonic):
+        self._read_aggregate = read_aggregate
+        self._query_columns = query_columns
+        self._max_entries = max_entries
+        self._ttl_sec = ttl_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (company_id, period, version) -> result
+        self._checked = {}  # (company_id, period) -> (version, checked_at)
+
+        self.hits = 0
+        self.misses = 0
+        self.version_checks = 0
+        self.queries = 0
+        self.evictions = 0
+
+    def _cached(self, key):
+        """Entry under `key` marked most recently used, or None. Call with the lock held."""
+        result = self._entries.get(key)
+        if result is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return result
+
+    def get(self, company_id: str, period: str) -> dict:
+        """{'metrics', 'source', 'rows', 'data_version', 'cache'} of the context."""
+        context = (company_id, period)
+        with self._lock:
+            checked = self._checked.get(context)
+            if checked is not None and self._clock() - checked[1] < self._ttl_sec:
+                result = self._cached((*context, checked[0]))
+                if result is not None:
+                    return dict(result, cache='hit')
+
+        aggregate = self._read_aggregate(company_id, period)
+        version = aggregate.get('version', 0)
+        key = (*context, version)
+        with self._lock:
+            self.version_checks += 1
+            previous = self._checked.get(context)
+            if previous is not None and previous[0] != version:
+                # Superseded by newer data: no lookup will ask for it again
+                self._entries.pop((*context, previous[0]), None)
+            self._checked[context] = (version, self._clock())
+            result = self._cached(key)
+            if result is not None:
+                return dict(result, cache='hit')
+            self.misses += 1
+
+        if aggregate:
+            result = {
+                'metrics': metrics.calculate_metrics_from_totals(aggregate.get('totals', {})),
+                'source': 'aggregate',
+                'rows': aggregate.get('rows', 0)
+            }
+        else:
+            amounts, categories, sub_categories = self._query_columns(company_id, period)
+            with self._lock:
+                self.queries += 1
+            result = {
+                'metrics': metrics.calculate_metrics_columns(amounts, categories, sub_categories),
+                'source': 'query',
+                'rows': len(amounts)
+            }
+        result['data_version'] = version
+
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                (old_company, old_period, old_version), _ = self._entries.popitem(last=False)
+                self.evictions += 1
+                if self._checked.get((old_company, old_period), (None,))[0] == old_version:
+                    del self._checked[(old_company, old_period)]
+        logger.info(f"Context metrics loaded for {company_id} {period} from the {result['source']} (version {version})")
+        return dict(result, cache='miss')
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._checked.clear()
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'version_checks': self.version_checks,
+            'queries': self.queries,
+            'evictions': self.evictions,
+            'entries': len(self._entries)
+        }
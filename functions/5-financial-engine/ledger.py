@@ -1,50 +1,38 @@
-def apply_double_entry(txn):
+import money
+import posting_rules
+
+
+def apply_double_entry(txn, arithmetic=None, rules=None):
     """
     Determines the double-entry impact of a single transaction.
     Returns a list of ledger entries (dicts).
+    Accounts come from the posting rules (posting_rules.json by default),
+    by category and sub_category. In the 'minor' arithmetic mode the amount
+    is read exactly to the tetri/cent (Decimal, half-to-even) before it is posted.
     """
-    try:
-        amount = float(txn.get("amount", 0))
-    except (ValueError, TypeError):
-        amount = 0.0
-        
-    category = txn.get("category", "Unknown")
-    
-    # Simple Double-Entry Rules
-    # Asset Increase -> Debit
-    # Asset Decrease -> Credit
-    # Liab/Equity Increase -> Credit
-    # Liab/Equity Decrease -> Debit
-    # Expense Increase -> Debit
-    # Revenue Increase -> Credit
+    if money.arithmetic_mode(arithmetic) == money.MINOR:
+        amount = money.to_major(money.to_minor(txn.get("amount", 0)))
+    else:
+        try:
+            amount = float(txn.get("amount", 0))
+        except (ValueError, TypeError):
+            amount = 0.0
 
-    entries = []
-    
-    # Revenue / Sales
-    if category in ["Revenue", "Sales"]:
-        # Cash (Asset) increases [Debit]
-        entries.append({"account": "Assets:Cash", "type": "Debit", "amount": amount})
-        # Revenue (Equity-like) increases [Credit]
-        entries.append({"account": "Revenue:Sales", "type": "Credit", "amount": amount})
+    rules = rules or posting_rules.get_rules()
+    # Debit the first account, credit the second (e.g. Revenue: Assets:Cash / Revenue:Sales)
+    debit_account, credit_account = rules.accounts_for(txn.get("category", "Unknown"), txn.get("sub_category"))
+    return [
+        {"account": debit_account, "type": "Debit", "amount": amount},
+        {"account": credit_account, "type": "Credit", "amount": amount}
+    ]
 
-    # Expenses / COGS
-    elif category in ["Expenses", "COGS", "Operating Expenses"]:
-        # Expense increases [Debit]
-        entries.append({"account": "Expenses:General", "type": "Debit", "amount": amount})
-        # Cash (Asset) decreases [Credit]
-        entries.append({"account": "Assets:Cash", "type": "Credit", "amount": amount})
 
-    # Assets (Purchase of Equipment, etc.)
-    elif category in ["Assets", "Capital Expenditures"]:
-        # PPE (Asset) increases [Debit]
-        entries.append({"account": "Assets:PPE", "type": "Debit", "amount": amount})
-        # Cash (Asset) decreases [Credit]
-        entries.append({"account": "Assets:Cash", "type": "Credit", "amount": amount})
-        
-    else:
-        # Default / Fallback handling for unknown categories
-        # We treat it as a generic expense to be safe, or log it.
-        entries.append({"account": "Uncategorized", "type": "Debit", "amount": amount})
-        entries.append({"account": "Assets:Cash", "type": "Credit", "amount": amount})
-
-    return entries
+def post_batch(transactions, arithmetic=None, rules=None):
+    """
+    apply_double_entry for a whole batch at once, in columnar form:
+    {'accounts': [...], 'debit': [...], 'credit': [...], 'amount': [...]}
+    with one debit/credit account index and amount per transaction
+    (posting_rules.to_entries expands it into entry dicts).
+    """
+    rules = rules or posting_rules.get_rules()
+    return rules.post(transactions, arithmetic=arithmetic)
@@ -4,11 +4,63 @@ from firebase_functions import https_fn, options
 import metrics
 import ledger
 import reconciliation
+import context_metrics
+import posting_rules
 
 # Initialize Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Running totals per (company_id, period), maintained by 8-data-ingestion (metric_aggregates.py)
+AGGREGATES_COLLECTION = 'metric_aggregates'
+# Ledger entries written by 8-data-ingestion (queried for contexts without an aggregate)
+TRANSACTIONS_COLLECTION = 'financial_transactions'
+
+# Lazy Global for Firestore
+db = None
+
+def get_db():
+    global db
+    if db is None:
+        from google.cloud import firestore
+        db = firestore.Client()
+    return db
+
+def load_aggregate(company_id: str, period: str) -> dict:
+    """
+    The `metric_aggregates/{company_id}_{period}` document: one read,
+    however many transactions the period holds. Empty if nothing was ingested.
+    """
+    doc = get_db().collection(AGGREGATES_COLLECTION).document(f"{company_id}_{period}").get()
+    return (doc.to_dict() or {}) if doc.exists else {}
+
+def query_period_columns(company_id: str, period: str):
+    """
+    (amounts, categories, sub_categories) of a context's mapped rows, read
+    through the (company_id, entry_type, date) index: one Debit leg per row,
+    ISO dates of the YYYY-MM period, only the three fields metrics need.
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = (
+        get_db().collection(TRANSACTIONS_COLLECTION)
+        .where(filter=FieldFilter('company_id', '==', company_id))
+        .where(filter=FieldFilter('entry_type', '==', 'Debit'))
+        .where(filter=FieldFilter('date', '>=', period))
+        .where(filter=FieldFilter('date', '<', period + '\uf8ff'))
+        .select(['amount_gel', 'category', 'sub_category'])
+    )
+    amounts, categories, sub_categories = [], [], []
+    for doc in query.stream():
+        row = doc.to_dict()
+        amounts.append(row.get('amount_gel', 0))
+        categories.append(row.get('category', ''))
+        sub_categories.append(row.get('sub_category') or '')
+    return amounts, categories, sub_categories
+
+# Warm-instance cache of context metrics (LRU keyed by company, period and data version)
+context_metrics_cache = context_metrics.ContextMetricsCache(load_aggregate, query_period_columns)
+
 @https_fn.on_request(
     cors=options.CorsOptions(cors_origins="*", cors_methods=["POST", "OPTIONS"]),
     timeout_sec=60,
@@ -24,7 +76,8 @@ def process_transaction(request: https_fn.Request) -> https_fn.Response:
     """
     try:
         data = request.get_json(silent=True) or {}
-        action = data.get('action')
+        # A bare JSON list is a batch of transactions to process
+        action = data.get('action') if isinstance(data, dict) else 'process'
         
         logger.info(f"Financial Engine Request: {action}")
 
@@ -32,16 +85,19 @@ def process_transaction(request: https_fn.Request) -> https_fn.Response:
         if action == 'metrics':
             # Expecting a list of transactions in 'data' or 'transactions'
             transactions = data.get('data', [])
-            if not transactions:
-                # If checking context (company/period), we might fetch from Firestore here
-                # BUT per architecture, Engine should receive data. 
-                # Retaining old behavior of "fetch if empty" is dangerous but might be needed for current Frontend.
-                # For now, we return empty structure if no data provided.
-                logger.warning("No transactions provided for metrics calculation.")
-                pass 
-
-            # Calculate Core Metrics
-            financial_totals = metrics.calculate_metrics(transactions)
+            context = None
+            if not transactions and data.get('company_id') and data.get('period'):
+                # Context only (company/period): pre-aggregated totals or an indexed query, cached per data version
+                loaded = context_metrics_cache.get(data['company_id'], data['period'])
+                financial_totals = loaded.pop('metrics')
+                context = {"company_id": data['company_id'], "period": data['period'], **loaded}
+                logger.info(f"Context metrics cache: {context_metrics_cache.stats()}")
+            else:
+                if not transactions:
+                    logger.warning("No transactions provided for metrics calculation.")
+
+                # Calculate Core Metrics
+                financial_totals = metrics.calculate_metrics(transactions)
             
             # Run Reconciliation
             recon_status = reconciliation.reconcile(
@@ -50,35 +106,44 @@ def process_transaction(request: https_fn.Request) -> https_fn.Response:
                 financial_totals["equity"]
             )
             
+            body = {
+                "status": "success",
+                "metrics": financial_totals,
+                "reconciliation": recon_status
+            }
+            if context is not None:
+                body["context"] = context
             return https_fn.Response(
-                json.dumps({
-                    "status": "success",
-                    "metrics": financial_totals,
-                    "reconciliation": recon_status
-                }),
+                json.dumps(body),
                 status=200,
                 headers={"Content-Type": "application/json"}
             )
 
         # 2. Transaction Processing (Ledger Entry)
         elif action == 'process' or not action:
-            # Single transaction or list
-            txns = data if isinstance(data, list) else [data]
-            all_entries = []
-            
-            for txn in txns:
-                entries = ledger.apply_double_entry(txn)
-                all_entries.extend(entries)
-                
-            # In a real system, we would batch write 'all_entries' to Firestore 'ledger' collection here.
+            # Single transaction, a list, or {'transactions': [...]}
+            if isinstance(data, list):
+                txns = data
+            elif isinstance(data.get('transactions'), list):
+                txns = data['transactions']
+            else:
+                txns = [data]
+
+            # The whole batch is posted at once, in columnar form (one debit/credit account index
+            # and amount per transaction); callers get entry dicts unless they opt into
+            # 'format': 'columnar', which skips building two dicts per transaction
+            posted = ledger.post_batch(txns)
+            body = {"status": "success", "processed_count": len(txns)}
+            if isinstance(data, dict) and data.get('format') == 'columnar':
+                body["ledger"] = posted
+            else:
+                body["ledger_entries"] = posting_rules.to_entries(posted)
+
+            # In a real system, we would batch write the entries to Firestore 'ledger' collection here.
             # For now, we return them to the caller or validation.
-            
+
             return https_fn.Response(
-                json.dumps({
-                    "status": "success",
-                    "processed_count": len(txns),
-                    "ledger_entries": all_entries
-                }),
+                json.dumps(body),
                 status=200,
                 headers={"Content-Type": "application/json"}
             )
@@ -1,63 +1,118 @@
-def calculate_metrics(transactions):
+import numpy as np
+
+import money
+
+# Aggregate bucket of each category
+BUCKETS = ("assets", "liabilities", "equity", "revenue", "expenses", "cogs")
+CATEGORY_BUCKETS = {
+    "Assets": "assets", "Capital Expenditures": "assets",
+    "Liabilities": "liabilities",
+    "Equity": "equity", "Retained Earnings": "equity",
+    "Revenue": "revenue", "Sales": "revenue",
+    "Expenses": "expenses", "Operating Expenses": "expenses", "Human Resources": "expenses", "Marketing": "expenses",
+    "COGS": "cogs",
+}
+# Detailed breakdown: total of the rows whose sub_category contains the marker
+DETAILS = (("depreciation", "Depreciation"), ("interest", "Interest"), ("tax", "Tax"))
+
+_NO_BUCKET = len(BUCKETS)
+_BUCKET_CODES = {category: BUCKETS.index(bucket) for category, bucket in CATEGORY_BUCKETS.items()}
+
+
+def _bucket_code(category) -> int:
+    try:
+        return _BUCKET_CODES.get(category, _NO_BUCKET)
+    except TypeError:  # unhashable (a JSON list): in no bucket, as before
+        return _NO_BUCKET
+
+
+def _detail_flags(sub_category) -> int:
+    """Bit i set when DETAILS[i]'s marker is in `sub_category` (raises for None, like `in` does)."""
+    return sum(1 << i for i, (_, marker) in enumerate(DETAILS) if marker in sub_category)
+
+
+def _encode(values, classify, dtype) -> np.ndarray:
+    """classify() of each value as an integer array, evaluated once per distinct value."""
+    try:
+        distinct = dict.fromkeys(values)
+    except TypeError:  # unhashable values: classify row by row
+        return np.fromiter((classify(v) for v in values), dtype=dtype, count=len(values))
+    codes = {value: classify(value) for value in distinct}
+    return np.fromiter(map(codes.__getitem__, values), dtype=dtype, count=len(values))
+
+
+def _sums(weights: np.ndarray, codes: np.ndarray, bins: int) -> np.ndarray:
+    # bincount adds each row into its bin in input order: the same float additions,
+    # in the same order, as a running total per bucket (np.sum's pairwise order would differ)
+    return np.bincount(codes, weights=weights, minlength=bins)
+
+
+def calculate_metrics_columns(amounts, categories, sub_categories, arithmetic=None):
+    """
+    calculate_metrics over columns (sequences or arrays of equal length).
+    Categories and sub-category markers are encoded as integer codes, once
+    per distinct value, and every bucket is summed with one bincount.
+    In the 'minor' arithmetic mode amounts are int64 minor units, summed
+    exactly with np.add.at, and turned into decimals only in the result.
     """
-    Aggregates financial transactions into core metrics using pure Python.
+    minor = money.arithmetic_mode(arithmetic) == money.MINOR
+    amounts = money.to_minor_array(amounts) if minor else money.to_float_array(amounts)
+    sums = money.minor_sums if minor else _sums
+    bucket_codes = _encode(categories, _bucket_code, np.intp)
+    flags = _encode(sub_categories, _detail_flags, np.intp)
+
+    bucket_sums = sums(amounts, bucket_codes, _NO_BUCKET + 1).tolist()
+    totals = {bucket: bucket_sums[i] for i, bucket in enumerate(BUCKETS)}
+    for i, (name, _) in enumerate(DETAILS):
+        totals[name] = sums(amounts, (flags >> i) & 1, 2).tolist()[1]
+    return _finish_minor(totals) if minor else _finish(totals)
+
+
+def calculate_metrics(transactions, arithmetic=None):
+    """
+    Aggregates financial transactions into core metrics, vectorized with NumPy.
     Input: List of transaction dicts.
     Output: Dict of totals (Assets, Liabilities, Equity, Revenue, Expenses, COGS, NetIncome, EBITDA).
+    `arithmetic`: 'float' or 'minor' (see money.py); the deployment default when None.
+    """
+    transactions = transactions if isinstance(transactions, list) else list(transactions)
+    return calculate_metrics_columns(
+        [t.get("amount", 0) for t in transactions],
+        [t.get("category", "") for t in transactions],
+        [t.get("sub_category", "") for t in transactions],
+        arithmetic=arithmetic
+    )
+
+
+def calculate_metrics_from_totals(totals, arithmetic=None):
     """
-    totals = {
-        "assets": 0.0,
-        "liabilities": 0.0,
-        "equity": 0.0,
-        "revenue": 0.0,
-        "expenses": 0.0,
-        "cogs": 0.0,
-        "depreciation": 0.0,
-        "interest": 0.0,
-        "tax": 0.0
-    }
-
-    # Iterate once (O(N))
-    for t in transactions:
-        try:
-            amt = float(t.get("amount", 0))
-        except:
-            amt = 0.0
-            
-        cat = t.get("category", "")
-        sub_cat = t.get("sub_category", "")
-        entry_type = t.get("entry_type", "Debit") # Default to Debit if missing
-
-        # Map Aggregates
-        target_bucket = None
-        if cat in ["Assets", "Capital Expenditures"]: target_bucket = "assets"
-        elif cat in ["Liabilities"]: target_bucket = "liabilities"
-        elif cat in ["Equity", "Retained Earnings"]: target_bucket = "equity"
-        elif cat in ["Revenue", "Sales"]: target_bucket = "revenue"
-        elif cat in ["Expenses", "Operating Expenses", "Human Resources", "Marketing"]: target_bucket = "expenses"
-        elif cat in ["COGS"]: target_bucket = "cogs"
-        
-        if target_bucket:
-            totals[target_bucket] += amt
-
-        # Detailed breakdown
-        if "Depreciation" in sub_cat: totals["depreciation"] += amt
-        if "Interest" in sub_cat: totals["interest"] += amt
-        if "Tax" in sub_cat: totals["tax"] += amt
+    Metrics from totals already summed per bucket (the `totals` of a
+    `metric_aggregates` document maintained by ingestion); missing ones are 0.
+    """
+    names = BUCKETS + tuple(name for name, _ in DETAILS)
+    if money.arithmetic_mode(arithmetic) == money.MINOR:
+        return _finish_minor({name: money.to_minor(totals.get(name) or 0) for name in names})
+    return _finish({name: float(totals.get(name) or 0.0) for name in names})
+
+
+def _finish_minor(totals):
+    # Integer minor units: the same derivation with nothing to round, then decimals for the API
+    return {name: money.to_major(value) for name, value in _finish(totals).items()}
+
 
+def _finish(totals):
     # Derived Metrics
-    gross_margin = totals["revenue"] - totals["cogs"]
     net_income = totals["revenue"] - totals["cogs"] - totals["expenses"]
     ebitda = net_income + totals["interest"] + totals["tax"] + totals["depreciation"]
-    
+
     # Financial Engine needs to balance.
     totals["equity"] += net_income
-    
+
     # Final rounding
     for k in totals:
         totals[k] = round(totals[k], 2)
-        
+
     totals["net_income"] = round(net_income, 2)
     totals["ebitda"] = round(ebitda, 2)
 
-    
     return totals
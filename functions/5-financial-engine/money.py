@@ -0,0 +1,127 @@
+# Money - exact minor-unit (tetri/cents) amounts for the engine's integer arithmetic mode
+
+import math
+import os
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+
+import numpy as np
+
+# 'float': amounts are float64, summed and rounded to 2 places at the end (the original arithmetic)
+# 'minor': amounts are int64 minor units, summed exactly; decimals appear only in responses
+FLOAT = 'float'
+MINOR = 'minor'
+ARITHMETIC_MODES = (FLOAT, MINOR)
+DEFAULT_ARITHMETIC = os.environ.get('FINANCIAL_ENGINE_ARITHMETIC', FLOAT)
+if DEFAULT_ARITHMETIC not in ARITHMETIC_MODES:
+    raise ValueError(f"FINANCIAL_ENGINE_ARITHMETIC must be one of {ARITHMETIC_MODES}, not {DEFAULT_ARITHMETIC!r}")
+
+# Minor units per unit (100 tetri to the lari, 100 cents to the dollar)
+MINOR_PER_UNIT = 100
+_QUANTUM = Decimal(1).scaleb(-2)
+# Largest |amount| in float64 whose cent is still resolved exactly by rint(amount * 100)
+_FLOAT_EXACT_LIMIT = 2 ** 53 / MINOR_PER_UNIT / 2
+# Relative distance from a whole cent (a few ulps) still taken as that cent
+_CENT_TOLERANCE = 1e-15
+
+
+def arithmetic_mode(arithmetic=None) -> str:
+    """`arithmetic`, or the deployment default when None; raises ValueError for unknown modes."""
+    mode = DEFAULT_ARITHMETIC if arithmetic is None else arithmetic
+    if mode not in ARITHMETIC_MODES:
+        raise ValueError(f"Unknown arithmetic mode: {mode!r} (expected one of {ARITHMETIC_MODES})")
+    return mode
+
+
+def to_float(value) -> float:
+    """float() of an amount, 0.0 where it fails (the float mode's reading of an amount)."""
+    try:
+        return float(value)
+    except:
+        return 0.0
+
+
+def to_float_array(values) -> np.ndarray:
+    """to_float of each amount as a float64 array; plain numbers convert in one step."""
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'fiu':
+        return values.astype(np.float64, copy=False)
+    if {type(v) for v in values} <= {float, int}:
+        try:
+            return np.array(values, dtype=np.float64)
+        except OverflowError:
+            pass
+    return np.fromiter(map(to_float, values), dtype=np.float64, count=len(values))
+
+
+def to_minor(value) -> int:
+    """
+    An amount in minor units, rounded half-to-even to the cent. Numeric
+    strings and ints convert through Decimal, so '0.10' is exactly 10;
+    floats through their shortest repr (what the JSON said). Values float()
+    rejects, NaN and infinities count as 0, as in the float path.
+    """
+    amount = None
+    if isinstance(value, str):
+        try:
+            amount = Decimal(value.strip())
+        except InvalidOperation:
+            pass
+    elif isinstance(value, (int, Decimal)):
+        amount = Decimal(value)
+    if amount is None:
+        try:
+            number = float(value)
+        except:
+            return 0
+        if not math.isfinite(number):
+            return 0
+        amount = Decimal(repr(number))
+    if not amount.is_finite():
+        return 0
+    try:
+        return int(amount.quantize(_QUANTUM, rounding=ROUND_HALF_EVEN).scaleb(2))
+    except InvalidOperation:  # beyond Decimal's 28 digits
+        return 0
+
+
+def to_minor_array(values) -> np.ndarray:
+    """
+    to_minor of each amount as an int64 array. Plain floats and ints convert
+    in one vectorized step: the float nearest a 2-place decimal lies within
+    an ulp of it, so rint(x * 100) recovers its cent. Amounts with a real
+    sub-cent part (where binary ties could round differently) and anything
+    else go through to_minor one by one.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'iu':
+        return values.astype(np.int64) * MINOR_PER_UNIT
+    floats = None
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        floats = values.astype(np.float64, copy=False)
+    elif {type(v) for v in values} <= {float, int}:
+        try:
+            floats = np.array(values, dtype=np.float64)
+        except OverflowError:
+            pass
+    if floats is None or not np.isfinite(floats).all() or np.abs(floats).max(initial=0) >= _FLOAT_EXACT_LIMIT:
+        return np.fromiter(map(to_minor, values), dtype=np.int64, count=len(values))
+
+    scaled = floats * MINOR_PER_UNIT
+    rounded = np.rint(scaled)
+    minor = rounded.astype(np.int64)
+    for i in np.flatnonzero(np.abs(scaled - rounded) > np.abs(scaled) * _CENT_TOLERANCE):
+        minor[i] = to_minor(values[i])
+    return minor
+
+
+def to_major(minor: int) -> float:
+    """
+    Minor units as the API's decimal number: the float nearest to minor/100,
+    which serializes as exactly two decimal places (12345 -> 123.45).
+    """
+    return int(minor) / MINOR_PER_UNIT
+
+
+def minor_sums(amounts: np.ndarray, codes: np.ndarray, bins: int) -> np.ndarray:
+    """Exact int64 total of `amounts` per code (0..bins-1)."""
+    sums = np.zeros(bins, dtype=np.int64)
+    np.add.at(sums, codes, amounts)
+    return sums
@@ -0,0 +1,114 @@
+# Posting Rules - table-driven double-entry accounts, compiled once and applied to whole batches
+
+import json
+import os
+
+import money
+
+POSTING_RULES_PATH = os.environ.get('POSTING_RULES_PATH', os.path.join(os.path.dirname(__file__), 'posting_rules.json'))
+
+
+def _as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+class PostingRules:
+    """
+    Posting rules compiled into a dict dispatch from (category, sub_category)
+    to a (debit account, credit account) pair.
+
+    Config: {"default": {"debit", "credit"}, "rules": [{"category",
+    "sub_category"?, "debit", "credit"}, ...]}; category and sub_category
+    take a name or a list of names. A rule without sub_category covers every
+    sub-category of its categories; one with it takes precedence for those.
+    When two rules cover the same pair, the first one listed wins.
+    """
+
+    def __init__(self, config: dict):
+        default = config['default']
+        self.default = (default['debit'], default['credit'])
+        self._exact = {}  # (category, sub_category) -> pair
+        self._by_category = {}  # category -> pair
+        for rule in config.get('rules', []):
+            pair = (rule['debit'], rule['credit'])
+            for category in _as_list(rule['category']):
+                if 'sub_category' in rule:
+                    for sub_category in _as_list(rule['sub_category']):
+                        self._exact.setdefault((category, sub_category), pair)
+                else:
+                    self._by_category.setdefault(category, pair)
+
+    @classmethod
+    def from_file(cls, path: str = POSTING_RULES_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def accounts_for(self, category, sub_category=None) -> tuple:
+        """(debit account, credit account) of a transaction."""
+        # Unhashable values (JSON lists) match no rule
+        try:
+            pair = self._exact.get((category, sub_category))
+        except TypeError:
+            pair = None
+        if pair is not None:
+            return pair
+        try:
+            return self._by_category.get(category, self.default)
+        except TypeError:
+            return self.default
+
+    def post_columns(self, amounts, categories, sub_categories, arithmetic=None) -> dict:
+        """
+        Posts a batch given as columns. Each distinct (category, sub_category)
+        is resolved once; the result is columnar: the accounts used, and per
+        transaction the index of its debit and credit account and its amount.
+        """
+        pairs = list(zip(categories, sub_categories))
+        try:
+            resolved = {pair: self.accounts_for(*pair) for pair in dict.fromkeys(pairs)}
+            accounts_of = map(resolved.__getitem__, pairs)
+        except TypeError:  # unhashable values: resolve row by row
+            accounts_of = (self.accounts_for(*pair) for pair in pairs)
+
+        index = {}
+        debit, credit = [], []
+        for debit_account, credit_account in accounts_of:
+            debit.append(index.setdefault(debit_account, len(index)))
+            credit.append(index.setdefault(credit_account, len(index)))
+
+        if money.arithmetic_mode(arithmetic) == money.MINOR:
+            # Read exactly to the tetri/cent; decimals again only for the response
+            amount = (money.to_minor_array(amounts) / money.MINOR_PER_UNIT).tolist()
+        else:
+            amount = money.to_float_array(amounts).tolist()
+        return {'accounts': list(index), 'debit': debit, 'credit': credit, 'amount': amount}
+
+    def post(self, transactions, arithmetic=None) -> dict:
+        """post_columns for a list of transaction dicts."""
+        return self.post_columns(
+            [t.get("amount", 0) for t in transactions],
+            [t.get("category", "Unknown") for t in transactions],
+            [t.get("sub_category") for t in transactions],
+            arithmetic=arithmetic
+        )
+
+
+def to_entries(posted: dict) -> list:
+    """The columnar result as ledger entry dicts: a Debit then a Credit per transaction."""
+    accounts = posted['accounts']
+    entries = []
+    for debit, credit, amount in zip(posted['debit'], posted['credit'], posted['amount']):
+        entries.append({"account": accounts[debit], "type": "Debit", "amount": amount})
+        entries.append({"account": accounts[credit], "type": "Credit", "amount": amount})
+    return entries
+
+
+_rules = None
+
+
+def get_rules() -> PostingRules:
+    """The configured rules, compiled once per instance."""
+    global _rules
+    if _rules is None:
+        _rules = PostingRules.from_file()
+    return _rules
@@ -1,7 +1,14 @@
-def reconcile(assets, liabilities, equity):
+import money
+
+
+def reconcile(assets, liabilities, equity, arithmetic=None):
     """
     Validates the Fundamental Accounting Equation: Assets = Liabilities + Equity
+    In the 'minor' arithmetic mode the check is exact, in integer minor units.
     """
+    if money.arithmetic_mode(arithmetic) == money.MINOR:
+        return reconcile_minor(money.to_minor(assets), money.to_minor(liabilities), money.to_minor(equity))
+
     # Round to 2 decimal places for currency comparison
     A = round(float(assets), 2)
     L = round(float(liabilities), 2)
@@ -17,3 +24,14 @@ def reconcile(assets, liabilities, equity):
         "discrepancy": discrepancy,
         "equation": f"{A} = {L} + {E}"
     }
+
+
+def reconcile_minor(assets: int, liabilities: int, equity: int):
+    """reconcile for amounts in minor units: balanced only when the equation holds to the tetri/cent."""
+    discrepancy = assets - (liabilities + equity)
+    A, L, E = (money.to_major(amount) for amount in (assets, liabilities, equity))
+    return {
+        "is_balanced": discrepancy == 0,
+        "discrepancy": money.to_major(discrepancy),
+        "equation": f"{A} = {L} + {E}"
+    }
@@ -0,0 +1,172 @@
+# Blob Stream - seekable ranged reads from Cloud Storage, with read-ahead
+
+import io
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Bytes per ranged GET
+RANGE_BYTES = int(os.environ.get('INGEST_RANGE_BYTES', str(4 * 1024 * 1024)))
+# Ranges kept for re-reads (XLSX and PDF readers seek back to the zip directory / xref)
+CACHED_RANGES = int(os.environ.get('INGEST_CACHED_RANGES', '4'))
+# Local filesystem stand-in for Cloud Storage (tests, local runs): storage paths resolve under this directory
+LOCAL_STORAGE_ROOT = os.environ.get('INGEST_LOCAL_STORAGE_ROOT')
+
+
+class LocalBlob:
+    """The part of the Cloud Storage Blob API the ingestion reads use, backed by a local file."""
+
+    def __init__(self, path: str, generation=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = None
+        self.generation = generation
+
+    def reload(self):
+        stat = os.stat(self.path)
+        self.size = stat.st_size
+        self.generation = self.generation or stat.st_mtime_ns
+
+    def download_as_bytes(self, start=None, end=None, **kwargs) -> bytes:
+        with open(self.path, 'rb') as f:
+            f.seek(start or 0)
+            return f.read() if end is None else f.read(end - (start or 0) + 1)
+
+
+class LocalBucket:
+    def __init__(self, root: str, name: str = 'local'):
+        self.root = root
+        self.name = name
+
+    def blob(self, path: str, generation=None) -> LocalBlob:
+        return LocalBlob(os.path.join(self.root, path), generation)
+
+
+def get_bucket(bucket_name=None):
+    """Cloud Storage bucket, or the local stand-in when INGEST_LOCAL_STORAGE_ROOT is set."""
+    if LOCAL_STORAGE_ROOT:
+        return LocalBucket(LOCAL_STORAGE_ROOT, bucket_name or 'local')
+    from firebase_admin import storage
+    return storage.bucket(bucket_name)
+
+
+class RangedBlobReader(io.RawIOBase):
+    """
+    Raw binary stream over a blob, fetched in RANGE_BYTES ranged reads.
+    While the parser consumes one range, the next is already downloading on
+    a background thread, so parsing overlaps with the download. Only the last
+    CACHED_RANGES ranges are held, so memory does not grow with the object.
+    Reads are pinned to the blob generation seen at open: an overwrite
+    mid-read fails instead of mixing two versions.
+    Wrap in io.BufferedReader (open_blob) for parsers.
+    """
+
+    def __init__(self, blob, range_bytes: int = RANGE_BYTES, cached_ranges: int = CACHED_RANGES,
+                 read_ahead: bool = True):
+        if blob.size is None:
+            blob.reload()
+        self._blob = blob
+        self._generation = blob.generation
+        self.size = blob.size
+        self._range_bytes = range_bytes
+        self._cached_ranges = max(1, cached_ranges)
+        self._ranges = OrderedDict()
+        self._pos = 0
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='blob-read-ahead') if read_ahead else None
+        self._ahead = None  # (range index, future)
+        self.range_reads = 0
+        self.bytes_fetched = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return self._pos
+
+    def _fetch(self, index: int) -> bytes:
+        start = index * self._range_bytes
+        end = min(start + self._range_bytes, self.size) - 1
+        # A range cannot be checked against the whole-object hash
+        data = self._blob.download_as_bytes(start=start, end=end, checksum=None,
+                                            if_generation_match=self._generation)
+        self.range_reads += 1
+        self.bytes_fetched += len(data)
+        return data
+
+    def _range(self, index: int) -> bytes:
+        data = self._ranges.get(index)
+        if data is not None:
+            self._ranges.move_to_end(index)
+        else:
+            if self._ahead is not None and self._ahead[0] == index:
+                data = self._ahead[1].result()
+                self._ahead = None
+            else:
+                data = self._fetch(index)
+            self._ranges[index] = data
+            while len(self._ranges) > self._cached_ranges:
+                self._ranges.popitem(last=False)
+
+        following = index + 1
+        if self._pool is not None and self._ahead is None and following * self._range_bytes < self.size \
+                and following not in self._ranges:
+            self._ahead = (following, self._pool.submit(self._fetch, following))
+        return data
+
+    def readinto(self, buffer) -> int:
+        if self._pos >= self.size:
+            return 0
+        index, offset = divmod(self._pos, self._range_bytes)
+        data = self._range(index)
+        count = min(len(buffer), len(data) - offset)
+        buffer[:count] = memoryview(data)[offset:offset + count]
+        self._pos += count
+        return count
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._ranges.clear()
+        self._ahead = None
+        super().close()
+
+    def stats(self) -> dict:
+        return {'size': self.size, 'range_reads': self.range_reads, 'bytes_fetched': self.bytes_fetched}
+
+
+def open_blob(blob, range_bytes: int = RANGE_BYTES) -> io.BufferedReader:
+    """Buffered, seekable binary stream over `blob` for the CSV, XLSX and PDF parsers."""
+    return io.BufferedReader(RangedBlobReader(blob, range_bytes=range_bytes), buffer_size=256 * 1024)
+
+
+def storage_uri(bucket_name: str, path: str) -> str:
+    """`gs://bucket/path` of a storage object: identifies an upload's file across re-uploads."""
+    return f"gs://{bucket_name}/{path}"
+
+
+def open_storage(bucket_name: str, path: str, generation=None) -> io.BufferedReader:
+    """
+    Opens a storage object from a worker process (bind with functools.partial).
+    Builds its own client: connections inherited from the parent are not safe to share.
+    """
+    if LOCAL_STORAGE_ROOT:
+        return open_blob(LocalBucket(LOCAL_STORAGE_ROOT, bucket_name).blob(path, generation))
+    from google.cloud import storage
+    return open_blob(storage.Client().bucket(bucket_name).blob(path, generation=generation))
+
+
+def open_local(path: str) -> io.BufferedReader:
+    return open_blob(LocalBlob(path))
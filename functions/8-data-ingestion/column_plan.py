@@ -0,0 +1,90 @@
+# Column Plan - header normalization and alias resolution, compiled once per file layout
+
+import functools
+import hashlib
+
+ENTITY_COLUMNS = ['entity', 'company', 'organization', 'branch', 'sub']
+
+# Field -> aliases in lookup order (the first present one wins)
+FIELD_ALIASES = {
+    'gl': ['gl_account', 'gl'],
+    'desc': ['description', 'memo'],
+    'department': ['department'],
+    'date': ['date'],
+    'amount': ['amount'],
+    'currency': ['currency'],
+}
+
+PLAN_CACHE_SIZE = 64
+
+
+def normalize_header(name) -> str:
+    return str(name).lower().strip().replace(' ', '_')
+
+
+def header_fingerprint(headers) -> str:
+    """Short stable id of a header layout (names and order)."""
+    return hashlib.sha1('\x1f'.join(str(h) for h in headers).encode('utf-8')).hexdigest()[:12]
+
+
+class ColumnPlan:
+    """
+    The per-row key work of mapping a row dict (normalizing every key, then
+    looking up each alias), done once for a header row. Rows become
+    plain tuples; the plan knows which tuple index holds each normalized key
+    and each alias (company, GL, description, ...), so the hot loop only
+    indexes into the tuple.
+
+    Duplicates resolve exactly as in a row dict (csv.DictReader) with
+    normalized keys: a repeated or equal-after-normalization header keeps
+    the earlier position but the later value.
+    """
+
+    def __init__(self, headers):
+        self.headers = tuple(headers)
+        self.width = len(self.headers)
+        self.fingerprint = header_fingerprint(self.headers)
+
+        # First insertion fixes the order, the last index wins (row dict, then norm_row)
+        row_positions = {}
+        for index, name in enumerate(self.headers):
+            row_positions[name] = index
+        positions = {}
+        for name, index in row_positions.items():
+            positions[normalize_header(name)] = index
+        self.keys = tuple(positions.keys())
+        self.sources = tuple(positions.values())
+        self.identity = self.sources == tuple(range(self.width))
+
+        self.entity = tuple(positions[c] for c in ENTITY_COLUMNS if c in positions)
+        for field, aliases in FIELD_ALIASES.items():
+            index = next((positions[a] for a in aliases if a in positions), None)
+            setattr(self, field, index)
+
+    def normalize(self, values) -> dict:
+        """Row tuple -> dict keyed by normalized header (apply_mapping's `norm_row`)."""
+        if self.identity:
+            return dict(zip(self.keys, values))
+        return dict(zip(self.keys, [values[i] for i in self.sources]))
+
+    def value(self, values, index, default):
+        return default if index is None else values[index]
+
+    def to_tuple(self, record: dict) -> tuple:
+        """Dict keyed by `headers` (e.g. csv.DictReader output) -> row tuple."""
+        return tuple(record.get(h) for h in self.headers)
+
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _cached_plan(headers: tuple) -> ColumnPlan:
+    return ColumnPlan(headers)
+
+
+def plan_for(headers) -> ColumnPlan:
+    """Plan for a header row; files with the same layout share one instance per warm worker."""
+    return _cached_plan(tuple(str(h) for h in headers))
+
+
+def cache_stats() -> dict:
+    info = _cached_plan.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'plans': info.currsize}
@@ -0,0 +1,227 @@
+# Columnar Transform - vectorized equivalent of map_values + generate_ledger_entries_for_row
+#
+# Rows are loaded into a DataFrame and processed one column at a time as NumPy
+# arrays. Ledger columns are low-cardinality (company, GL, description,
+# currency, department), so each column is dictionary-encoded with
+# pd.factorize: the mapping rules (ledger_rules, shared with the row path)
+# run once per distinct value and the result is broadcast back with an array
+# lookup. The produced ledger records are identical to the row path, key
+# order included.
+
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+import column_plan
+import date_normalizer
+import fx_rates
+import ledger_rules
+import rule_matcher
+
+COLUMNAR_CHUNK_ROWS = 50000
+
+
+def read_csv_frames(file_stream, chunk_rows: int = COLUMNAR_CHUNK_ROWS):
+    """
+    Yields DataFrames of raw CSV rows (all values as str, empty cells as '').
+    Duplicate headers are kept as-is (no '.1' suffixes), like csv.DictReader.
+    Note: fields missing from short rows arrive as '' here, whereas
+    csv.DictReader yields None for them.
+    """
+    file_stream.seek(0)
+    text_stream = io.TextIOWrapper(file_stream, encoding='utf-8', newline='')
+    headers = next(csv.reader(text_stream), None)
+    if not headers:
+        return
+    positions = list(range(len(headers)))
+    for frame in pd.read_csv(text_stream, header=None, names=positions, dtype=object,
+                             keep_default_na=False, chunksize=chunk_rows):
+        yield frame.set_axis(headers, axis=1)
+
+
+def frames_from_rows(rows, headers, chunk_rows: int = COLUMNAR_CHUNK_ROWS):
+    """Yields DataFrames built from any iterator of row tuples (e.g. the XLSX reader)."""
+    columns = list(headers)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield pd.DataFrame(chunk, columns=columns, dtype=object)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk, columns=columns, dtype=object)
+
+
+def frame_columns(df: pd.DataFrame) -> dict:
+    """
+    DataFrame -> {normalized name: object array}, header normalization done once.
+    Like the per-row dict rebuild, a duplicated name keeps its first position
+    but takes the last column's values.
+    """
+    columns = {}
+    for i, name in enumerate(df.columns):
+        key = str(name).lower().strip().replace(' ', '_')
+        columns[key] = df.iloc[:, i].to_numpy(dtype=object)
+    return columns
+
+
+def encode(values: np.ndarray):
+    """Dictionary-encodes a column: (codes, distinct values)."""
+    codes, uniques = pd.factorize(values)
+    uniques = list(uniques)
+    missing = codes < 0
+    if missing.any():
+        # factorize folds None into NaN; keep them apart since str(None) != str(nan)
+        is_none = np.array([v is None for v in values[missing]], dtype=bool)
+        codes = codes.copy()
+        codes[missing] = np.where(is_none, len(uniques), len(uniques) + 1)
+        uniques += [None, float('nan')]
+    return codes, np.array(uniques + [None], dtype=object)[:-1]
+
+
+def apply_distinct(values: np.ndarray, fn, dtype=object) -> np.ndarray:
+    """fn() evaluated once per distinct value, broadcast back to every row."""
+    codes, uniques = encode(values)
+    return np.array([fn(v) for v in uniques], dtype=dtype)[codes]
+
+
+def _column(columns, names, default, size):
+    for name in names:
+        if name in columns:
+            return columns[name]
+    return np.full(size, default, dtype=object)
+
+
+def _safe_float(val):
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _amounts(values: np.ndarray) -> np.ndarray:
+    try:
+        # numpy applies float() to each value, so accepted inputs are exactly the row path's
+        return np.array(values, dtype=float)
+    except (ValueError, TypeError):
+        return apply_distinct(values, _safe_float, dtype=float)
+
+
+def _combine_codes(arrays):
+    """Joint dictionary encoding of several columns: (row of first occurrence per combination, codes)."""
+    combined = np.zeros(len(arrays[0]), dtype=np.int64)
+    for values in arrays:
+        codes, uniques = encode(values)
+        # Re-densify after each column so the joint code cannot overflow
+        combined = np.unique(combined * max(len(uniques), 1) + codes, return_inverse=True)[1].reshape(-1)
+    _, first_rows, codes = np.unique(combined, return_index=True, return_inverse=True)
+    return first_rows, codes.reshape(-1)
+
+
+def _company_ids(columns: dict, size: int) -> np.ndarray:
+    """company_id per row, computed once per distinct combination of entity columns."""
+    entity_cols = [columns[c] for c in column_plan.ENTITY_COLUMNS if c in columns]
+    if not entity_cols:
+        return np.full(size, 'SGG-001', dtype=object)
+    first_rows, codes = _combine_codes(entity_cols)
+    names = [ledger_rules.company_from_entities([str(values[r]) for values in entity_cols]) for r in first_rows]
+    return np.array(names, dtype=object)[codes]
+
+
+def _dates(columns: dict, size: int) -> np.ndarray:
+    """ISO dates (date_normalizer), the format remembered per raw column layout."""
+    key = ('columnar', tuple(columns))
+    return date_normalizer.DateNormalizer(key=key).convert(_column(columns, ['date'], '', size))
+
+
+def lock_contexts(df: pd.DataFrame) -> set:
+    """Distinct (company_id, YYYY-MM) pairs of a raw frame, without mapping it."""
+    size = len(df)
+    if not size:
+        return set()
+    columns = frame_columns(df)
+    company_ids = _company_ids(columns, size)
+    periods = apply_distinct(_dates(columns, size), lambda d: d[:7])
+    first_rows, _ = _combine_codes([company_ids, periods])
+    return {(company_ids[r], periods[r]) for r in first_rows}
+
+
+def map_columns(columns: dict, size: int, mapping_rules, fx_table=None) -> dict:
+    """Vectorized map_values: {column: array} of raw rows -> {column: array} of mapped rows."""
+    dates = _dates(columns, size)  # Keyed by the raw columns, before any are added
+    if fx_table is None:
+        fx_table = fx_rates.RateTable()
+    columns = dict(columns)
+
+    # 1. Company Mapping, once per distinct combination of entity columns
+    columns['company_id'] = _company_ids(columns, size)
+
+    # 2. Category Mapping, once per distinct (GL, description) pair
+    if not isinstance(mapping_rules, rule_matcher.RuleMatcher):
+        mapping_rules = rule_matcher.compile_rules(mapping_rules or {})
+    gl_raw = _column(columns, ['gl_account', 'gl'], '', size)
+    desc_raw = _column(columns, ['description', 'memo'], '', size)
+    first_rows, codes = _combine_codes([gl_raw, desc_raw])
+    categories, sub_categories = [], []
+    for r in first_rows:
+        gl, desc = str(gl_raw[r]).strip(), str(desc_raw[r]).lower()
+        match = mapping_rules.match(desc, gl) or ledger_rules.fallback_category(gl, desc)
+        categories.append(match[0])
+        sub_categories.append(match[1])
+    columns['category'] = np.array(categories, dtype=object)[codes]
+    columns['sub_category'] = np.array(sub_categories, dtype=object)[codes]
+
+    # 3. Department
+    columns['department'] = apply_distinct(_column(columns, ['department'], '', size), ledger_rules.department_name)
+
+    # 4. Date & Amount Normalization
+    columns['date'] = dates
+
+    raw_amt = _amounts(_column(columns, ['amount'], 0, size))
+    # Rate looked up once per distinct (currency, date) pair
+    currencies = _column(columns, ['currency'], 'GEL', size)
+    first_rows, codes = _combine_codes([currencies, dates])
+    rate = fx_table.rates(currencies[first_rows], dates[first_rows])[codes]
+    columns['amount_gel'] = raw_amt * rate
+    return columns
+
+
+def ledger_columns(mapped: dict, size: int) -> dict:
+    """Vectorized generate_ledger_entries_for_row: interleaved (Debit, Credit) rows."""
+    category = mapped['category']
+    sub = mapped['sub_category']
+
+    debit_acc = np.full(size, ledger_rules.DEFAULT_ACCOUNTS[0], dtype=object)
+    credit_acc = np.full(size, ledger_rules.DEFAULT_ACCOUNTS[1], dtype=object)
+    for cat, (debit, credit) in ledger_rules.LEDGER_ACCOUNTS.items():
+        mask = category == cat
+        if mask.any():
+            debit_acc[mask] = sub[mask] if debit is None else debit
+            credit_acc[mask] = sub[mask] if credit is None else credit
+
+    ledger = {name: np.repeat(values, 2) for name, values in mapped.items()}
+    entry_type = np.empty(size * 2, dtype=object)
+    entry_type[0::2] = 'Debit'
+    entry_type[1::2] = 'Credit'
+    account = np.empty(size * 2, dtype=object)
+    account[0::2] = debit_acc
+    account[1::2] = credit_acc
+
+    ledger['entry_type'] = entry_type
+    ledger['account'] = account
+    return ledger
+
+
+def transform_frame(df: pd.DataFrame, mapping_rules, fx_table=None) -> dict:
+    """Raw DataFrame -> ledger columns ({name: array}, two rows per input row)."""
+    size = len(df)
+    return ledger_columns(map_columns(frame_columns(df), size, mapping_rules, fx_table), size)
+
+
+def to_records(ledger: dict) -> list:
+    """Ledger columns -> list of plain dicts (native Python scalars) for Firestore."""
+    names = list(ledger.keys())
+    values = [ledger[name].tolist() for name in names]
+    return [dict(zip(names, row)) for row in zip(*values)]
@@ -0,0 +1,75 @@
+# CSV Reader - row tuples with the byte offset after each row, so a job can resume mid-file
+
+import codecs
+import csv
+from collections import deque
+
+
+class CsvRowReader:
+    """
+    Iterates the data rows of a CSV file as tuples aligned to `headers`,
+    reading the binary stream one line at a time. csv.reader pulls exactly
+    the lines of each record (quoted newlines included), so the bytes
+    consumed after a row are known: `offset_after(n)` is the file position
+    just past the n-th data row, where a later reader can `start`.
+
+    Blank lines are skipped and short rows padded like csv.DictReader;
+    extra cells have no header and are dropped.
+
+    Usage:
+        reader = CsvRowReader(file_stream)
+        for values in reader:
+            ...
+        reader.offset_after(reader.rows)
+        CsvRowReader(file_stream, start=offset, first_row=rows)  # the rest of the file
+    """
+
+    def __init__(self, file_stream, start: int = None, first_row: int = 0):
+        self._file_stream = file_stream
+        file_stream.seek(0)
+        self._position = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._reader = csv.reader(self._lines())
+        self.headers = next(self._reader, [])
+        self.width = len(self.headers)
+        if start is not None and start > self._position:
+            file_stream.seek(start)
+            self._position = start
+        self.start = self._position
+        self.rows = first_row  # data rows before this reader's first, plus those read so far
+        # (rows, offset) of rows read but not yet looked up; bounded by how far the caller reads ahead
+        self._offsets = deque()
+
+    def _lines(self):
+        readline = self._file_stream.readline
+        decode = self._decoder.decode
+        while True:
+            line = readline()
+            if not line:
+                return
+            self._position += len(line)
+            yield decode(line)
+
+    def __iter__(self):
+        width = self.width
+        offsets = self._offsets
+        for row in self._reader:
+            if not row:
+                continue # Blank line, skipped like csv.DictReader
+            if len(row) != width:
+                row = (row + [None] * width)[:width]
+            self.rows += 1
+            offsets.append((self.rows, self._position))
+            yield tuple(row)
+
+    def offset_after(self, rows: int) -> int:
+        """
+        Byte offset just past data row `rows` (counted from the file start).
+        Rows must be asked for in increasing order; earlier ones are dropped.
+        """
+        offsets = self._offsets
+        while offsets and offsets[0][0] < rows:
+            offsets.popleft()
+        if not offsets or offsets[0][0] != rows:
+            raise ValueError(f"No offset recorded for row {rows}")
+        return offsets[0][1]
@@ -0,0 +1,184 @@
+# Date Normalizer - per-column format detection and vectorized conversion to ISO dates
+#
+# Exports disagree on dates: the SGG ERP writes 01.07.2024, other sources
+# write ISO dates, and Excel cells arrive as datetimes or as serial numbers
+# when a column is not typed. The format is detected once per column from a
+# sample, remembered per header layout, and the column is converted one
+# distinct value at a time with pandas.
+
+import datetime
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Distinct non-empty values inspected to pick a column's format
+DETECT_SAMPLE = int(os.environ.get('INGEST_DATE_DETECT_SAMPLE', '200'))
+# A cached format is re-detected when more than this share of a batch fails to parse with it
+REDETECT_FAILURE_RATE = 0.5
+FORMAT_CACHE_SIZE = 256
+
+# Candidates in tie-break order: day-first before month-first (local exports are day-first)
+DATE_FORMATS = {
+    'iso': '%Y-%m-%d',
+    'dmy_dot': '%d.%m.%Y',
+    'dmy_slash': '%d/%m/%Y',
+    'mdy_slash': '%m/%d/%Y',
+    'dmy_dash': '%d-%m-%Y',
+    'ymd_slash': '%Y/%m/%d',
+    'ymd_compact': '%Y%m%d',
+    'excel_serial': None,
+}
+# Excel's day zero (the 1900 leap-year bug is folded into it) and the serials accepted (1954-2119)
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+EXCEL_SERIAL_RANGE = (20000, 80000)
+
+_format_cache = OrderedDict()
+_format_cache_lock = threading.Lock()
+_format_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _text(values) -> pd.Series:
+    """Strings stripped of a trailing time part ('2024-07-01 00:00:00', '2024-07-01T10:00')."""
+    text = pd.Series(values, dtype=object).astype(str).str.strip()
+    return text.str.split(r'[ T]', n=1, regex=True).str[0]
+
+
+def parse_as(values, name: str) -> pd.Series:
+    """Parses string/number values with one candidate format; NaT where they do not fit."""
+    if name == 'excel_serial':
+        serials = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+        serials = serials.where((serials >= EXCEL_SERIAL_RANGE[0]) & (serials < EXCEL_SERIAL_RANGE[1]))
+        return EXCEL_EPOCH + pd.to_timedelta(np.floor(serials), unit='D')
+    return pd.to_datetime(_text(values), format=DATE_FORMATS[name], errors='coerce')
+
+
+def detect_format(sample) -> str:
+    """Candidate parsing the most sample values (earliest on ties), or None if none parses any."""
+    if not len(sample):
+        return None
+    best, best_count = None, 0
+    for name in DATE_FORMATS:
+        count = int(parse_as(sample, name).notna().sum())
+        if count > best_count:
+            best, best_count = name, count
+            if count == len(sample):
+                break
+    return best
+
+
+def cached_format(key):
+    with _format_cache_lock:
+        name = _format_cache.get(key)
+        if name is not None:
+            _format_cache.move_to_end(key)
+            _format_cache_stats['hits'] += 1
+        else:
+            _format_cache_stats['misses'] += 1
+        return name
+
+
+def remember_format(key, name: str):
+    with _format_cache_lock:
+        _format_cache[key] = name
+        _format_cache.move_to_end(key)
+        while len(_format_cache) > FORMAT_CACHE_SIZE:
+            _format_cache.popitem(last=False)
+
+
+def cache_stats() -> dict:
+    with _format_cache_lock:
+        return dict(_format_cache_stats, formats=len(_format_cache))
+
+
+class DateNormalizer:
+    """
+    Converts one date column to ISO `YYYY-MM-DD` strings, a batch at a time.
+    The format is taken from the cache for `key` (header layout + column) or
+    detected from the first batch's distinct values; a cached format that
+    stops fitting is re-detected. Per batch, each distinct value is parsed
+    once, vectorized, and broadcast back to its rows; the few values that do
+    not fit the column's format are tried against the other formats.
+
+    Rules match the row path: empty values become today's date, date and
+    datetime cells are used as they are, and values that fit no format are
+    kept as they arrived and counted in `failed` instead of raising.
+    """
+
+    def __init__(self, key=None):
+        self.key = key
+        self.format = None
+        self.rows = 0
+        self.failed = 0
+        self.empty = 0
+
+    def convert(self, values) -> np.ndarray:
+        """ISO date strings for a column's raw values (object array, same length)."""
+        values = np.asarray(values if isinstance(values, np.ndarray) else list(values), dtype=object)
+        size = len(values)
+        self.rows += size
+        if not size:
+            return values
+
+        codes, uniques = pd.factorize(values)
+        uniques = np.asarray(uniques, dtype=object)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        result = np.empty(len(uniques) + 1, dtype=object)
+        result[-1] = datetime.date.today().isoformat()  # None (and NaN) is empty, like `not date_val`
+
+        typed = np.array([isinstance(v, (datetime.date, datetime.datetime)) for v in uniques], dtype=bool)
+        empty = np.array([not v for v in uniques], dtype=bool) & ~typed
+        result[:-1][typed] = [(v.date() if isinstance(v, datetime.datetime) else v).isoformat() for v in uniques[typed]]
+        result[:-1][empty] = result[-1]
+
+        pending = ~(typed | empty)
+        if pending.any():
+            raw = uniques[pending]
+            parsed = self._parse(raw, counts[pending])
+            ok = parsed.notna().to_numpy().copy()
+            if not ok.all():
+                # Stragglers in another format (e.g. an ISO row in a dotted column)
+                for name in DATE_FORMATS:
+                    if name == self.format:
+                        continue
+                    retry = np.flatnonzero(~ok)
+                    fallback = parse_as(raw[retry], name)
+                    found = fallback.notna().to_numpy()
+                    parsed.iloc[retry[found]] = fallback[found].to_numpy()
+                    ok[retry[found]] = True
+                    if ok.all():
+                        break
+            converted = np.array([str(v) for v in raw], dtype=object)
+            converted[ok] = parsed[ok].dt.strftime('%Y-%m-%d').to_numpy()
+            result[:-1][pending] = converted
+            self.failed += int(counts[pending][~ok].sum())
+        self.empty += int(counts[empty].sum()) + int((codes < 0).sum())
+        return result[codes]
+
+    def _parse(self, raw: np.ndarray, counts: np.ndarray) -> pd.Series:
+        if self.format is None and self.key is not None:
+            self.format = cached_format(self.key)
+        if self.format is not None:
+            parsed = parse_as(raw, self.format)
+            failed_rows = int(counts[parsed.isna().to_numpy()].sum())
+            if failed_rows <= REDETECT_FAILURE_RATE * int(counts.sum()):
+                return parsed
+            logger.info(f"Date format {self.format} no longer fits column {self.key}; detecting again")
+
+        # Most frequent distinct values first, so the sample is representative
+        sample = raw[np.argsort(-counts, kind='stable')[:DETECT_SAMPLE]]
+        self.format = detect_format(sample)
+        if self.format is None:
+            return pd.Series([pd.NaT] * len(raw), dtype='datetime64[ns]')
+        if self.key is not None:
+            remember_format(self.key, self.format)
+        logger.info(f"Date format for column {self.key}: {self.format}")
+        return parse_as(raw, self.format)
+
+    def stats(self) -> dict:
+        return {'format': self.format, 'rows': self.rows, 'failed': self.failed, 'empty': self.empty}
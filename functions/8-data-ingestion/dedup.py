@@ -0,0 +1,128 @@
+# Ledger De-duplication - content-hash document ids, told apart by their occurrence within the file
+
+import hashlib
+import json
+
+import ledger_entries
+
+# Filled in by map_values / store_data; leaving them out keeps an entry's id
+# stable when mapping rules or FX rates change, so a re-upload overwrites it.
+# A missing date is filled with the ingestion day, so the date is left out
+# too; identical rows are told apart by their occurrence instead.
+DERIVED_FIELDS = frozenset([
+    'company_id', 'category', 'sub_category', 'amount_gel', 'date',
+    'entry_type', 'account', 'source_file', 'ingested_at'
+])
+
+
+def content_key(record) -> str:
+    """The fields that identify a ledger entry: its entry type and its normalized source row."""
+    # A LedgerEntry's own fields are all derived; hash its shared row directly
+    fields = record.row if isinstance(record, ledger_entries.LedgerEntry) else record
+    content = sorted((k, v) for k, v in fields.items() if k not in DERIVED_FIELDS)
+    return json.dumps([record.get('entry_type'), content], default=str, separators=(',', ':'))
+
+
+def record_id(record, source_file: str, occurrence: int = 0) -> str:
+    """
+    Stable document id of a ledger entry: hash of the file, its content_key
+    and how many identical entries came before it in the file. Identical
+    rows get different ids; the same row of a re-upload (or of a replayed
+    job chunk) gets the same one, wherever other rows moved it to.
+    """
+    return _hash_id(source_file, content_key(record), occurrence)
+
+
+def _hash_id(source_file: str, key: str, occurrence: int) -> str:
+    payload = json.dumps([source_file, occurrence], separators=(',', ':')) + key
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+
+class RecordIds:
+    """
+    Assigns record_ids to the ledger entries of one file, batch after batch
+    in file order, counting occurrences of identical content across batches.
+
+    Contents are tracked as 64-bit digests: a sorted NumPy array of those
+    seen, plus a dict of the few seen more than once. A digest collision
+    only changes an occurrence number; the ids still differ, as they hash
+    the content itself. With `checkpointed`, `take_digests` hands out the
+    digests assigned since its last call (a job checkpoints them with each
+    chunk); `restore` rebuilds the counts from them when a job resumes
+    mid-file. `checked` and `unchanged` are counted by store_data.
+    """
+
+    def __init__(self, source_file: str, checkpointed: bool = False):
+        import numpy as np
+        self.source_file = source_file
+        self._checkpointed = checkpointed
+        self._seen = np.empty(0, dtype=np.uint64)
+        self._repeats = {}  # digest -> occurrences so far, for digests seen more than once
+        self._taken = []
+        self.entries = 0
+        self.repeated = 0
+        self.checked = 0
+        self.unchanged = 0
+
+    @staticmethod
+    def _digest(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def assign(self, records) -> list:
+        """record_id of each entry of the next batch of the file."""
+        import numpy as np
+        if not records:
+            return []
+        keys = [content_key(record) for record in records]
+        digests = np.fromiter((self._digest(key) for key in keys), dtype=np.uint64, count=len(keys))
+        seen = self._seen
+        where = np.minimum(np.searchsorted(seen, digests), max(len(seen) - 1, 0))
+        present = seen[where] == digests if len(seen) else np.zeros(len(digests), dtype=bool)
+        unique, counts = np.unique(digests, return_counts=True)
+
+        # Only digests seen before, or repeated within the batch, need counting
+        occurrences = [0] * len(keys)
+        counting = {}
+        for i in np.flatnonzero(present | np.isin(digests, unique[counts > 1])).tolist():
+            digest = int(digests[i])
+            count = counting.get(digest)
+            if count is None:
+                count = self._repeats.get(digest, 1) if present[i] else 0
+            occurrences[i] = count
+            counting[digest] = count + 1
+        self._repeats.update((digest, count) for digest, count in counting.items() if count > 1)
+        new = unique[~np.isin(unique, seen)]
+        self._seen = np.insert(seen, np.searchsorted(seen, new), new)
+        if self._checkpointed:
+            self._taken.append(digests)
+
+        self.entries += len(keys)
+        self.repeated += sum(1 for occurrence in occurrences if occurrence)
+        return [_hash_id(self.source_file, key, occurrence) for key, occurrence in zip(keys, occurrences)]
+
+    def take_digests(self) -> bytes:
+        """Digests of the entries assigned since the last call, for `restore`."""
+        import numpy as np
+        taken = np.concatenate(self._taken) if self._taken else np.empty(0, dtype=np.uint64)
+        self._taken = []
+        return taken.astype('<u8').tobytes()
+
+    def restore(self, digest_blobs):
+        """Counts of the entries of earlier batches (take_digests of each), e.g. of a job's committed chunks."""
+        import numpy as np
+        blobs = [np.frombuffer(blob, dtype='<u8') for blob in digest_blobs]
+        if not blobs:
+            return self
+        seen, counts = np.unique(np.concatenate([self._seen] + blobs).astype(np.uint64), return_counts=True)
+        self._seen = seen
+        self._repeats = {int(digest): int(count) for digest, count in zip(seen[counts > 1], counts[counts > 1])}
+        return self
+
+    def stats(self) -> dict:
+        return {
+            'entries': self.entries,
+            'repeated_entries': self.repeated,
+            'existing_checked': self.checked,
+            'unchanged_skipped': self.unchanged
+        }
+
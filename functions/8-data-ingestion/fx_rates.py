@@ -0,0 +1,151 @@
+# FX Rates - date-indexed conversion rates to GEL, cached across warm invocations
+
+import bisect
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FX_CACHE_TTL_SEC = float(os.environ.get('FX_RATES_CACHE_TTL_SEC', '3600'))
+
+# One document per currency and day: {currency: 'USD', date: 'YYYY-MM-DD', rate: GEL per unit}
+FX_COLLECTION = 'fx_rates'
+# Marker document bumped by every writer of `fx_rates`
+VERSION_COLLECTION = 'system_config'
+VERSION_DOCUMENT = 'fx_rates_version'
+
+BASE_CURRENCY = 'GEL'
+# Used for a currency with no loaded history (the former flat rates)
+FALLBACK_RATES = {'USD': 2.7, 'EUR': 3.0}
+
+
+class RateTable:
+    """
+    Rate history per currency as parallel sorted arrays of ISO dates and
+    rates. A transaction converts at the latest rate on or before its date
+    (the earliest rate for dates before the history starts), found by binary
+    search: O(log n) per row and no I/O. ISO dates sort as strings, so
+    normalized row dates are looked up as they are.
+    """
+
+    def __init__(self, history=None, fallback=None):
+        self._series = {}
+        self._arrays = {}
+        for currency, points in (history or {}).items():
+            points = sorted((str(date), float(rate)) for date, rate in points)
+            if points:
+                dates, rates = zip(*points)
+                currency = str(currency).upper()
+                self._series[currency] = (list(dates), list(rates))
+                self._arrays[currency] = (np.array(dates, dtype='U10'), np.array(rates, dtype=float))
+        self._fallback = dict(FALLBACK_RATES if fallback is None else fallback)
+
+    def __len__(self):
+        return sum(len(dates) for dates, _ in self._series.values())
+
+    def currencies(self) -> list:
+        return sorted(self._series)
+
+    def rate(self, currency, date) -> float:
+        """GEL per unit of `currency` on `date` (ISO string)."""
+        currency = str(currency).upper()
+        series = self._series.get(currency)
+        if series is None:
+            return 1.0 if currency == BASE_CURRENCY else self._fallback.get(currency, 1.0)
+        dates, rates = series
+        return rates[max(bisect.bisect_right(dates, str(date)) - 1, 0)]
+
+    def rates(self, currencies: np.ndarray, dates: np.ndarray) -> np.ndarray:
+        """Vectorized rate(): one searchsorted per distinct currency over fixed-width date strings."""
+        codes, uniques = pd.factorize(currencies)
+        dates = np.asarray(dates).astype('U10')
+        result = np.ones(len(codes), dtype=float)
+        for code, currency in enumerate(uniques):
+            mask = codes == code
+            currency = str(currency).upper()
+            arrays = self._arrays.get(currency)
+            if arrays is None:
+                result[mask] = 1.0 if currency == BASE_CURRENCY else self._fallback.get(currency, 1.0)
+                continue
+            series_dates, series_rates = arrays
+            index = np.searchsorted(series_dates, dates[mask], side='right') - 1
+            result[mask] = series_rates[np.maximum(index, 0)]
+        return result
+
+    def stats(self) -> dict:
+        return {
+            currency: {'points': len(dates), 'first': dates[0], 'last': dates[-1]}
+            for currency, (dates, _) in sorted(self._series.items())
+        }
+
+
+class FxRatesCache:
+    """
+    Warm-instance cache of the RateTable, the same way MappingRulesCache
+    keeps the rules: each `get` reads only the version marker, and the
+    history is reloaded when the marker changes or the TTL runs out.
+    `table()` returns the current table without any read (workers, hot loops).
+    """
+
+    def __init__(self, load_history, read_version, ttl_sec: float = FX_CACHE_TTL_SEC, clock=time.monotonic):
+        self._load_history = load_history
+        self._read_version = read_version
+        self._ttl_sec = ttl_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._table = RateTable()
+        self._version = None
+        self._loaded = False
+        self._loaded_at = 0.0
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self) -> RateTable:
+        try:
+            version = self._read_version()
+        except Exception as e:
+            logger.error(f"FX rates version check failed: {e}")
+            version = self._version
+
+        with self._lock:
+            fresh = self._clock() - self._loaded_at < self._ttl_sec
+            if self._loaded and fresh and version == self._version:
+                self.hits += 1
+                return self._table
+
+            self.misses += 1
+            try:
+                history = self._load_history()
+            except Exception as e:
+                logger.error(f"Error loading FX rates: {e}")
+                # Keep converting with the last table (or the fallback rates)
+                return self._table
+
+            self._table = RateTable(history)
+            self._version = version
+            self._loaded = True
+            self._loaded_at = self._clock()
+            logger.info(f"FX rates cache refreshed: {len(self._table)} rates for {self._table.currencies()}, version={version}")
+            return self._table
+
+    def table(self) -> RateTable:
+        return self._table
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'version': self._version,
+            'rates': len(self._table)
+        }
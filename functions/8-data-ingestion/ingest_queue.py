@@ -0,0 +1,97 @@
+# Ingestion Queue - async ingestion work items on Pub/Sub, with an in-process stand-in
+
+import base64
+import collections
+import json
+import logging
+import os
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ID = os.environ.get('GCP_PROJECT') or os.environ.get('GOOGLE_CLOUD_PROJECT')
+INGEST_TOPIC = os.environ.get('INGEST_TOPIC', 'ingestion-jobs')
+# Seconds to wait for Pub/Sub to acknowledge a publish before answering the upload
+PUBLISH_TIMEOUT_SEC = 30
+# A worker invocation stops taking new chunks after this long (its timeout is 540 s) and re-queues the rest
+WORKER_TIME_BUDGET_SEC = float(os.environ.get('INGEST_WORKER_TIME_BUDGET_SEC', '480'))
+# In-process queue instead of Pub/Sub (tests, local runs)
+USE_LOCAL_QUEUE = os.environ.get('INGEST_LOCAL_QUEUE') == '1'
+
+
+def encode_message(message: dict) -> bytes:
+    return json.dumps(message, sort_keys=True).encode('utf-8')
+
+
+def decode_event(event) -> dict:
+    """The work item of a Pub/Sub CloudEvent (base64 JSON, as published by encode_message)."""
+    return json.loads(base64.b64decode(event.data.message.data).decode('utf-8'))
+
+
+class PubSubPublisher:
+    """Publishes work items to INGEST_TOPIC; the client is created on first use."""
+
+    def __init__(self, topic_id: str = INGEST_TOPIC, project_id: str = PROJECT_ID):
+        self._topic_id = topic_id
+        self._project_id = project_id
+        self._client = None
+        self._topic_path = None
+
+    def publish(self, message: dict) -> str:
+        if self._client is None:
+            from google.cloud import pubsub_v1
+            self._client = pubsub_v1.PublisherClient()
+            self._topic_path = self._client.topic_path(self._project_id, self._topic_id)
+        # Wait for the ack: the upload is only reported as queued once the message is durable
+        return self._client.publish(self._topic_path, encode_message(message)).result(timeout=PUBLISH_TIMEOUT_SEC)
+
+
+class LocalQueue:
+    """
+    In-process stand-in for the Pub/Sub topic. Published messages wait in
+    FIFO order until `drain(handler)` delivers them, including messages the
+    handler publishes while draining (a worker re-queuing the rest of a job).
+    Messages go through the same JSON encoding as on Pub/Sub.
+    """
+
+    def __init__(self):
+        self._messages = collections.deque()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._messages)
+
+    def publish(self, message: dict) -> str:
+        message_id = uuid.uuid4().hex
+        with self._lock:
+            self._messages.append((message_id, encode_message(message)))
+        return message_id
+
+    def drain(self, handler, limit: int = None) -> int:
+        """Delivers queued messages to `handler(message)` until the queue is empty; returns how many."""
+        delivered = 0
+        while limit is None or delivered < limit:
+            with self._lock:
+                if not self._messages:
+                    break
+                message_id, data = self._messages.popleft()
+            logger.info(f"Delivering local message {message_id}")
+            handler(json.loads(data.decode('utf-8')))
+            delivered += 1
+        return delivered
+
+
+local_queue = LocalQueue()
+_publisher = None
+
+
+def get_publisher():
+    """The Pub/Sub publisher, or the local queue when INGEST_LOCAL_QUEUE=1."""
+    global _publisher
+    if USE_LOCAL_QUEUE:
+        return local_queue
+    if _publisher is None:
+        _publisher = PubSubPublisher()
+    return _publisher
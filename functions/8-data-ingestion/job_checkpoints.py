@@ -0,0 +1,154 @@
+# Ingestion Job Checkpoints - resumable row-range progress in `file_processing_logs`
+
+import hashlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+JOB_COLLECTION = 'file_processing_logs'
+JOB_CHUNK_ROWS = int(os.environ.get('INGEST_JOB_CHUNK_ROWS', '5000'))
+# Stop taking new chunks well before the 300 s function timeout
+JOB_TIME_BUDGET_SEC = float(os.environ.get('INGEST_JOB_TIME_BUDGET_SEC', '240'))
+# Entry digests of each committed chunk, in `file_processing_logs/{job_id}/row_digests`
+DIGEST_COLLECTION = 'row_digests'
+# Firestore documents are capped at 1 MiB; a larger chunk's digests are split
+DIGEST_DOC_BYTES = 900_000
+
+STATUS_QUEUED = 'queued'
+STATUS_PROCESSING = 'processing'
+STATUS_COMPLETED = 'completed'
+STATUS_LOCKED = 'locked'
+# Stopped at a locked period after earlier chunks were stored
+STATUS_PARTIAL = 'partially_ingested'
+STATUS_FAILED = 'failed'
+
+
+def job_id_for(bucket_name: str, storage_path: str, generation=None) -> str:
+    """Stable job id for one version of a storage object, so retries find their checkpoint."""
+    key = f"{bucket_name or ''}/{storage_path}#{generation or ''}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+
+
+class JobCheckpoint:
+    """
+    Progress of one chunked ingestion job, stored in `file_processing_logs/{job_id}`.
+    `rows_committed` is the raw-row offset up to which every ledger entry is
+    durably written; a resumed invocation skips that many rows. Entry ids are
+    content hashes (see store_data), so a chunk replayed after a crash between
+    its commit and its checkpoint overwrites itself instead of duplicating.
+    The digests of each chunk's entries (dedup.RecordIds) are saved with its
+    checkpoint; `row_digests` reads those of the committed rows back.
+    `progress(rows_committed)`, if given, adds an estimate of the job's
+    progress ({'progress': share done, 'rows_total': ...}) to every save.
+    `row_offset(rows_committed)`, if set (CSV, see csv_reader), records the
+    byte offset of the committed rows as `raw_bytes_committed`, so the next
+    invocation reads on from there instead of re-parsing the skipped rows.
+    """
+
+    def __init__(self, doc_ref, job_id: str, filename: str, time_budget_sec: float = JOB_TIME_BUDGET_SEC,
+                 clock=time.monotonic, progress=None):
+        self._doc_ref = doc_ref
+        self.job_id = job_id
+        self.filename = filename
+        self._time_budget_sec = time_budget_sec
+        self._clock = clock
+        self._started_at = clock()
+        self._progress = progress
+        self.row_offset = None
+
+        self.status = STATUS_PROCESSING
+        self.rows_committed = 0
+        self.bytes_committed = None
+        self.chunks_committed = 0
+        self.invocations = 0
+        self._summary = {}
+
+    def load(self):
+        """Reads the saved progress; a missing document starts the job at row 0."""
+        doc = self._doc_ref.get()
+        data = doc.to_dict() if doc.exists else {}
+        self.status = data.get('status', STATUS_PROCESSING)
+        self.rows_committed = data.get('raw_rows_committed', 0)
+        self.bytes_committed = data.get('raw_bytes_committed')
+        self.chunks_committed = data.get('chunks_committed', 0)
+        self.invocations = data.get('invocations', 0) + 1
+        self._summary = {
+            'rows_processed': data.get('rows_processed', 0),
+            'unique_raw_rows': self.rows_committed,
+            'total_value_gel': data.get('total_value_gel', 0.0),
+            'columns': data.get('columns', [])
+        }
+        if self.rows_committed:
+            logger.info(f"Resuming job {self.job_id} at raw row {self.rows_committed} (invocation {self.invocations})")
+        return self
+
+    @property
+    def completed(self) -> bool:
+        return self.status == STATUS_COMPLETED
+
+    def summary(self) -> dict:
+        """Totals of the rows already committed by earlier invocations."""
+        return dict(self._summary)
+
+    def commit(self, summary: dict, batch=None, row_digests: bytes = None):
+        """
+        Records a chunk as durable; call only after its writes are flushed.
+        With a write `batch`, the checkpoint (and the chunk's `row_digests`)
+        is added to it for the caller to commit together with other writes
+        of the chunk.
+        """
+        self.rows_committed = summary['unique_raw_rows']
+        if self.row_offset is not None:
+            self.bytes_committed = self.row_offset(self.rows_committed)
+        self.chunks_committed += 1
+        self.status = STATUS_PROCESSING
+        if row_digests:
+            for part, start in enumerate(range(0, len(row_digests), DIGEST_DOC_BYTES)):
+                doc_ref = self._doc_ref.collection(DIGEST_COLLECTION).document(f"{self.rows_committed:012d}-{part}")
+                data = {'rows_end': self.rows_committed, 'digests': row_digests[start:start + DIGEST_DOC_BYTES]}
+                if batch is not None:
+                    batch.set(doc_ref, data)
+                else:
+                    doc_ref.set(data)
+        self._save(STATUS_PROCESSING, summary, batch=batch)
+
+    def row_digests(self) -> list:
+        """The saved entry digests of the rows up to the checkpoint, one bytes run per document."""
+        docs = (doc.to_dict() for doc in self._doc_ref.collection(DIGEST_COLLECTION).stream())
+        return [doc['digests'] for doc in docs if doc['rows_end'] <= self.rows_committed]
+
+    def finish(self, status: str, summary: dict = None, error: str = None):
+        self.status = status
+        self._save(status, summary, error)
+
+    def should_stop(self) -> bool:
+        return self._clock() - self._started_at >= self._time_budget_sec
+
+    def _save(self, status: str, summary: dict = None, error: str = None, batch=None):
+        from google.cloud import firestore
+
+        data = {
+            'status': status,
+            'file_name': self.filename,
+            'raw_rows_committed': self.rows_committed,
+            'raw_bytes_committed': self.bytes_committed,
+            'chunks_committed': self.chunks_committed,
+            'invocations': self.invocations,
+            'timestamp': firestore.SERVER_TIMESTAMP
+        }
+        if summary is not None:
+            data['rows_processed'] = summary['rows_processed']
+            data['total_value_gel'] = summary['total_value_gel']
+            data['columns'] = summary['columns']
+        if status == STATUS_COMPLETED:
+            data.update(rows_total=self.rows_committed, progress=1.0)
+        elif self._progress is not None:
+            data.update(self._progress(self.rows_committed))
+        if error:
+            data['error'] = error
+        if batch is not None:
+            batch.set(self._doc_ref, data, merge=True)
+        else:
+            self._doc_ref.set(data, merge=True)
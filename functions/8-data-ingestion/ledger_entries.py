@@ -0,0 +1,63 @@
+# Ledger Entries - compact debit/credit legs sharing one mapped row
+
+from collections.abc import Mapping
+
+LEG_FIELDS = ('entry_type', 'account')
+
+
+class LedgerEntry(Mapping):
+    """
+    One leg of a double entry. Both legs point at the same mapped row and
+    keep only their own `entry_type` and `account`, instead of each holding a
+    full copy of the row. Reads like the dict it replaces (same keys, same
+    order, compares equal to it); `to_dict` builds the Firestore document.
+    """
+
+    __slots__ = ('row', 'entry_type', 'account')
+
+    def __init__(self, row: dict, entry_type: str, account: str):
+        self.row = row
+        self.entry_type = entry_type
+        self.account = account
+
+    def __getitem__(self, key):
+        if key == 'entry_type':
+            return self.entry_type
+        if key == 'account':
+            return self.account
+        return self.row[key]
+
+    def __iter__(self):
+        yield from self.row
+        for key in LEG_FIELDS:
+            if key not in self.row:
+                yield key
+
+    def __len__(self):
+        return len(self.row) + sum(1 for key in LEG_FIELDS if key not in self.row)
+
+    def __contains__(self, key):
+        return key in LEG_FIELDS or key in self.row
+
+    def get(self, key, default=None):
+        if key == 'entry_type':
+            return self.entry_type
+        if key == 'account':
+            return self.account
+        return self.row.get(key, default)
+
+    def to_dict(self) -> dict:
+        document = self.row.copy()
+        document['entry_type'] = self.entry_type
+        document['account'] = self.account
+        return document
+
+    def __repr__(self):
+        return f"LedgerEntry({self.to_dict()!r})"
+
+
+def to_document(record) -> dict:
+    """Fresh dict for a Firestore write, from a LedgerEntry or a plain record."""
+    if isinstance(record, LedgerEntry):
+        return record.to_dict()
+    return dict(record)
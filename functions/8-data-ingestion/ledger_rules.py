@@ -0,0 +1,57 @@
+# Ledger Rules - per-value company, category, department and account rules
+#
+# Shared by the row path (main.apply_mapping, generate_ledger_entries_for_row)
+# and the columnar path (columnar.py), which applies them once per distinct
+# value, so both produce the same ledger.
+
+# category -> (debit account, credit account); None means "use sub_category"
+LEDGER_ACCOUNTS = {
+    'Revenue': ('Accounts Receivable', None),
+    'Expenses': (None, 'Accounts Payable'),
+    'COGS': (None, 'Accounts Payable'),
+    'Assets': (None, 'Cash'),
+    'Liabilities': ('Cash', None),
+}
+DEFAULT_ACCOUNTS = ('Unmapped', 'Suspense Account')
+
+
+def company_from_entities(entity_vals) -> str:
+    """Company from the string values of the entity-like columns."""
+    company_id = 'SGG-001' # Default
+    entity_str = " ".join(entity_vals)
+    if any(x in entity_str for x in ['Export', 'SOG', 'SGG-002']): company_id = 'SGG-002'
+    elif any(x in entity_str for x in ['Telav', 'SGG-003']): company_id = 'SGG-003'
+    return company_id
+
+
+def fallback_category(gl: str, desc: str) -> tuple:
+    """
+    (category, sub_category) from the GL prefix, for rows no mapping rule
+    matched. `gl` is stripped, `desc` lower-cased.
+    """
+    if gl.startswith('4'):
+        if 'social' in desc or '4001' in gl:
+            return 'Revenue', 'Social Gas Sales'
+        return 'Revenue', 'Other Revenue'
+    if gl.startswith('5'):
+        if 'cost' in desc and 'social' in desc:
+            return 'COGS', 'Cost of Social Gas'
+        return 'Expenses', 'Operating Expenses'
+    if gl.startswith('1'): return 'Assets', 'Current Assets'
+    if gl.startswith('2'): return 'Liabilities', 'Current Liabilities'
+    if gl.startswith('3'): return 'Equity', 'Retained Earnings'
+    return 'Unmapped', 'Unmapped'
+
+
+def department_name(value) -> str:
+    dept = str(value).lower()
+    if 'tech' in dept: return 'Technical Department'
+    if 'fin' in dept: return 'Finance Department'
+    if 'ops' in dept or 'oper' in dept: return 'Operations Department'
+    return 'General'
+
+
+def ledger_accounts(category, sub_category) -> tuple:
+    """(debit account, credit account) of a mapped row."""
+    debit, credit = LEDGER_ACCOUNTS.get(category, DEFAULT_ACCOUNTS)
+    return (sub_category if debit is None else debit), (sub_category if credit is None else credit)
@@ -4,10 +4,34 @@ import logging
 import csv
 import io
 import datetime
-from firebase_functions import https_fn, options
+import itertools
+import functools
+import hashlib
+import uuid
+from firebase_functions import https_fn, options, pubsub_fn
 from werkzeug.utils import secure_filename
 import firebase_admin
 from firebase_admin import credentials, initialize_app
+import rule_matcher
+import rules_cache
+import bulk_writer
+import period_locks
+import xlsx_reader
+import job_checkpoints
+import dedup
+import column_plan
+import ledger_entries
+import manifest
+import pdf_pages
+import blob_stream
+import date_normalizer
+import fx_rates
+import stage_metrics
+import ingest_queue
+import warehouse_sink
+import metric_aggregates
+import ledger_rules
+import csv_reader
 
 # Initialize Logging
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +44,28 @@ if not firebase_admin._apps:
 # Lazy Global for Firestore
 db = None
 
+# Column names that identify a ledger sheet (header detection and validation)
+DATE_COLUMNS = ['date', 'doc_date', 'document_date', 'posting_date', 'day']
+AMOUNT_COLUMNS = ['amount', 'value', 'amount_gel', 'dmbtr', 'balance', 'turnover']
+
+# Streaming mode: raw rows held in memory at any one time
+STREAM_CHUNK_ROWS = int(os.environ.get('INGEST_STREAM_CHUNK_ROWS', '2000'))
+# Entry documents read per get_all when store_data looks for already stored entries
+EXISTENCE_CHECK_DOCS = int(os.environ.get('INGEST_EXISTENCE_CHECK_DOCS', '1000'))
+
+class PeriodLockedError(Exception):
+    """
+    Raised by the streaming path when a row targets a locked period. Chunks
+    before it may already be stored: `rows_committed` ledger entries from the
+    first `raw_rows_committed` raw rows.
+    """
+    def __init__(self, company_id: str, period: str, rows_committed: int = 0, raw_rows_committed: int = 0):
+        super().__init__(f"Governance Violation: Period {period} is LOCKED for {company_id}.")
+        self.company_id = company_id
+        self.period = period
+        self.rows_committed = rows_committed
+        self.raw_rows_committed = raw_rows_committed
+
 def get_db():
     global db
     if db is None:
@@ -27,21 +73,35 @@ def get_db():
         db = firestore.Client()
     return db
 
+def fetch_period_locks(contexts) -> dict:
+    """
+    Reads the `period_controls` documents of many (company_id, period) pairs
+    with one `get_all` round trip. Returns {(company_id, period): locked}.
+    """
+    db_client = get_db()
+    collection = db_client.collection(period_locks.LOCK_COLLECTION)
+    by_id = {period_locks.lock_document_id(*context): context for context in contexts}
+    refs = [collection.document(doc_id) for doc_id in by_id]
+
+    states = dict.fromkeys(by_id.values(), False)
+    for doc in db_client.get_all(refs):
+        if doc.exists and doc.id in by_id:
+            states[by_id[doc.id]] = doc.to_dict().get('status') == 'Locked'
+    return states
+
+# Warm-instance cache of period lock states (short TTL)
+period_lock_cache = period_locks.PeriodLockCache(fetch_period_locks)
+
+def find_locked_periods(contexts) -> list:
+    """Locked (company_id, period) pairs among `contexts`, resolved in one batch."""
+    return period_lock_cache.locked(contexts)
+
 def check_period_lock(company_id: str, period: str) -> bool:
     """
     Checks if a financial period is 'Locked' by the CFO.
     Period format: YYYY-MM
     """
-    try:
-        db_client = get_db()
-        lock_ref = db_client.collection('period_controls').document(f"{company_id}_{period}")
-        doc = lock_ref.get()
-        if doc.exists:
-            return doc.to_dict().get('status') == 'Locked'
-        return False
-    except Exception as e:
-        logger.error(f"Lock Check Error: {e}")
-        return False
+    return bool(find_locked_periods([(company_id, period)]))
 
 def log_audit_event(user_id: str, action: str, details: dict):
     """
@@ -66,175 +126,998 @@ def validate_data(rows) -> bool:
     # Normalize keys of the first row to check for existence
     first_row_keys = [k.lower().strip().replace(' ', '_') for k in rows[0].keys()]
     
-    has_date = any(col in first_row_keys for col in ['date', 'doc_date', 'document_date', 'posting_date', 'day'])
-    has_amount = any(col in first_row_keys for col in ['amount', 'value', 'amount_gel', 'dmbtr', 'balance', 'turnover'])
+    has_date = any(col in first_row_keys for col in DATE_COLUMNS)
+    has_amount = any(col in first_row_keys for col in AMOUNT_COLUMNS)
     
     if not has_date or not has_amount:
          logger.warning(f"Validation Soft-Fail: Missing crucial date/amount columns. Found: {list(first_row_keys)}")
          return True 
     return True
 
+def fetch_mapping_rules():
+    """Stream the full `mapping_rules` collection (raises on Firestore errors)"""
+    mapping_dict = {}
+    db_client = get_db()
+    rules_ref = db_client.collection('mapping_rules')
+    rules_docs = rules_ref.stream()
+    
+    for doc in rules_docs:
+        data = doc.to_dict()
+        if 'rawField' in data and 'targetField' in data:
+            mapping_dict[data['rawField'].lower()] = data['targetField']
+            
+    logger.info(f"Loaded {len(mapping_dict)} mapping rules from Firestore.")
+    return mapping_dict
+
 def get_mapping_rules():
     """Fetch Mapping Rules from Firestore"""
-    mapping_dict = {}
     try:
-        db_client = get_db()
-        rules_ref = db_client.collection('mapping_rules')
-        rules_docs = rules_ref.stream()
-        
-        for doc in rules_docs:
-            data = doc.to_dict()
-            if 'rawField' in data and 'targetField' in data:
-                mapping_dict[data['rawField'].lower()] = data['targetField']
-                
-        logger.info(f"Loaded {len(mapping_dict)} mapping rules from Firestore.")
+        return fetch_mapping_rules()
     except Exception as e:
         logger.error(f"Error loading mapping rules: {e}")
-    return mapping_dict
+        return {}
 
-def map_row(row, mapping_dict):
-    """Refactored logic for processing a single row dict"""
-    # Normalize keys first
-    norm_row = {k.lower().strip().replace(' ', '_'): v for k, v in row.items()}
-    
+def read_mapping_rules_version():
+    """Single-document read of the marker bumped whenever mapping rules change"""
+    doc = get_db().collection(rules_cache.VERSION_COLLECTION).document(rules_cache.VERSION_DOCUMENT).get()
+    if not doc.exists:
+        return None
+    data = doc.to_dict()
+    return data.get('version', data.get('updatedAt'))
+
+# Warm-instance cache of the compiled mapping rules
+mapping_rules_cache = rules_cache.MappingRulesCache(fetch_mapping_rules, read_mapping_rules_version)
+
+def fetch_fx_rates():
+    """Stream the full `fx_rates` history as {currency: [(date, rate), ...]} (raises on Firestore errors)"""
+    history = {}
+    for doc in get_db().collection(fx_rates.FX_COLLECTION).stream():
+        data = doc.to_dict()
+        if 'currency' in data and 'date' in data and 'rate' in data:
+            history.setdefault(str(data['currency']).upper(), []).append((str(data['date'])[:10], float(data['rate'])))
+    logger.info(f"Loaded FX rates for {len(history)} currencies from Firestore.")
+    return history
+
+def read_fx_rates_version():
+    """Single-document read of the marker bumped whenever FX rates change"""
+    doc = get_db().collection(fx_rates.VERSION_COLLECTION).document(fx_rates.VERSION_DOCUMENT).get()
+    if not doc.exists:
+        return None
+    data = doc.to_dict()
+    return data.get('version', data.get('updatedAt'))
+
+# Warm-instance cache of the FX rate table
+fx_rates_cache = fx_rates.FxRatesCache(fetch_fx_rates, read_fx_rates_version)
+
+def date_or_today(date_val) -> str:
+    if not date_val:
+        date_val = datetime.date.today().isoformat()
+    return str(date_val)
+
+def plan_lock_contexts(plan, rows) -> set:
+    """
+    (company_id, YYYY-MM) contexts the row tuples laid out by `plan` will be
+    posted to, using only the cheap company/date steps of map_values so locks
+    can be checked before mapping.
+    """
+    entity, date = plan.entity, plan.date
+    return {
+        (ledger_rules.company_from_entities([str(values[i]) for i in entity]), date_or_today(plan.value(values, date, ''))[:7])
+        for values in rows
+    }
+
+def map_values(plan, values, mapping_dict, fx_table=None):
+    """Maps a row tuple: the ColumnPlan already resolved every alias to an index."""
+    value = plan.value
+    return apply_mapping(
+        plan.normalize(values),
+        [str(values[i]) for i in plan.entity],
+        value(values, plan.gl, ''),
+        value(values, plan.desc, ''),
+        value(values, plan.department, ''),
+        value(values, plan.date, ''),
+        value(values, plan.amount, 0),
+        value(values, plan.currency, 'GEL'),
+        mapping_dict,
+        fx_table
+    )
+
+def apply_mapping(norm_row, entity_vals, gl_val, desc_val, dept_val, date_val, amount_val, currency_val, mapping_dict,
+                  fx_table=None):
+    """
+    Mapping steps of map_values, given the raw field values.
+    Amounts convert at the transaction date's rate from `fx_table` (default:
+    the warm fx_rates_cache table, refreshed once per request by its caller).
+    """
     # 1. Company Mapping
-    company_id = 'SGG-001' # Default
-    entity_vals = []
-    for col in ['entity', 'company', 'organization', 'branch', 'sub']:
-        if col in norm_row:
-            entity_vals.append(str(norm_row[col]))
-    
-    entity_str = " ".join(entity_vals)
-    if any(x in entity_str for x in ['Export', 'SOG', 'SGG-002']): company_id = 'SGG-002'
-    elif any(x in entity_str for x in ['Telav', 'SGG-003']): company_id = 'SGG-003'
-    
-    norm_row['company_id'] = company_id
+    norm_row['company_id'] = ledger_rules.company_from_entities(entity_vals)
     
     # 2. Category Mapping
-    gl = str(norm_row.get('gl_account', norm_row.get('gl', ''))).strip()
-    desc = str(norm_row.get('description', norm_row.get('memo', ''))).lower()
-    
-    category = 'Unmapped'
-    sub_category = 'Unmapped'
+    gl = str(gl_val).strip()
+    desc = str(desc_val).lower()
     
     # Priority 1: Dynamic Validation matches
-    mapped = False
-    for raw, target in mapping_dict.items():
-        if raw in desc or (gl and raw == gl):
-            if '>' in target:
-                parts = [p.strip() for p in target.split('>')]
-                category, sub_category = parts[0], parts[1]
-            else:
-                category, sub_category = target, 'General'
-            mapped = True
-            break
-    
+    # (compiled RuleMatcher when the caller built one, plain dict otherwise)
+    if isinstance(mapping_dict, rule_matcher.RuleMatcher):
+        match = mapping_dict.match(desc, gl)
+    else:
+        match = rule_matcher.match_linear(mapping_dict, desc, gl)
+
     # Priority 2: Hardcoded Fallback
-    if not mapped:
-        if gl.startswith('4'):
-            if 'social' in desc or '4001' in gl: 
-                category, sub_category = 'Revenue', 'Social Gas Sales'
-            else:
-                category, sub_category = 'Revenue', 'Other Revenue'
-        elif gl.startswith('5'):
-            if 'cost' in desc and 'social' in desc: 
-                category, sub_category = 'COGS', 'Cost of Social Gas'
-            else:
-                category, sub_category = 'Expenses', 'Operating Expenses'
-        elif gl.startswith('1'): category, sub_category = 'Assets', 'Current Assets'
-        elif gl.startswith('2'): category, sub_category = 'Liabilities', 'Current Liabilities'
-        elif gl.startswith('3'): category, sub_category = 'Equity', 'Retained Earnings'
-    
-    norm_row['category'] = category
-    norm_row['sub_category'] = sub_category
+    if match is None:
+        match = ledger_rules.fallback_category(gl, desc)
+
+    norm_row['category'], norm_row['sub_category'] = match
     
     # 3. Department
-    dept = str(norm_row.get('department', '')).lower()
-    if 'tech' in dept: norm_row['department'] = 'Technical Department'
-    elif 'fin' in dept: norm_row['department'] = 'Finance Department'
-    elif 'ops' in dept or 'oper' in dept: norm_row['department'] = 'Operations Department'
-    else: norm_row['department'] = 'General'
+    norm_row['department'] = ledger_rules.department_name(dept_val)
     
     # 4. Date & Amount Normalization
     # Date
-    date_val = norm_row.get('date', '')
-    if not date_val:
-        date_val = datetime.date.today().isoformat()
-    norm_row['date'] = str(date_val)
+    norm_row['date'] = date_or_today(date_val)
     
     # Amount
     try:
-        raw_amt = float(norm_row.get('amount', 0))
+        raw_amt = float(amount_val)
     except (ValueError, TypeError):
         raw_amt = 0.0
         
-    currency = str(norm_row.get('currency', 'GEL')).upper()
-    rate = 2.7 if currency == 'USD' else (3.0 if currency == 'EUR' else 1.0)
-    norm_row['amount_gel'] = raw_amt * rate
+    if fx_table is None:
+        fx_table = fx_rates_cache.table()
+    norm_row['amount_gel'] = raw_amt * fx_table.rate(currency_val, norm_row['date'])
     
     return norm_row
 
 def generate_ledger_entries_for_row(row):
-    """Generates Double-Entry Ledger Rows (Debit/Credit) for a single transformed row"""
-    cat = row.get('category', 'Unmapped')
-    sub = row.get('sub_category', 'General')
-    
-    base_txn = row.copy()
-    
-    debit_entry = base_txn.copy()
-    credit_entry = base_txn.copy()
-    
-    debit_entry['entry_type'] = 'Debit'
-    credit_entry['entry_type'] = 'Credit'
-    
-    if cat == 'Revenue':
-        credit_entry['account'] = sub 
-        debit_entry['account'] = 'Accounts Receivable'
-    elif cat in ['Expenses', 'COGS']:
-        debit_entry['account'] = sub 
-        credit_entry['account'] = 'Accounts Payable'
-    elif cat == 'Assets':
-        debit_entry['account'] = sub
-        credit_entry['account'] = 'Cash' 
-    elif cat == 'Liabilities':
-        credit_entry['account'] = sub
-        debit_entry['account'] = 'Cash' 
-    else: 
-        debit_entry['account'] = 'Unmapped'
-        credit_entry['account'] = 'Suspense Account'
-
-    return [debit_entry, credit_entry]
-
-
-def store_data(records, filename: str):
-    # Store in Firestore 'financial_transactions' collection
+    """
+    Generates Double-Entry Ledger Rows (Debit/Credit) for a single transformed row.
+    Both legs share `row` (compact LedgerEntry); the caller must not mutate it afterwards.
+    """
+    debit_account, credit_account = ledger_rules.ledger_accounts(
+        row.get('category', 'Unmapped'), row.get('sub_category', 'General'))
+
+    return [
+        ledger_entries.LedgerEntry(row, 'Debit', debit_account),
+        ledger_entries.LedgerEntry(row, 'Credit', credit_account)
+    ]
+
+def document_columns(record) -> list:
+    """Field names of the Firestore document store_data writes for `record`."""
+    columns = list(record.keys())
+    return columns + [f for f in ('source_file', 'ingested_at') if f not in columns]
+
+
+def stored_documents(client, doc_refs) -> dict:
+    """Data of those of `doc_refs` that already exist, by document id, read EXISTENCE_CHECK_DOCS per get_all."""
+    stored = {}
+    for start in range(0, len(doc_refs), EXISTENCE_CHECK_DOCS):
+        for snapshot in client.get_all(doc_refs[start:start + EXISTENCE_CHECK_DOCS]):
+            if snapshot.exists:
+                stored[snapshot.id] = snapshot.to_dict()
+    return stored
+
+
+def store_data(records, filename: str, writer=None, ids=None, sink=None, aggregates=None) -> dict:
+    """
+    Store in Firestore 'financial_transactions' collection.
+    Document ids hash the file, the entry's content and how many identical
+    entries came before it in the file (dedup.RecordIds; pass the file's
+    shared `ids` when it is stored over several calls, in file order), so
+    re-ingesting a file overwrites its entries instead of duplicating them.
+    Entries already stored with the same fields (an unchanged re-upload, a
+    replayed job chunk) are found by a get_all of the batch and not written
+    again.
+    Commits run concurrently through a BulkWriter; pass a shared `writer` to
+    keep commits in flight across several calls (the caller then closes it).
+    Written entries are also buffered into the warehouse `sink`, if given
+    (warehouse_sink.WarehouseSink, closed by the caller), and all entries are
+    counted into the metric `aggregates` (metric_aggregates.MetricAggregates,
+    flushed by the caller once the writes are committed).
+    Returns the writer's throughput stats.
+    """
     from google.cloud import firestore
     
     client = get_db()
-    batch = client.batch()
     collection_ref = client.collection('financial_transactions')
+    owns_writer = writer is None
+    if owns_writer:
+        writer = bulk_writer.BulkWriter(client)
+    if ids is None:
+        ids = dedup.RecordIds(filename)
     
-    count = 0
-    for record in records:
-        record['source_file'] = filename
-        record['ingested_at'] = firestore.SERVER_TIMESTAMP
-        
-        doc_id = str(record.get('transaction_id', ''))
-        if doc_id and doc_id != 'nan':
-            doc_ref = collection_ref.document(doc_id)
-        else:
-            doc_ref = collection_ref.document()
-            
-        batch.set(doc_ref, record)
-        count += 1
-        
-        if count >= 400:
-            batch.commit()
-            batch = client.batch()
-            count = 0
-            
-    if count > 0:
-        batch.commit()
+    try:
+        records = list(records)
+        doc_ids = ids.assign(records)
+        doc_refs = [collection_ref.document(doc_id) for doc_id in doc_ids]
+        stored = stored_documents(client, doc_refs)
+        ids.checked += len(doc_refs)
+        written = []
+        for record, doc_id, doc_ref in zip(records, doc_ids, doc_refs):
+            # Documents are materialised one batch at a time, not for the whole ledger
+            document = ledger_entries.to_document(record)
+            document['source_file'] = filename
+            current = stored.get(doc_id)
+            if current is not None:
+                current.pop('ingested_at', None)
+                if current == document:
+                    ids.unchanged += 1
+                    continue
+
+            document['ingested_at'] = firestore.SERVER_TIMESTAMP
+            writer.set(doc_ref, document)
+            written.append((record, doc_id))
+        if sink is not None and written:
+            sink.add([record for record, _ in written], [doc_id for _, doc_id in written], filename)
+        if aggregates is not None and records:
+            aggregates.add(records, filename)
+    finally:
+        if owns_writer:
+            writer.close()
+
+    stats = writer.stats()
+    stats['dedup'] = ids.stats()
+    if owns_writer:
+        logger.info(f"Stored {stats['rows_written']} records from {filename}: {stats}")
+    return stats
+
+def is_header_row(cells) -> bool:
+    """True for a row naming both a date and an amount column."""
+    names = [str(c).lower().strip().replace(' ', '_') for c in cells]
+    return any(col in names for col in DATE_COLUMNS) and any(col in names for col in AMOUNT_COLUMNS)
+
+def iter_xlsx_records(file_stream, as_tuples: bool = False):
+    """
+    Rows of the active sheet as dicts keyed by the header row (or tuples in
+    header order), streamed with openpyxl read-only mode. The header may sit
+    below a title block.
+    """
+    return xlsx_reader.XlsxRecordReader(file_stream, is_header=is_header_row, as_tuples=as_tuples)
+
+def iter_csv_rows(file_stream):
+    """(ColumnPlan, lazy iterator of row tuples) for a CSV file."""
+    file_stream.seek(0)
+    text_stream = io.TextIOWrapper(file_stream, encoding='utf-8')
+    reader = csv.reader(text_stream)
+    plan = column_plan.plan_for(next(reader, []))
+
+    def rows():
+        width = plan.width
+        for row in reader:
+            if not row:
+                continue # Blank line, skipped like csv.DictReader
+            if len(row) != width:
+                # Short rows padded like csv.DictReader; extra cells have no header and are dropped
+                row = (row + [None] * width)[:width]
+            yield tuple(row)
+
+    return plan, rows()
+
+def read_rows(file_stream, filename: str):
+    """
+    (ColumnPlan, row tuples, parser) for a CSV or Excel upload. The plan is
+    shared by every file with the same header layout; `parser` is the XLSX
+    reader (for parse_stats) or None.
+    """
+    if filename.endswith('.csv'):
+        plan, rows = iter_csv_rows(file_stream)
+        parser = None
+    else:
+        parser = iter_xlsx_records(file_stream, as_tuples=True)
+        rows = iter(parser)
+        first = next(rows, None) # The header is located while reading the first row
+        plan = column_plan.plan_for(parser.headers)
+        if first is not None:
+            rows = itertools.chain([first], rows)
+    logger.info(f"Column plan {plan.fingerprint} for {filename}: {column_plan.cache_stats()}")
+    return plan, rows, parser
+
+def parse_stats(parser):
+    """Throughput of the file parser, when it reports one (XLSX)."""
+    if isinstance(parser, xlsx_reader.XlsxRecordReader):
+        stats = parser.stats()
+        logger.info(f"Parse stats: {stats}")
+        return stats
+    return None
+
+def iter_chunks(iterable, size: int):
+    """Groups any iterable into lists of at most `size` items."""
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def date_normalizer_for(plan):
+    """DateNormalizer for the plan's date column; the detected format is remembered per header layout."""
+    return date_normalizer.DateNormalizer(key=(plan.fingerprint, plan.date))
+
+def normalize_row_dates(plan, rows, dates, batch_rows: int = STREAM_CHUNK_ROWS):
+    """
+    Rewrites the date column of row tuples to ISO dates, one batch at a time
+    (column-at-a-time through `dates`), before lock checks and mapping see
+    them. Rows pass through unchanged when the plan has no date column.
+    """
+    index = plan.date
+    if index is None:
+        yield from rows
+        return
+    for batch in iter_chunks(rows, batch_rows):
+        converted = dates.convert([values[index] for values in batch])
+        for values, date in zip(batch, converted):
+            yield values[:index] + (date,) + values[index + 1:]
+
+def transform_values(plan, rows, mapping_rules) -> list:
+    """Row path over row tuples laid out by `plan` (bind it with functools.partial)."""
+    ledger = []
+    for values in rows:
+        ledger.extend(generate_ledger_entries_for_row(map_values(plan, values, mapping_rules)))
+    return ledger
+
+def transform_frame(frame, mapping_rules) -> list:
+    """Columnar path: vectorized transform of a DataFrame, identical ledger records."""
+    import columnar
+    return columnar.to_records(columnar.transform_frame(frame, mapping_rules, fx_rates_cache.table()))
+
+def frame_lock_contexts(frame) -> set:
+    import columnar
+    return columnar.lock_contexts(frame)
+
+def ingest_chunks(chunks, mapping_rules, filename: str, transform, lock_contexts, checkpoint=None, metrics=None,
+                  source_key: str = None) -> dict:
+    """
+    Streaming ingestion: lock check -> map -> ledger -> store, one chunk at a time.
+    Only the current chunk and its ledger entries are held in memory, so peak
+    usage is bounded by the chunk size rather than by the file size.
+    Chunks are lists of row tuples (transform_values and plan_lock_contexts,
+    bound to the file's ColumnPlan) or DataFrames (transform_frame and
+    frame_lock_contexts).
+    One BulkWriter spans all chunks so commits overlap with mapping the next one.
+    Raises PeriodLockedError before mapping the chunk that touches a locked
+    period; the chunks before it stay stored and the error counts them.
+
+    With a JobCheckpoint, chunks continue after the checkpoint's committed
+    rows, each chunk is flushed and checkpointed before the next one starts,
+    and the loop stops early once the job's time budget is spent
+    (summary['complete'] is then False). A job's metric aggregate deltas are
+    committed in the same batch as each checkpoint (see commit_chunk); other
+    runs flush them once their writes are closed. `source_key` identifies
+    the upload's source to the aggregates (see MetricAggregates).
+    Stage timings go to `metrics`; the parse stage is timed by the caller
+    wrapping `chunks` in metrics.timed('parse', ...).
+    """
+    summary = checkpoint.summary() if checkpoint is not None else {
+        'rows_processed': 0,
+        'unique_raw_rows': 0,
+        'total_value_gel': 0.0,
+        'columns': []
+    }
+    summary['complete'] = True
+    if metrics is None:
+        metrics = stage_metrics.IngestionMetrics(None, filename, None)
+    writer = bulk_writer.BulkWriter(get_db())
+    ids = dedup.RecordIds(filename, checkpointed=checkpoint is not None)
+    if checkpoint is not None and checkpoint.rows_committed:
+        # Identical entries of the committed rows still count towards the occurrences of the rest
+        ids.restore(checkpoint.row_digests())
+    sink = warehouse_sink.open_sink()
+    # A resumed job already replaced the file's previous contribution in its first invocation
+    aggregates = metric_aggregates.MetricAggregates(
+        get_db(), reverse_previous=checkpoint is None or checkpoint.rows_committed == 0, source_key=source_key)
+
+    try:
+        for chunk in chunks:
+            if checkpoint is not None and checkpoint.should_stop():
+                # The rest is picked up by the next invocation from the checkpoint
+                summary['complete'] = False
+                break
+
+            # All months of the chunk resolved in one batch, before any mapping work
+            with metrics.stage('lock_check', rows=len(chunk)):
+                locked = find_locked_periods(lock_contexts(chunk))
+            if locked:
+                raise PeriodLockedError(locked[0][0], locked[0][1], summary['rows_processed'], summary['unique_raw_rows'])
+
+            with metrics.stage('map', rows=len(chunk)):
+                ledger_chunk = transform(chunk, mapping_rules)
+            summary['total_value_gel'] += sum(float(r.get('amount_gel', 0)) for r in ledger_chunk if r.get('entry_type') == 'Debit')
+
+            with metrics.stage('store', rows=len(ledger_chunk)):
+                store_data(ledger_chunk, filename, writer=writer, ids=ids, sink=sink, aggregates=aggregates)
+
+            if not summary['columns'] and ledger_chunk:
+                summary['columns'] = document_columns(ledger_chunk[0])
+            summary['rows_processed'] += len(ledger_chunk)
+            summary['unique_raw_rows'] += len(chunk)
+            logger.info(f"Streamed chunk for {filename}: {summary['unique_raw_rows']} raw rows queued.")
+
+            if checkpoint is not None:
+                with metrics.stage('store'):
+                    writer.flush()
+                    commit_chunk(checkpoint, summary, aggregates, ids)
+    finally:
+        # Commits everything already queued, including when a locked period aborts the run
+        with metrics.stage('store'):
+            writer.close()
+            if sink is not None:
+                sink.close()
+            # A job's deltas only go out with its checkpoints: an uncheckpointed chunk is replayed
+            if checkpoint is None:
+                aggregates.close()
+        metrics.record_writes(writer.stats())
+
+    summary['write_stats'] = writer.stats()
+    summary['write_stats']['dedup'] = ids.stats()
+    summary['write_stats']['warehouse'] = sink.stats() if sink is not None else None
+    summary['write_stats']['aggregates'] = aggregates.stats()
+    logger.info(f"Stored {summary['rows_processed']} records from {filename}: {summary['write_stats']}")
+    logger.info(f"Period lock cache: {period_lock_cache.stats()}")
+    return summary
+
+def commit_chunk(checkpoint, summary: dict, aggregates, ids):
+    """
+    Checkpoints a chunk whose writes are flushed. Its metric aggregate deltas
+    are committed in the same batch: increments are not idempotent like the
+    entry writes, so a chunk replayed after a crash must not add them twice.
+    (The first chunk of a fresh job replaces the previous contribution in a
+    transaction of its own; its replay reverses it again.) So are the
+    chunk's entry digests (dedup.RecordIds), which a resumed invocation
+    needs to number the occurrences of the rows after the checkpoint.
+    """
+    batch = get_db().batch()
+    if aggregates.pending:
+        aggregates.flush(batch)
+    checkpoint.commit(summary, batch=batch, row_digests=ids.take_digests())
+    batch.commit()
+
+def persist_metrics(metrics, status: str, **fields) -> dict:
+    """
+    Logs the upload's stage metrics and merges them into
+    `file_processing_logs/{upload_id}` for get_upload_status. A failed write
+    is logged, never raised, so it cannot fail an ingested upload.
+    """
+    try:
+        doc_ref = get_db().collection(job_checkpoints.JOB_COLLECTION).document(metrics.upload_id)
+        return metrics.persist(doc_ref, status, **fields)
+    except Exception as e:
+        logger.error(f"Could not persist ingestion metrics for {metrics.upload_id}: {e}")
+        return metrics.summary()
+
+def stream_bytes_read(file_stream, default: int = 0) -> int:
+    """Bytes fetched from Cloud Storage by a ranged stream; `default` for other streams."""
+    raw = getattr(file_stream, 'raw', None)
+    if isinstance(raw, blob_stream.RangedBlobReader):
+        return raw.bytes_fetched
+    return default
+
+def content_source_key(file_stream) -> str:
+    """
+    Source key (see MetricAggregates) of a multipart upload sent without an
+    uploadId: a hash of its bytes, so only the same file replaces itself and
+    an unrelated upload of the same name adds its own contribution. The
+    stream is read in blocks and rewound.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    file_stream.seek(0)
+    for block in iter(functools.partial(file_stream.read, 1 << 20), b''):
+        digest.update(block)
+    file_stream.seek(0)
+    return f"upload-content:{digest.hexdigest()}"
+
+def stream_progress(file_stream, rows_done: int) -> dict:
+    """
+    Share of a ranged storage stream consumed so far, and the row total it
+    extrapolates to from `rows_done`. Only meaningful for formats read front
+    to back (CSV); empty for other streams.
+    """
+    raw = getattr(file_stream, 'raw', None)
+    if not isinstance(raw, blob_stream.RangedBlobReader) or not raw.size or not raw.tell():
+        return {}
+    progress = min(raw.tell() / raw.size, 1.0)
+    return {'progress': round(progress, 4), 'rows_total': int(rows_done / progress) if rows_done else None}
+
+def period_locked_response(error: PeriodLockedError, upload_id: str) -> https_fn.Response:
+    """
+    403 for a locked period met before anything was stored. When earlier
+    chunks were already committed, 207 with what was written and the raw
+    row the ingestion stopped at, so the partial upload is not mistaken for
+    a rejected one.
+    """
+    body = {
+        "error": str(error),
+        "upload_id": upload_id,
+        "company_id": error.company_id,
+        "locked_period": error.period,
+        "rows_committed": error.rows_committed,
+        "raw_rows_committed": error.raw_rows_committed
+    }
+    if not error.rows_committed:
+        return https_fn.Response(json.dumps(body), status=403, headers={"Content-Type": "application/json"})
+    body.update(
+        message=f"Partially ingested: stopped at raw row {error.raw_rows_committed} (period {error.period} is locked)",
+        status=job_checkpoints.STATUS_PARTIAL,
+        stopped_at_raw_row=error.raw_rows_committed
+    )
+    return https_fn.Response(json.dumps(body), status=207, headers={"Content-Type": "application/json"})
+
+def read_job_rows(file_stream, filename: str, checkpoint):
+    """
+    (ColumnPlan, row tuples after the checkpoint, parser) for a job. A CSV is
+    read on from the checkpoint's byte offset, and the offset of every
+    committed chunk is recorded for the next invocation. An XLSX file is a
+    zip with no row offsets to seek to: each invocation re-parses the rows
+    before the checkpoint, so resuming costs more the further the job got.
+    """
+    if filename.endswith('.csv'):
+        resume = checkpoint.bytes_committed is not None
+        reader = csv_reader.CsvRowReader(file_stream, start=checkpoint.bytes_committed,
+                                         first_row=checkpoint.rows_committed if resume else 0)
+        checkpoint.row_offset = reader.offset_after
+        rows = iter(reader)
+        if not resume:
+            rows = itertools.islice(rows, checkpoint.rows_committed, None)
+        plan = column_plan.plan_for(reader.headers)
+        logger.info(f"Column plan {plan.fingerprint} for {filename} from byte {reader.start}: {column_plan.cache_stats()}")
+        return plan, rows, None
+    plan, rows, parser = read_rows(file_stream, filename)
+    return plan, itertools.islice(rows, checkpoint.rows_committed, None), parser
+
+def run_ingestion_job(job_id: str, file_stream, filename: str, user_id: str, metrics=None,
+                      time_budget_sec: float = job_checkpoints.JOB_TIME_BUDGET_SEC, progress=None,
+                      source_key: str = None) -> https_fn.Response:
+    """
+    Job mode of ingest_data. Continues after the raw rows committed by
+    earlier invocations (see read_job_rows), ingests JOB_CHUNK_ROWS-sized
+    chunks with a checkpoint after each, and answers 202 with the offset
+    when the time budget runs out. An invocation whose budget runs out
+    before it commits a chunk (an XLSX too large to re-read up to its
+    checkpoint) fails instead of being resumed forever.
+    The stage metrics of the invocation are persisted with its status;
+    `progress` (see JobCheckpoint) adds a progress estimate to each checkpoint.
+    `source_key` is the file's storage URI (see MetricAggregates).
+    """
+    if metrics is None:
+        metrics = stage_metrics.IngestionMetrics(job_id, filename, 'job')
+    doc_ref = get_db().collection(job_checkpoints.JOB_COLLECTION).document(job_id)
+    checkpoint = job_checkpoints.JobCheckpoint(doc_ref, job_id, filename, time_budget_sec=time_budget_sec,
+                                               progress=progress).load()
+    if checkpoint.completed:
+        summary = checkpoint.summary()
+        return https_fn.Response(json.dumps({
+            "message": "Job already completed",
+            "upload_id": job_id,
+            "status": checkpoint.status,
+            "rows_processed": summary['rows_processed'],
+            "total_value_gel": summary['total_value_gel']
+        }), status=200, headers={"Content-Type": "application/json"})
+
+    with metrics.stage('parse'):
+        plan, rows, parser = read_job_rows(file_stream, filename, checkpoint)
+    dates = date_normalizer_for(plan)
+    rows_at_start = checkpoint.rows_committed
+    chunks = metrics.timed('parse', iter_chunks(normalize_row_dates(plan, rows, dates), job_checkpoints.JOB_CHUNK_ROWS))
+
+    mapping_rules = mapping_rules_cache.get()
+    logger.info(f"Mapping rules cache: {mapping_rules_cache.stats()}")
+    fx_rates_cache.get()
+    logger.info(f"FX rates cache: {fx_rates_cache.stats()}")
+    try:
+        summary = ingest_chunks(chunks, mapping_rules, filename, checkpoint=checkpoint, metrics=metrics,
+                                transform=functools.partial(transform_values, plan),
+                                lock_contexts=functools.partial(plan_lock_contexts, plan), source_key=source_key)
+    except PeriodLockedError as e:
+        checkpoint.finish(job_checkpoints.STATUS_PARTIAL if e.rows_committed else job_checkpoints.STATUS_LOCKED,
+                          error=str(e))
+        persist_metrics(metrics, checkpoint.status)
+        return period_locked_response(e, job_id)
+    except Exception as e:
+        # Committed chunks stay checkpointed; a retry resumes after them
+        checkpoint.finish(job_checkpoints.STATUS_FAILED, error=str(e))
+        persist_metrics(metrics, checkpoint.status)
+        raise
+
+    if not summary['complete'] and checkpoint.rows_committed == rows_at_start:
+        error = (f"Time budget spent before any rows past the checkpoint ({rows_at_start}) were committed; "
+                 f"upload large files as CSV, which resumes at its byte offset")
+        checkpoint.finish(job_checkpoints.STATUS_FAILED, error=error)
+        persist_metrics(metrics, checkpoint.status)
+        return https_fn.Response(json.dumps({
+            "error": error,
+            "upload_id": job_id,
+            "raw_rows_committed": checkpoint.rows_committed
+        }), status=500, headers={"Content-Type": "application/json"})
+
+    if not summary['complete']:
+        return https_fn.Response(json.dumps({
+            "message": "Time budget reached; invoke again to resume",
+            "upload_id": job_id,
+            "status": checkpoint.status,
+            "raw_rows_committed": checkpoint.rows_committed,
+            "rows_processed": summary['rows_processed'],
+            "write_stats": summary['write_stats'],
+            "metrics": persist_metrics(metrics, checkpoint.status)
+        }), status=202, headers={"Content-Type": "application/json"})
+
+    checkpoint.finish(job_checkpoints.STATUS_COMPLETED, summary)
+    metrics_summary = persist_metrics(metrics, checkpoint.status)
+    log_audit_event(user_id, 'INGESTION_COMPLETED', {
+        'filename': filename,
+        'row_count': summary['rows_processed'],
+        'unique_raw_rows': summary['unique_raw_rows'],
+        'mode': 'job',
+        'upload_id': job_id,
+        'invocations': checkpoint.invocations
+    })
+
+    return https_fn.Response(json.dumps({
+        "message": "Data ingested successfully",
+        "upload_id": job_id,
+        "status": checkpoint.status,
+        "rows_processed": summary['rows_processed'],
+        "total_value_gel": summary['total_value_gel'],
+        "columns": summary['columns'],
+        "write_stats": summary['write_stats'],
+        "parse_stats": parse_stats(parser),
+        "date_stats": dates.stats(),
+        "metrics": metrics_summary
+    }), status=201, headers={"Content-Type": "application/json"})
+
+def ingest_pdf(source, filename: str, upload_id, user_id: str, metrics=None) -> https_fn.Response:
+    """
+    PDF branch of ingest_data. `source` is the PDF as bytes (multipart upload)
+    or a storage opener (blob_stream.open_storage) that each extraction
+    process reads in ranges. Pages are extracted in parallel worker processes
+    and packed into bounded text chunks, each stored as its own document in
+    `file_processing_logs/{upload_id}/pdf_chunks`, so long statements stay
+    under Firestore's document size limit. The upload document gets the
+    first-page preview as soon as page one is extracted, so get_upload_status
+    can show it while the remaining pages are still running.
+    Extraction is timed as the parse stage and the chunk writes as store.
+    """
+    from google.cloud import firestore
+
+    upload_id = upload_id or pdf_pages.upload_id_for(source)
+    if metrics is None:
+        metrics = stage_metrics.IngestionMetrics(upload_id, filename, 'pdf')
+    metrics.upload_id = upload_id
+    if isinstance(source, bytes):
+        metrics.count('bytes_read', len(source))
+    client = get_db()
+    upload_ref = client.collection(job_checkpoints.JOB_COLLECTION).document(upload_id)
+    chunks_ref = upload_ref.collection('pdf_chunks')
+    preview = {}
+
+    def publish_preview(text: str, page_count: int):
+        preview.update(text=text[:200] + "...", page_count=page_count)
+        upload_ref.set({
+            'status': job_checkpoints.STATUS_PROCESSING,
+            'file_name': filename,
+            'type': 'unstructured_pdf_text',
+            'page_count': page_count,
+            'preview': preview['text'],
+            'timestamp': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+
+    chunk_count = 0
+    writer = bulk_writer.BulkWriter(client)
+    try:
+        pages = metrics.timed('parse', pdf_pages.iter_page_texts(source, on_first_page=publish_preview))
+        for chunk in pdf_pages.chunk_pages(pages):
+            chunk.update(chunk_index=chunk_count, type='unstructured_pdf_text', source_file=filename,
+                         ingested_at=firestore.SERVER_TIMESTAMP)
+            with metrics.stage('store', rows=1):
+                writer.set(chunks_ref.document(f"{chunk_count:05d}"), chunk)
+            chunk_count += 1
+        with metrics.stage('store'):
+            writer.close()
+    except Exception as e:
+        writer.close(raise_errors=False)
+        metrics.record_writes(writer.stats())
+        metrics.persist(upload_ref, job_checkpoints.STATUS_FAILED, error=str(e))
+        raise
+
+    write_stats = writer.stats()
+    metrics.record_writes(write_stats)
+    metrics_summary = metrics.persist(upload_ref, job_checkpoints.STATUS_COMPLETED,
+                                      rows_processed=chunk_count, chunk_count=chunk_count)
+    logger.info(f"Stored {chunk_count} text chunks ({preview.get('page_count', 0)} pages) from {filename}: {write_stats}")
+
+    log_audit_event(user_id, 'INGESTION_COMPLETED', {
+        'filename': filename,
+        'row_count': chunk_count,
+        'page_count': preview.get('page_count', 0),
+        'upload_id': upload_id
+    })
+
+    return https_fn.Response(json.dumps({
+        "message": "PDF ingested successfully (Text Extracted)",
+        "upload_id": upload_id,
+        "rows_processed": chunk_count,
+        "page_count": preview.get('page_count', 0),
+        "preview": preview.get('text', "..."),
+        "write_stats": write_stats,
+        "metrics": metrics_summary
+    }), status=201, headers={"Content-Type": "application/json"})
+
+def ingest_manifest_file(filename: str, open_stream, mapping_rules, fx_table, source_key: str = None) -> dict:
+    """
+    One file of a manifest, end to end in a worker process, in two streaming
+    passes over `open_stream()` (see manifest.ingest_file). The first pass
+    only collects the lock contexts of the file's rows and checks them all
+    before anything is stored (a file touching a locked period writes
+    nothing); the second re-reads the file and maps and stores it in
+    STREAM_CHUNK_ROWS chunks through its own BulkWriter, so no more than a
+    chunk of rows is held at a time. Only counts, stats and stage timings
+    are returned to the parent (see manifest.ingest_files).
+    `source_key` is the file's storage URI (see MetricAggregates).
+    """
+    metrics = stage_metrics.IngestionMetrics(None, filename, 'manifest')
+    contexts = set()
+    raw_rows = 0
+    with open_stream() as file_stream:
+        with metrics.stage('parse'):
+            plan, rows, parser = read_rows(file_stream, filename)
+        chunks = metrics.timed('parse', iter_chunks(normalize_row_dates(plan, rows, date_normalizer_for(plan)),
+                                                    STREAM_CHUNK_ROWS))
+        for chunk in chunks:
+            with metrics.stage('lock_check', rows=len(chunk)):
+                contexts |= plan_lock_contexts(plan, chunk)
+            raw_rows += len(chunk)
+        bytes_read = stream_bytes_read(file_stream)
+
+    with metrics.stage('lock_check'):
+        locked = sorted(find_locked_periods(contexts))
+    result = {
+        'raw_rows': raw_rows,
+        'rows_processed': 0,
+        'total_value_gel': 0.0,
+        'bytes_read': bytes_read
+    }
+    if locked:
+        company_id, month_period = locked[0]
+        result.update(status='locked', locked_periods=[list(c) for c in locked], parse_stats=parse_stats(parser),
+                      error=f"Governance Violation: Period {month_period} is LOCKED for {company_id}.",
+                      stages=metrics.summary()['stages'])
+        return result
+
+    writer = bulk_writer.BulkWriter(get_db())
+    ids = dedup.RecordIds(filename)
+    sink = warehouse_sink.open_sink()
+    aggregates = metric_aggregates.MetricAggregates(get_db(), source_key=source_key)
+    try:
+        with open_stream() as file_stream:
+            with metrics.stage('parse'):
+                plan, rows, parser = read_rows(file_stream, filename)
+            dates = date_normalizer_for(plan)
+            for chunk in metrics.timed('parse', iter_chunks(normalize_row_dates(plan, rows, dates), STREAM_CHUNK_ROWS)):
+                # The dates of the first pass; a context it did not see is checked before its rows are stored
+                with metrics.stage('lock_check', rows=len(chunk)):
+                    unchecked = plan_lock_contexts(plan, chunk) - contexts
+                    locked = sorted(find_locked_periods(unchecked)) if unchecked else []
+                if locked:
+                    raise PeriodLockedError(locked[0][0], locked[0][1], result['rows_processed'])
+                with metrics.stage('map', rows=len(chunk)):
+                    ledger = [entry for values in chunk
+                              for entry in generate_ledger_entries_for_row(map_values(plan, values, mapping_rules, fx_table))]
+                result['total_value_gel'] += sum(float(r.get('amount_gel', 0)) for r in ledger if r.get('entry_type') == 'Debit')
+                with metrics.stage('store', rows=len(ledger)):
+                    store_data(ledger, filename, writer=writer, ids=ids, sink=sink, aggregates=aggregates)
+                result['rows_processed'] += len(ledger)
+            result['bytes_read'] += stream_bytes_read(file_stream)
+    finally:
+        with metrics.stage('store'):
+            writer.close()
+            if sink is not None:
+                sink.close()
+            aggregates.close()
+
+    write_stats = writer.stats()
+    write_stats['dedup'] = ids.stats()
+    write_stats['warehouse'] = sink.stats() if sink is not None else None
+    write_stats['aggregates'] = aggregates.stats()
+    result.update(status='ingested', parse_stats=parse_stats(parser), date_stats=dates.stats(),
+                  write_stats=write_stats, stages=metrics.summary()['stages'])
+    return result
+
+def ingest_manifest(storage_paths, bucket_name, user_id: str, upload_id: str = None) -> https_fn.Response:
+    """
+    Manifest mode of ingest_data: every file of a month-end batch in one call.
+    Each file is streamed from Cloud Storage, then parsed, lock-checked,
+    mapped and stored by a worker process (ingest_manifest_file) with one
+    copy of the mapping rules; the pool is sized to fit the function's
+    memory (manifest.memory_workers) and only per-file counts come back.
+    Files touching a locked period are skipped.
+    Returns a per-file and an aggregate summary (201, or 207 if any file was
+    not ingested). The stage metrics add up the workers' stages.
+    """
+    metrics = stage_metrics.IngestionMetrics(upload_id or uuid.uuid4().hex[:24],
+                                             f"manifest of {len(storage_paths)} files", 'manifest')
+    bucket = blob_stream.get_bucket(bucket_name)
+    logger.info(f"Processing manifest of {len(storage_paths)} files from {bucket.name}")
+    # Workers open their own ranged streams, so no file passes through this process
+    files = [(secure_filename(os.path.basename(path)), functools.partial(blob_stream.open_storage, bucket.name, path),
+              blob_stream.storage_uri(bucket.name, path)) for path in storage_paths]
+
+    mapping_rules = mapping_rules_cache.get()
+    logger.info(f"Mapping rules cache: {mapping_rules_cache.stats()}")
+    fx_table = fx_rates_cache.get()
+    logger.info(f"FX rates cache: {fx_rates_cache.stats()}")
+    results = manifest.ingest_files(files, ingest_manifest_file, mapping_rules, fx_table)
+
+    files = []
+    write_stats = {'rows_written': 0, 'commits': 0, 'retries': 0}
+    for path, result in zip(storage_paths, results):
+        for name, stage in result.get('stages', {}).items():
+            metrics.add(name, stage['sec'], stage['rows'])
+        metrics.count('bytes_read', result.get('bytes_read', 0))
+        file_writes = result.get('write_stats')
+        metrics.record_writes(file_writes)
+        for key in write_stats:
+            write_stats[key] += (file_writes or {}).get(key, 0)
+
+        summary = {
+            'file': result['file'],
+            'storagePath': path,
+            'status': result['status'],
+            'raw_rows': result.get('raw_rows', 0),
+            'rows_processed': result.get('rows_processed', 0),
+            'total_value_gel': result.get('total_value_gel', 0.0),
+            'ingest_sec': result['ingest_sec'],
+            'parse_stats': result.get('parse_stats'),
+            'date_stats': result.get('date_stats'),
+            'write_stats': file_writes
+        }
+        for key in ('error', 'locked_periods'):
+            if key in result:
+                summary[key] = result[key]
+        files.append(summary)
+
+    ingested = [f for f in files if f['status'] == 'ingested']
+    aggregate = {
+        'files': len(files),
+        'files_ingested': len(ingested),
+        'files_locked': sum(1 for f in files if f['status'] == 'locked'),
+        'files_failed': sum(1 for f in files if f['status'] == 'failed'),
+        'raw_rows': sum(f['raw_rows'] for f in ingested),
+        'rows_processed': sum(f['rows_processed'] for f in ingested),
+        'total_value_gel': sum(f['total_value_gel'] for f in ingested),
+        'write_stats': write_stats
+    }
+    # Per-file outcomes are in the response; the batch document records the counts
+    aggregate['metrics'] = persist_metrics(
+        metrics, job_checkpoints.STATUS_COMPLETED, rows_processed=aggregate['rows_processed'],
+        files_ingested=aggregate['files_ingested'], files_locked=aggregate['files_locked'],
+        files_failed=aggregate['files_failed'])
+    logger.info(f"Manifest stored {aggregate['rows_processed']} records from {len(ingested)} files: {write_stats}")
+
+    log_audit_event(user_id, 'INGESTION_COMPLETED', {
+        'filenames': [f['file'] for f in ingested],
+        'row_count': aggregate['rows_processed'],
+        'unique_raw_rows': aggregate['raw_rows'],
+        'mode': 'manifest',
+        'upload_id': metrics.upload_id
+    })
+
+    return https_fn.Response(json.dumps({
+        "message": f"Ingested {len(ingested)} of {len(files)} files",
+        "upload_id": metrics.upload_id,
+        "summary": aggregate,
+        "files": files
+    }), status=201 if len(ingested) == len(files) else 207, headers={"Content-Type": "application/json"})
+
+def enqueue_ingestion(bucket, blob, storage_path: str, filename: str, upload_id: str, user_id: str) -> https_fn.Response:
+    """
+    Async mode of ingest_data: validates the upload (format and, for CSV and
+    Excel, the header row), records it as queued in
+    `file_processing_logs/{upload_id}` and publishes it to INGEST_TOPIC, so
+    the request answers 202 at once. process_ingestion_queue does the work
+    as a checkpointed job and keeps the document's progress current for
+    get_upload_status. Re-submitting an unfinished upload queues it again;
+    the job resumes from its checkpoint.
+    """
+    from google.cloud import firestore
+
+    if not filename.endswith(('.csv', '.xls', '.xlsx', '.pdf')):
+        return https_fn.Response(json.dumps({"error": "Unsupported file format."}), status=400, headers={"Content-Type": "application/json"})
+    if not filename.endswith('.pdf'):
+        # Only the first range is fetched to read the header
+        with blob_stream.open_blob(blob) as file_stream:
+            plan, rows, parser = read_rows(file_stream, filename)
+            has_rows = next(iter(rows), None) is not None
+        if not validate_data([dict.fromkeys(plan.headers)] if has_rows else []):
+            return https_fn.Response(json.dumps({"error": "Validation failed"}), status=400, headers={"Content-Type": "application/json"})
+
+    doc_ref = get_db().collection(job_checkpoints.JOB_COLLECTION).document(upload_id)
+    doc = doc_ref.get()
+    if doc.exists and doc.to_dict().get('status') == job_checkpoints.STATUS_COMPLETED:
+        return https_fn.Response(json.dumps({
+            "message": "Upload already ingested",
+            "upload_id": upload_id,
+            "status": job_checkpoints.STATUS_COMPLETED
+        }), status=200, headers={"Content-Type": "application/json"})
+
+    doc_ref.set({
+        'status': job_checkpoints.STATUS_QUEUED,
+        'file_name': filename,
+        'mode': 'async',
+        'storage_path': storage_path,
+        'bytes_total': blob.size,
+        'error': None,
+        'timestamp': firestore.SERVER_TIMESTAMP
+    }, merge=True)
+    message_id = ingest_queue.get_publisher().publish({
+        'upload_id': upload_id,
+        'bucket': bucket.name,
+        'storagePath': storage_path,
+        'generation': blob.generation,
+        'filename': filename,
+        'userId': user_id
+    })
+    logger.info(f"Queued {filename} as upload {upload_id} (message {message_id})")
+
+    return https_fn.Response(json.dumps({
+        "message": "Upload queued for processing",
+        "upload_id": upload_id,
+        "status": job_checkpoints.STATUS_QUEUED,
+        "status_url": f"/api/v1/data/upload/status/{upload_id}"
+    }), status=202, headers={"Content-Type": "application/json"})
+
+def run_queued_ingestion(message: dict) -> int:
+    """
+    Worker side of async mode: ingests one queued upload. CSV and Excel run
+    as a checkpointed job (see run_ingestion_job) with a time budget under
+    the worker timeout; when the budget runs out the message is published
+    again and the next delivery resumes from the checkpoint. PDFs go through
+    ingest_pdf. Returns the HTTP status the synchronous modes would answer.
+    """
+    upload_id, filename = message['upload_id'], message['filename']
+    user_id = message.get('userId', 'anonymous')
+    bucket = blob_stream.get_bucket(message.get('bucket'))
+    metrics = stage_metrics.IngestionMetrics(upload_id, filename, 'async')
+    logger.info(f"Worker ingesting {filename} (upload {upload_id})")
+
+    if filename.endswith('.pdf'):
+        source = functools.partial(blob_stream.open_storage, bucket.name, message['storagePath'], message.get('generation'))
+        return ingest_pdf(source, filename, upload_id, user_id, metrics=metrics).status_code
+
+    blob = bucket.blob(message['storagePath'], generation=message.get('generation'))
+    with blob_stream.open_blob(blob) as file_stream:
+        metrics.track_bytes(functools.partial(stream_bytes_read, file_stream))
+        response = run_ingestion_job(upload_id, file_stream, filename, user_id, metrics=metrics,
+                                     time_budget_sec=ingest_queue.WORKER_TIME_BUDGET_SEC,
+                                     progress=functools.partial(stream_progress, file_stream) if filename.endswith('.csv') else None,
+                                     source_key=blob_stream.storage_uri(bucket.name, message['storagePath']))
+
+    if response.status_code == 202:
+        message_id = ingest_queue.get_publisher().publish(message)
+        logger.info(f"Upload {upload_id} re-queued to resume from its checkpoint (message {message_id})")
+    return response.status_code
+
+@pubsub_fn.on_message_published(
+    topic=ingest_queue.INGEST_TOPIC,
+    timeout_sec=540,
+    memory=options.MemoryOption.GB_1,
+)
+def process_ingestion_queue(event: pubsub_fn.CloudEvent[pubsub_fn.MessagePublishedData]) -> None:
+    """
+    Pub/Sub worker for async uploads (see enqueue_ingestion). A failure is
+    recorded on the upload document instead of being retried by Pub/Sub;
+    re-submitting the upload resumes it from its last checkpoint.
+    """
+    message = ingest_queue.decode_event(event)
+    try:
+        run_queued_ingestion(message)
+    except Exception as e:
+        logger.error(f"Async ingestion of {message.get('upload_id')} failed: {e}", exc_info=True)
+        try:
+            from google.cloud import firestore
+            get_db().collection(job_checkpoints.JOB_COLLECTION).document(message['upload_id']).set({
+                'status': job_checkpoints.STATUS_FAILED,
+                'error': str(e),
+                'timestamp': firestore.SERVER_TIMESTAMP
+            }, merge=True)
+        except Exception as write_error:
+            logger.error(f"Could not record the failure of {message.get('upload_id')}: {write_error}")
 
 @https_fn.on_request(
     cors=options.CorsOptions(cors_origins="*", cors_methods=["post", "options"]),
@@ -244,17 +1127,42 @@ def store_data(records, filename: str):
 def ingest_data(req: https_fn.Request) -> https_fn.Response:
     """
     HTTP Entrypoint for Data Ingestion.
+    Optional `mode`: 'full' (default, whole file in memory), 'stream'
+    (fixed-size chunks, flat memory for very large ledgers), 'columnar'
+    (chunked like 'stream', transformed column-at-a-time with pandas/NumPy)
+    'job' (storagePath only: checkpointed in `file_processing_logs`,
+    returns 202 when the time budget runs out; call again to resume. CSV
+    resumes at its byte offset; XLSX re-reads the rows before the
+    checkpoint, which bounds the size it can finish, see read_job_rows) or
+    'async' (storagePath only: queued for a background worker, returns 202
+    with the upload_id at once; see enqueue_ingestion).
+    A JSON `manifest` (list of storagePaths) ingests a batch of CSV/Excel
+    files in parallel instead; see ingest_manifest.
+    Every upload records per-stage timings, bytes read and write retries in
+    `file_processing_logs/{upload_id}` (see stage_metrics).
     """
+    metrics = None
+    file_stream = None
+    pdf_source = None
     try:
-        import openpyxl
-        
-        file_stream = None
         filename = ""
+        upload_id = None
+        source_key = None # What the upload replaces on a re-upload (see MetricAggregates)
 
         # Check for JSON Body (Storage Trigger from Frontend)
         json_data = req.get_json(silent=True)
         user_id = json_data.get('userId', 'anonymous') if json_data else 'anonymous'
+        mode = (json_data.get('mode') if json_data else req.form.get('mode')) or 'full'
         
+        if json_data and 'manifest' in json_data:
+            storage_paths = json_data['manifest']
+            if not isinstance(storage_paths, list) or not storage_paths or \
+                    not all(isinstance(p, str) and p for p in storage_paths):
+                return https_fn.Response(json.dumps({"error": "manifest must be a non-empty list of storagePaths"}), status=400, headers={"Content-Type": "application/json"})
+            if len(storage_paths) > manifest.MAX_MANIFEST_FILES:
+                return https_fn.Response(json.dumps({"error": f"manifest is limited to {manifest.MAX_MANIFEST_FILES} files"}), status=400, headers={"Content-Type": "application/json"})
+            return ingest_manifest(storage_paths, json_data.get('bucket'), user_id, json_data.get('uploadId'))
+
         if json_data and 'storagePath' in json_data:
             storage_path = json_data['storagePath']
             bucket_name = json_data.get('bucket')
@@ -262,15 +1170,20 @@ def ingest_data(req: https_fn.Request) -> https_fn.Response:
 
             logger.info(f"Processing from Storage: {bucket_name}/{storage_path}")
 
-            from firebase_admin import storage
-            bucket = storage.bucket(bucket_name)
+            bucket = blob_stream.get_bucket(bucket_name)
             blob = bucket.blob(storage_path)
-            
-            # Download to memory
-            file_stream = io.BytesIO()
-            blob.download_to_file(file_stream)
-            file_stream.seek(0)
-            
+            # Size for the ranged reads; the object generation keys jobs and PDF uploads,
+            # so a re-upload starts fresh
+            blob.reload()
+            upload_id = json_data.get('uploadId') or job_checkpoints.job_id_for(bucket_name, storage_path, blob.generation)
+            if mode == 'async':
+                return enqueue_ingestion(bucket, blob, storage_path, filename, upload_id, user_id)
+
+            # Streamed in ranged reads while the parser runs, never held whole in memory
+            file_stream = blob_stream.open_blob(blob)
+            pdf_source = functools.partial(blob_stream.open_storage, bucket.name, storage_path, blob.generation)
+            source_key = blob_stream.storage_uri(bucket.name, storage_path)
+
         elif 'file' in req.files:
             file_wrapper = req.files['file']
             if file_wrapper.filename == '':
@@ -278,89 +1191,140 @@ def ingest_data(req: https_fn.Request) -> https_fn.Response:
             
             filename = secure_filename(file_wrapper.filename)
             file_stream = file_wrapper # FileStorage
+            upload_id = req.form.get('uploadId')
+            source_key = upload_id or content_source_key(file_stream)
         else:
             return https_fn.Response(json.dumps({"error": "No file or storagePath provided"}), status=400, headers={"Content-Type": "application/json"})
 
-        # Read file
-        raw_rows = []
-        if filename.endswith('.csv'):
-            if isinstance(file_stream, io.BytesIO):
-                text_stream = io.TextIOWrapper(file_stream, encoding='utf-8')
-            else:
-                # Flask FileStorage
-                file_stream.seek(0)
-                text_stream = io.TextIOWrapper(file_stream, encoding='utf-8')
-                
-            reader = csv.DictReader(text_stream)
-            raw_rows = [row for row in reader]
-            
-        elif filename.endswith(('.xls', '.xlsx')):
-             # OpenPyXL requires file-like object
-             wb = openpyxl.load_workbook(file_stream, data_only=True)
-             ws = wb.active
-             rows_iter = ws.iter_rows(values_only=True)
-             headers = next(rows_iter, None)
-             if headers:
-                 headers = [str(h) for h in headers if h is not None]
-                 for row in rows_iter:
-                     record = {}
-                     for i, val in enumerate(row):
-                         if i < len(headers):
-                             record[headers[i]] = val
-                     raw_rows.append(record)
+        if mode in ('job', 'async') and pdf_source is None:
+            return https_fn.Response(json.dumps({"error": f"{mode.capitalize()} mode requires a storagePath"}), status=400, headers={"Content-Type": "application/json"})
+
+        # Read file (lazily as row tuples; the default mode materialises it below)
+        if filename.endswith(('.csv', '.xls', '.xlsx')):
+            metrics = stage_metrics.IngestionMetrics(upload_id or uuid.uuid4().hex[:24], filename, mode)
+            # Ranged storage reads count what was fetched so far; a multipart body is read whole
+            metrics.track_bytes(functools.partial(stream_bytes_read, file_stream, req.content_length or 0))
+            # Job Mode: checkpointed chunks, resumable across invocations
+            if mode == 'job':
+                return run_ingestion_job(metrics.upload_id, file_stream, filename, user_id, metrics=metrics,
+                                         source_key=source_key)
+            # OpenPyXL requires file-like object; read-only mode streams the sheet
+            with metrics.stage('parse'):
+                plan, rows, parser = read_rows(file_stream, filename)
 
         elif filename.endswith('.pdf'):
-            from pypdf import PdfReader
-            pdf_bytes = io.BytesIO(file_stream.read())
-            reader = PdfReader(pdf_bytes)
-            text_content = ""
-            for page in reader.pages:
-                text_content += page.extract_text() + "\n"
-            
-            raw_rows = [{'content': text_content, 'type': 'unstructured_pdf_text'}]
-            
-            # Special case for PDF: just separate flow
-            store_data(raw_rows, filename)
-            return https_fn.Response(json.dumps({
-                "message": "PDF ingested successfully (Text Extracted)",
-                "rows_processed": 1,
-                "preview": text_content[:200] + "..."
-            }), status=201, headers={"Content-Type": "application/json"})
+            # A multipart PDF without an uploadId is keyed by its content
+            if pdf_source is None:
+                return ingest_pdf(file_stream.read(), filename, upload_id, user_id)
+            file_stream.close() # Each extraction process opens its own ranged stream
+            return ingest_pdf(pdf_source, filename, upload_id, user_id)
             
         else:
              return https_fn.Response(json.dumps({"error": "Unsupported file format."}), status=400, headers={"Content-Type": "application/json"})
              
+        # Dates become ISO before lock checks and mapping (the columnar transform converts its own)
+        dates = date_normalizer_for(plan)
+
+        # Streaming / Columnar Mode: bounded memory, chunked parse -> map -> check -> store
+        if mode in ('stream', 'columnar'):
+            if mode == 'columnar':
+                import columnar
+                if filename.endswith('.csv'):
+                    chunks = columnar.read_csv_frames(file_stream)
+                else:
+                    chunks = columnar.frames_from_rows(rows, plan.headers)
+                transform, lock_contexts = transform_frame, frame_lock_contexts
+            else:
+                chunks = iter_chunks(normalize_row_dates(plan, rows, dates), STREAM_CHUNK_ROWS)
+                transform = functools.partial(transform_values, plan)
+                lock_contexts = functools.partial(plan_lock_contexts, plan)
+
+            chunks = metrics.timed('parse', chunks)
+            first_chunk = next(chunks, [])
+            # validate_data only inspects the first row's keys
+            if not validate_data([dict.fromkeys(plan.headers)] if len(first_chunk) else []):
+                 persist_metrics(metrics, job_checkpoints.STATUS_FAILED, error="Validation failed")
+                 return https_fn.Response(json.dumps({"error": "Validation failed"}), status=400, headers={"Content-Type": "application/json"})
+
+            mapping_rules = mapping_rules_cache.get()
+            logger.info(f"Mapping rules cache: {mapping_rules_cache.stats()}")
+            fx_rates_cache.get()
+            logger.info(f"FX rates cache: {fx_rates_cache.stats()}")
+            try:
+                summary = ingest_chunks(itertools.chain([first_chunk], chunks), mapping_rules, filename,
+                                        transform=transform, lock_contexts=lock_contexts, metrics=metrics,
+                                        source_key=source_key)
+            except PeriodLockedError as e:
+                 status = job_checkpoints.STATUS_PARTIAL if e.rows_committed else job_checkpoints.STATUS_LOCKED
+                 persist_metrics(metrics, status, error=str(e), rows_processed=e.rows_committed,
+                                 raw_rows_committed=e.raw_rows_committed)
+                 if e.rows_committed:
+                     log_audit_event(user_id, 'INGESTION_PARTIAL', {
+                         'filename': filename,
+                         'row_count': e.rows_committed,
+                         'unique_raw_rows': e.raw_rows_committed,
+                         'locked_period': e.period,
+                         'mode': mode
+                     })
+                 return period_locked_response(e, metrics.upload_id)
+
+            log_audit_event(user_id, 'INGESTION_COMPLETED', {
+                'filename': filename,
+                'row_count': summary['rows_processed'],
+                'unique_raw_rows': summary['unique_raw_rows'],
+                'mode': mode
+            })
+
+            metrics_summary = persist_metrics(metrics, job_checkpoints.STATUS_COMPLETED, rows_processed=summary['rows_processed'])
+            return https_fn.Response(json.dumps({
+                "message": "Data ingested successfully",
+                "upload_id": metrics.upload_id,
+                "rows_processed": summary['rows_processed'],
+                "total_value_gel": summary['total_value_gel'],
+                "columns": summary['columns'],
+                "write_stats": summary['write_stats'],
+                "parse_stats": parse_stats(parser),
+                "date_stats": dates.stats() if mode == 'stream' else None,
+                "metrics": metrics_summary
+            }), status=201, headers={"Content-Type": "application/json"})
+
+        with metrics.stage('parse') as stage:
+            raw_rows = list(normalize_row_dates(plan, rows, dates))
+            stage['rows'] = len(raw_rows)
+
         # Validate
-        if not validate_data(raw_rows):
+        if not validate_data([dict.fromkeys(plan.headers)] if raw_rows else []):
+             persist_metrics(metrics, job_checkpoints.STATUS_FAILED, error="Validation failed")
              return https_fn.Response(json.dumps({"error": "Validation failed"}), status=400, headers={"Content-Type": "application/json"})
              
+        # Check Locks (all periods in one batch, before mapping)
+        with metrics.stage('lock_check', rows=len(raw_rows)):
+            locked = find_locked_periods(plan_lock_contexts(plan, raw_rows))
+        if locked:
+             company_id, month_period = locked[0]
+             error = f"Governance Violation: Period {month_period} is LOCKED for {company_id}."
+             persist_metrics(metrics, job_checkpoints.STATUS_LOCKED, error=error)
+             return https_fn.Response(json.dumps({
+                 "error": error,
+                 "upload_id": metrics.upload_id
+             }), status=403, headers={"Content-Type": "application/json"})
+
         # Transform & Map
-        mapping_rules = get_mapping_rules()
+        mapping_rules = mapping_rules_cache.get()
+        logger.info(f"Mapping rules cache: {mapping_rules_cache.stats()}")
+        fx_table = fx_rates_cache.get()
+        logger.info(f"FX rates cache: {fx_rates_cache.stats()}")
         transformed_ledger = []
         
-        # Track contexts for locking
-        contexts = set()
-        
-        for row in raw_rows:
-            # Map
-            mapped_row = map_row(row, mapping_rules)
-            
-            # Check context
-            if 'date' in mapped_row and 'company_id' in mapped_row:
-                 month_period = mapped_row['date'][:7] # YYYY-MM
-                 contexts.add((mapped_row['company_id'], month_period))
-
-            # Generate Ledger
-            entries = generate_ledger_entries_for_row(mapped_row)
-            transformed_ledger.extend(entries)
-        
-        # Check Locks
-        for company_id, month_period in contexts:
-            if check_period_lock(company_id, month_period):
-                 return https_fn.Response(json.dumps({
-                     "error": f"Governance Violation: Period {month_period} is LOCKED for {company_id}."
-                 }), status=403, headers={"Content-Type": "application/json"})
+        with metrics.stage('map', rows=len(raw_rows)):
+            for values in raw_rows:
+                # Map
+                mapped_row = map_values(plan, values, mapping_rules, fx_table)
 
+                # Generate Ledger
+                entries = generate_ledger_entries_for_row(mapped_row)
+                transformed_ledger.extend(entries)
+        
         # Metrics
         total_value = sum(float(r.get('amount_gel', 0)) for r in transformed_ledger if r.get('entry_type') == 'Debit') # Sum Debits only
         
@@ -371,15 +1335,35 @@ def ingest_data(req: https_fn.Request) -> https_fn.Response:
         })
         
         # Store
-        store_data(transformed_ledger, filename)
+        sink = warehouse_sink.open_sink()
+        aggregates = metric_aggregates.MetricAggregates(get_db(), source_key=source_key)
+        with metrics.stage('store', rows=len(transformed_ledger)):
+            write_stats = store_data(transformed_ledger, filename, sink=sink, aggregates=aggregates)
+            if sink is not None:
+                write_stats['warehouse'] = sink.close()
+            write_stats['aggregates'] = aggregates.close()
+        metrics.record_writes(write_stats)
+        metrics_summary = persist_metrics(metrics, job_checkpoints.STATUS_COMPLETED, rows_processed=len(transformed_ledger))
         
         return https_fn.Response(json.dumps({
             "message": "Data ingested successfully",
+            "upload_id": metrics.upload_id,
             "rows_processed": len(transformed_ledger),
             "total_value_gel": total_value,
-            "columns": list(transformed_ledger[0].keys()) if transformed_ledger else []
+            "columns": document_columns(transformed_ledger[0]) if transformed_ledger else [],
+            "write_stats": write_stats,
+            "parse_stats": parse_stats(parser),
+            "date_stats": dates.stats(),
+            "metrics": metrics_summary
         }), status=201, headers={"Content-Type": "application/json"})
 
     except Exception as e:
         logger.error(f"Ingestion Error: {e}")
+        # Job mode records its own failure with the checkpoint
+        if metrics is not None and metrics.mode != 'job':
+            persist_metrics(metrics, job_checkpoints.STATUS_FAILED, error=str(e))
         return https_fn.Response(json.dumps({"error": str(e)}), status=500, headers={"Content-Type": "application/json"})
+    finally:
+        # A storage stream owns a read-ahead thread pool; a multipart FileStorage belongs to the request
+        if pdf_source is not None and file_stream is not None:
+            file_stream.close()
@@ -0,0 +1,90 @@
+# Manifest Ingestion - ingest the files of one upload batch in parallel worker processes
+
+import functools
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Memory of the function instance (ingest_data runs with MB_512)
+MEMORY_LIMIT_MB = int(os.environ.get('INGEST_MEMORY_MB', '512'))
+# Kept for the parent process (its imports, caches and the response)
+PARENT_MEMORY_MB = int(os.environ.get('INGEST_MANIFEST_PARENT_MB', '192'))
+# Peak of one worker: interpreter and imports, a chunk of rows in flight and its file's lock contexts
+WORKER_MEMORY_MB = int(os.environ.get('INGEST_MANIFEST_WORKER_MB', '160'))
+# Worker processes (defaults to one per CPU core, as many as fit in memory)
+MANIFEST_WORKERS = int(os.environ.get('INGEST_MANIFEST_WORKERS', '0')) or os.cpu_count() or 1
+MAX_MANIFEST_FILES = int(os.environ.get('INGEST_MANIFEST_MAX_FILES', '50'))
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xls', '.xlsx')
+
+# Mapping rules and FX rate table of the current pool, installed once per worker process
+_worker_rules = None
+_worker_fx_table = None
+
+
+def _init_worker(mapping_rules, fx_table):
+    global _worker_rules, _worker_fx_table
+    _worker_rules = mapping_rules
+    _worker_fx_table = fx_table
+
+
+def memory_workers(workers: int = MANIFEST_WORKERS, memory_mb: int = MEMORY_LIMIT_MB) -> int:
+    """`workers`, capped to the number of worker processes that fit next to the parent in `memory_mb`."""
+    return max(1, min(workers, (memory_mb - PARENT_MEMORY_MB) // WORKER_MEMORY_MB))
+
+
+def ingest_file(filename: str, source, source_key, ingest, mapping_rules=None, fx_table=None) -> dict:
+    """
+    Ingests one file of the manifest (runs in a worker process).
+    `source` is the file as bytes or a picklable opener returning a stream
+    (blob_stream.open_storage), so each worker downloads its own file while
+    parsing it; `source_key` identifies it (its storage URI).
+    `ingest(filename, open_stream, mapping_rules, fx_table, source_key)`
+    parses, checks, maps and stores the file, opening a new stream of it
+    with each `open_stream()` (and closing it), and returns its counts, so
+    only those travel back to the parent, never the rows.
+    Errors are reported in the result so one bad file does not fail the batch.
+    """
+    rules = _worker_rules if mapping_rules is None else mapping_rules
+    fx_table = _worker_fx_table if fx_table is None else fx_table
+    result = {'file': filename}
+    started_at = time.perf_counter()
+    try:
+        if not filename.endswith(SUPPORTED_EXTENSIONS):
+            raise ValueError("Unsupported file format for a manifest (CSV or Excel only).")
+        open_stream = source if callable(source) else functools.partial(io.BytesIO, source)
+        result.update(ingest(filename, open_stream, rules, fx_table, source_key))
+        if isinstance(source, bytes):
+            result['bytes_read'] = len(source)
+    except Exception as e:
+        logger.error(f"Manifest file {filename} failed: {e}")
+        result.update(status='failed', error=str(e))
+    result['ingest_sec'] = round(time.perf_counter() - started_at, 3)
+    return result
+
+
+def ingest_files(files, ingest, mapping_rules, fx_table=None, workers: int = None) -> list:
+    """
+    ingest_file over `files` [(filename, bytes or opener, source key)], results in manifest order.
+    `ingest` must be picklable (a module-level function). Worker processes
+    are spawned, not forked: a fork would inherit the parent's gRPC Firestore
+    client mid-use, which is not fork-safe. The mapping rules and FX rate
+    table are resolved once by the caller and handed to each worker instead
+    of being reloaded per file. The pool is capped by memory_workers; with a
+    single worker (or file) the files are ingested in this process.
+    """
+    workers = max(1, min(memory_workers(workers or MANIFEST_WORKERS), len(files)))
+    if workers == 1:
+        return [ingest_file(filename, source, source_key, ingest, mapping_rules, fx_table)
+                for filename, source, source_key in files]
+
+    logger.info(f"Ingesting {len(files)} manifest files across {workers} worker processes")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(mapping_rules, fx_table)) as pool:
+        futures = [pool.submit(ingest_file, filename, source, source_key, ingest) for filename, source, source_key in files]
+        return [future.result() for future in futures]
@@ -0,0 +1,227 @@
+# Metric Aggregates - running Truth Engine totals per (company_id, period), maintained with deltas
+
+import hashlib
+import logging
+
+import ledger_entries
+
+logger = logging.getLogger(__name__)
+
+AGGREGATES_COLLECTION = 'metric_aggregates'
+# What each source (storage path or upload id) added to the aggregates, so a re-upload can reverse it
+CONTRIBUTIONS_COLLECTION = 'metric_contributions'
+# Firestore allows 500 writes per batch
+BATCH_SIZE = 400
+
+# Buckets of the Truth Engine's calculate_metrics (5-financial-engine/metrics.py), by category
+BUCKETS = ("assets", "liabilities", "equity", "revenue", "expenses", "cogs")
+CATEGORY_BUCKETS = {
+    "Assets": "assets", "Capital Expenditures": "assets",
+    "Liabilities": "liabilities",
+    "Equity": "equity", "Retained Earnings": "equity",
+    "Revenue": "revenue", "Sales": "revenue",
+    "Expenses": "expenses", "Operating Expenses": "expenses", "Human Resources": "expenses", "Marketing": "expenses",
+    "COGS": "cogs",
+}
+# Detailed breakdown: total of the rows whose sub_category contains the marker
+DETAILS = (("depreciation", "Depreciation"), ("interest", "Interest"), ("tax", "Tax"))
+TOTALS = BUCKETS + tuple(name for name, _ in DETAILS)
+
+
+def aggregate_document_id(company_id: str, period: str) -> str:
+    """`metric_aggregates` document id for a (company, YYYY-MM) pair."""
+    return f"{company_id}_{period}"
+
+
+def contribution_document_id(source: str) -> str:
+    """`metric_contributions` document id of a source (storage paths contain '/')."""
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:24]
+
+
+def totals_for(category, sub_category) -> tuple:
+    """Names of the TOTALS an amount with this category and sub-category is added to."""
+    bucket = CATEGORY_BUCKETS.get(category)
+    sub_category = str(sub_category or '')
+    details = tuple(name for name, marker in DETAILS if marker in sub_category)
+    return ((bucket,) if bucket else ()) + details
+
+
+class MetricAggregates:
+    """
+    One ingestion run's deltas to `metric_aggregates/{company_id}_{period}`,
+    the materialized totals the Truth Engine answers `metrics` from without
+    scanning transactions. Each mapped row counts once, through its Debit
+    leg, with its `amount_gel`.
+
+    Deltas are accumulated per source and context as entries are stored and
+    written with Firestore increments on `flush`, together with the source's
+    running contribution in `metric_contributions`. The source is
+    `source_key` when given (the upload's full storage path, its upload id,
+    or a hash of a multipart upload's bytes), else the file name passed to
+    `add`, which two folders can share.
+    With `reverse_previous` (a fresh upload, not a resumed job), a source's
+    first flush also subtracts what its previous upload contributed: the
+    contribution is read and replaced, and the reversal and deltas written,
+    in one transaction, so re-uploading a file (unchanged, or remapped to
+    other categories) replaces its totals instead of adding to them, even
+    when two uploads of it race. Every write to an aggregate bumps its
+    `version`.
+    """
+
+    def __init__(self, client, reverse_previous: bool = True, batch_size: int = BATCH_SIZE, source_key: str = None):
+        self._client = client
+        self._reverse_previous = reverse_previous
+        self._batch_size = batch_size
+        self._source_key = source_key
+        self._deltas = {}  # source -> {(company_id, period): {total: amount, 'rows': n}}
+        self._reversed = set()
+        self._targets = {}
+        self.rows_added = 0
+        self.flushes = 0
+        self.contexts_updated = 0
+        self.files_reversed = 0
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._deltas)
+
+    def add(self, records, source_file: str):
+        """Accumulates the Debit legs among `records` (LedgerEntry or dict)."""
+        source = self._source_key or source_file
+        deltas = self._deltas.setdefault(source, {})
+        targets = self._targets
+        for record in records:
+            if record.get('entry_type') != 'Debit':
+                continue
+            row = record.row if isinstance(record, ledger_entries.LedgerEntry) else record
+            key = (row.get('company_id'), str(row.get('date', ''))[:7])
+            context = deltas.get(key)
+            if context is None:
+                context = deltas[key] = dict.fromkeys(TOTALS, 0.0)
+                context['rows'] = 0
+            category, sub_category = row.get('category'), row.get('sub_category')
+            names = targets.get((category, sub_category))
+            if names is None:
+                names = targets[(category, sub_category)] = totals_for(category, sub_category)
+            amount = float(row.get('amount_gel', 0) or 0)
+            for name in names:
+                context[name] += amount
+            context['rows'] += 1
+            self.rows_added += 1
+        if not deltas:
+            del self._deltas[source]
+
+    def _contribution(self, source: str):
+        return self._client.collection(CONTRIBUTIONS_COLLECTION).document(contribution_document_id(source))
+
+    def _writes(self, source: str, deltas: dict, previous_contexts: dict = None) -> list:
+        """
+        (document, data, merge) writes applying a source's deltas. With
+        `previous_contexts` (a replacing flush, even if empty) they are
+        reversed and the contribution is replaced rather than added to.
+        """
+        from google.cloud import firestore
+
+        aggregates = self._client.collection(AGGREGATES_COLLECTION)
+        replace = previous_contexts is not None
+        changes = {aggregate_document_id(*key): (key, dict(values)) for key, values in deltas.items()}
+        for doc_id, previous in (previous_contexts or {}).items():
+            key = (previous.get('company_id'), previous.get('period'))
+            change = changes.setdefault(doc_id, (key, dict.fromkeys(TOTALS, 0.0) | {'rows': 0}))[1]
+            for name in (*TOTALS, 'rows'):
+                change[name] -= previous.get(name, 0)
+
+        writes = []
+        for doc_id, ((company_id, period), change) in changes.items():
+            writes.append((aggregates.document(doc_id), {
+                'company_id': company_id,
+                'period': period,
+                'totals': {name: firestore.Increment(change[name]) for name in TOTALS},
+                'rows': firestore.Increment(change['rows']),
+                'version': firestore.Increment(1),
+                'updated_at': firestore.SERVER_TIMESTAMP
+            }, True))
+
+        # A replaced contribution starts over from this flush; later flushes add to it
+        contexts = {}
+        for (company_id, period), values in deltas.items():
+            amounts = values if replace else {name: firestore.Increment(values[name]) for name in values}
+            contexts[aggregate_document_id(company_id, period)] = dict(amounts, company_id=company_id, period=period)
+        writes.append((self._contribution(source), {
+            'source': source,
+            'contexts': contexts,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }, not replace))
+        return writes
+
+    def _replace(self, source: str, deltas: dict) -> int:
+        """
+        A source's first flush: reads its previous contribution, reverses it
+        and writes the new deltas in one transaction (retried from the read
+        when another upload of the source commits first). One write per
+        context touched, old or new, within Firestore's 500 per transaction.
+        """
+        from google.cloud import firestore
+
+        contribution = self._contribution(source)
+
+        @firestore.transactional
+        def replace(transaction):
+            doc = contribution.get(transaction=transaction)
+            previous_contexts = (doc.to_dict() or {}).get('contexts', {}) if doc.exists else {}
+            writes = self._writes(source, deltas, previous_contexts)
+            for doc_ref, data, merge in writes:
+                transaction.set(doc_ref, data, merge=merge)
+            return len(writes), bool(previous_contexts)
+
+        count, reversed_previous = replace(self._client.transaction())
+        self._reversed.add(source)
+        if reversed_previous:
+            self.files_reversed += 1
+        self.contexts_updated += count - 1
+        return count
+
+    def flush(self, batch=None) -> int:
+        """
+        Writes the pending deltas; returns the number of writes. Into `batch`
+        when given (the caller commits it, e.g. atomically with a job
+        checkpoint), otherwise in batches of its own. A source's replacing
+        first flush commits in its own transaction first (see _replace): a
+        run that dies before `batch` commits is replayed as a fresh upload,
+        which reverses what the transaction added.
+        """
+        if not self._deltas:
+            return 0
+        count = 0
+        writes = []
+        for source, deltas in self._deltas.items():
+            if self._reverse_previous and source not in self._reversed:
+                count += self._replace(source, deltas)
+            else:
+                source_writes = self._writes(source, deltas)
+                self.contexts_updated += len(source_writes) - 1
+                writes.extend(source_writes)
+        self._deltas = {}
+        if batch is not None:
+            for doc_ref, data, merge in writes:
+                batch.set(doc_ref, data, merge=merge)
+        else:
+            for offset in range(0, len(writes), self._batch_size):
+                own_batch = self._client.batch()
+                for doc_ref, data, merge in writes[offset:offset + self._batch_size]:
+                    own_batch.set(doc_ref, data, merge=merge)
+                own_batch.commit()
+        self.flushes += 1
+        return count + len(writes)
+
+    def close(self) -> dict:
+        self.flush()
+        return self.stats()
+
+    def stats(self) -> dict:
+        return {
+            'rows_added': self.rows_added,
+            'flushes': self.flushes,
+            'contexts_updated': self.contexts_updated,
+            'files_reversed': self.files_reversed
+        }
@@ -0,0 +1,101 @@
+# PDF Pages - parallel page-level text extraction and bounded text chunks
+
+import hashlib
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Worker processes for page extraction (pypdf is pure Python, so threads would serialize on the GIL)
+PDF_WORKERS = int(os.environ.get('INGEST_PDF_WORKERS', '0')) or os.cpu_count() or 1
+# Pages handed to a worker per task
+PDF_PAGES_PER_TASK = int(os.environ.get('INGEST_PDF_PAGES_PER_TASK', '8'))
+# Characters per stored chunk; 4 bytes per character at worst keeps it under Firestore's 1 MiB document limit
+PDF_CHUNK_CHARS = int(os.environ.get('INGEST_PDF_CHUNK_CHARS', '200000'))
+
+# Reader of the current pool, parsed once per worker process
+_worker_reader = None
+
+
+def upload_id_for(pdf_bytes: bytes) -> str:
+    """Content-derived upload id, so re-ingesting the same PDF overwrites its chunks."""
+    return hashlib.blake2b(pdf_bytes, digest_size=12).hexdigest()
+
+
+def _open(source):
+    """PdfReader over PDF bytes or over the stream returned by an opener (e.g. blob_stream.open_storage)."""
+    from pypdf import PdfReader
+    return PdfReader(source() if callable(source) else io.BytesIO(source))
+
+
+def _page_text(reader, index: int) -> str:
+    return reader.pages[index].extract_text() or ''
+
+
+def _init_worker(source):
+    global _worker_reader
+    _worker_reader = _open(source)
+
+
+def _extract_range(start: int, stop: int) -> list:
+    return [_page_text(_worker_reader, i) for i in range(start, stop)]
+
+
+def iter_page_texts(source, workers: int = None, on_first_page=None):
+    """
+    Yields the text of every page in order. The first page is extracted here
+    and passed to `on_first_page(text, page_count)` before the rest starts,
+    so a preview is available while the remaining pages are still running.
+    `source` is the PDF as bytes or a picklable opener returning a seekable
+    stream; with an opener each worker reads only the byte ranges its pages
+    need. The remaining pages are extracted by spawned worker processes (a
+    fork would inherit the caller's gRPC Firestore client, already used for
+    the preview), in ranges of PDF_PAGES_PER_TASK. With a single worker (or
+    range) they are extracted in this process.
+    """
+    reader = _open(source)
+    page_count = len(reader.pages)
+    if page_count == 0:
+        return
+    first = _page_text(reader, 0)
+    if on_first_page is not None:
+        on_first_page(first, page_count)
+    yield first
+
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count)) for start in range(1, page_count, PDF_PAGES_PER_TASK)]
+    workers = max(1, min(workers or PDF_WORKERS, len(ranges)))
+    if workers == 1:
+        for index in range(1, page_count):
+            yield _page_text(reader, index)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(source,)) as pool:
+        # map keeps page order; later ranges keep extracting while earlier ones are consumed
+        for texts in pool.map(_extract_range, *zip(*ranges)):
+            yield from texts
+
+
+def chunk_pages(page_texts, max_chars: int = PDF_CHUNK_CHARS):
+    """
+    Packs page texts (each followed by a newline) into chunks of at most
+    `max_chars` characters: {'content', 'page_start', 'page_end'} with
+    1-based page numbers. Pages are kept whole where they fit; a longer page
+    is split across chunks. Joining the contents gives back the full text.
+    """
+    parts, size, page_start, page_end = [], 0, None, None
+    for number, text in enumerate(page_texts, 1):
+        text += '\n'
+        while text:
+            room = max_chars - size
+            if len(text) > room and parts:
+                yield {'content': ''.join(parts), 'page_start': page_start, 'page_end': page_end}
+                parts, size, page_start = [], 0, None
+                continue
+            piece, text = text[:room], text[room:]
+            parts.append(piece)
+            size += len(piece)
+            page_start = page_start or number
+            page_end = number
+    if parts:
+        yield {'content': ''.join(parts), 'page_start': page_start, 'page_end': page_end}
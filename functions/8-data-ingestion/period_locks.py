@@ -0,0 +1,77 @@
+# Period Lock Cache - batched `period_controls` lookups shared across requests
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Kept short: a CFO locking a period must take effect within seconds
+LOCK_CACHE_TTL_SEC = float(os.environ.get('PERIOD_LOCK_CACHE_TTL_SEC', '30'))
+
+LOCK_COLLECTION = 'period_controls'
+
+
+def lock_document_id(company_id: str, period: str) -> str:
+    """`period_controls` document id for a (company, YYYY-MM) pair."""
+    return f"{company_id}_{period}"
+
+
+class PeriodLockCache:
+    """
+    Resolves the lock state of many (company_id, period) pairs at once.
+    Pairs that are unknown or older than the TTL are fetched together with a
+    single `load_states` call (one Firestore `get_all`); the rest are answered
+    from memory, so a chunked upload pays at most one round trip per new month.
+    """
+
+    def __init__(self, load_states, ttl_sec: float = LOCK_CACHE_TTL_SEC, clock=time.monotonic):
+        self._load_states = load_states
+        self._ttl_sec = ttl_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._states = {}  # (company_id, period) -> (locked, fetched_at)
+
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    def locked(self, contexts) -> list:
+        """Returns the locked (company_id, period) pairs among `contexts`, sorted."""
+        contexts = set(contexts)
+        now = self._clock()
+        with self._lock:
+            missing = sorted(c for c in contexts
+                             if c not in self._states or now - self._states[c][1] >= self._ttl_sec)
+            self.hits += len(contexts) - len(missing)
+            self.misses += len(missing)
+
+        fetched = {}
+        if missing:
+            try:
+                fetched = self._load_states(missing)
+                self.fetches += 1
+            except Exception as e:
+                # Same policy as the per-document check: an unreadable lock is treated as open
+                logger.error(f"Lock Check Error: {e}")
+                fetched = None
+
+        with self._lock:
+            if fetched is not None:
+                fetched_at = self._clock()
+                for context in missing:
+                    self._states[context] = (bool(fetched.get(context, False)), fetched_at)
+            return sorted(c for c in contexts if c in self._states and self._states[c][0])
+
+    def invalidate(self):
+        with self._lock:
+            self._states.clear()
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'fetches': self.fetches,
+            'cached': len(self._states)
+        }
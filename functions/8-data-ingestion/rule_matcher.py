@@ -0,0 +1,104 @@
+# Mapping Rule Matcher - compiled once per request, shared by every row
+
+NO_MATCH = float('inf')
+
+
+def split_target(target):
+    """'Category > Sub' -> ('Category', 'Sub'); a bare target maps to 'General'."""
+    if '>' in target:
+        parts = [p.strip() for p in target.split('>')]
+        return parts[0], parts[1]
+    return target, 'General'
+
+
+def match_linear(mapping_dict, desc: str, gl: str):
+    """
+    Reference matcher: first rule (in insertion order) whose raw field is a
+    substring of the description or equals the GL code. O(rules) per row.
+    """
+    for raw, target in mapping_dict.items():
+        if raw in desc or (gl and raw == gl):
+            return split_target(target)
+    return None
+
+
+class RuleMatcher:
+    """
+    Aho-Corasick automaton over the rule raw fields plus a hash index for
+    exact GL codes. A single pass over the description finds every rule that
+    occurs in it; the lowest rule index wins, which preserves the first-match
+    priority of `match_linear`.
+    """
+
+    def __init__(self, mapping_dict):
+        self._targets = [split_target(target) for target in mapping_dict.values()]
+        self._gl_index = {}
+        self._always = NO_MATCH  # An empty raw field matches every description
+
+        # Trie: per-node transitions, failure link and best (lowest) rule index
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [NO_MATCH]
+
+        for priority, raw in enumerate(mapping_dict.keys()):
+            self._gl_index.setdefault(raw, priority)
+            if not raw:
+                self._always = min(self._always, priority)
+                continue
+            state = 0
+            for ch in raw:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(NO_MATCH)
+                state = nxt
+            self._best[state] = min(self._best[state], priority)
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                # Fold the output chain into the node so scanning needs no extra walk
+                self._best[nxt] = min(self._best[nxt], self._best[self._fail[nxt]])
+                queue.append(nxt)
+
+    def __len__(self):
+        return len(self._targets)
+
+    def match(self, desc: str, gl: str):
+        """Returns (category, sub_category) of the highest-priority rule, or None."""
+        best = self._always
+        if gl:
+            best = min(best, self._gl_index.get(gl, NO_MATCH))
+
+        goto, fail, best_at = self._goto, self._fail, self._best
+        state = 0
+        for ch in desc:
+            if best == 0:
+                break
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if best_at[state] < best:
+                best = best_at[state]
+
+        if best == NO_MATCH:
+            return None
+        return self._targets[best]
+
+
+def compile_rules(mapping_dict) -> RuleMatcher:
+    """Builds the matcher once per request from the `mapping_rules` dict."""
+    return RuleMatcher(mapping_dict)
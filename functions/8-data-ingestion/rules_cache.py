@@ -0,0 +1,84 @@
+# Mapping Rules Cache - keeps the compiled matcher warm across requests
+
+import logging
+import os
+import threading
+import time
+
+import rule_matcher
+
+logger = logging.getLogger(__name__)
+
+RULES_CACHE_TTL_SEC = float(os.environ.get('MAPPING_RULES_CACHE_TTL_SEC', '900'))
+
+# Marker document bumped by every writer of `mapping_rules`
+VERSION_COLLECTION = 'system_config'
+VERSION_DOCUMENT = 'mapping_rules_version'
+
+
+class MappingRulesCache:
+    """
+    Warm-instance cache for `mapping_rules`.
+    Each lookup reads only the small version marker; the full collection is
+    streamed again when the marker changes or the TTL runs out. The compiled
+    RuleMatcher is rebuilt only when the rules themselves changed.
+    """
+
+    def __init__(self, load_rules, read_version, ttl_sec: float = RULES_CACHE_TTL_SEC, clock=time.monotonic):
+        self._load_rules = load_rules
+        self._read_version = read_version
+        self._ttl_sec = ttl_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._rules = None
+        self._matcher = None
+        self._version = None
+        self._loaded_at = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    def get(self) -> rule_matcher.RuleMatcher:
+        try:
+            version = self._read_version()
+        except Exception as e:
+            logger.error(f"Mapping rules version check failed: {e}")
+            version = self._version
+
+        with self._lock:
+            fresh = self._clock() - self._loaded_at < self._ttl_sec
+            if self._matcher is not None and fresh and version == self._version:
+                self.hits += 1
+                return self._matcher
+
+            self.misses += 1
+            try:
+                rules = self._load_rules()
+            except Exception as e:
+                logger.error(f"Error loading mapping rules: {e}")
+                # Serve the stale matcher rather than ingesting with no rules
+                return self._matcher if self._matcher is not None else rule_matcher.compile_rules({})
+
+            if rules != self._rules:
+                self._matcher = rule_matcher.compile_rules(rules)
+                self._rules = rules
+                self.rebuilds += 1
+            self._version = version
+            self._loaded_at = self._clock()
+            logger.info(f"Mapping rules cache refreshed: {len(rules)} rules, version={version}")
+            return self._matcher
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'rebuilds': self.rebuilds,
+            'version': self._version,
+            'rules': len(self._rules) if self._rules is not None else 0
+        }
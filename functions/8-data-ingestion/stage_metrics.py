@@ -0,0 +1,119 @@
+# Stage Metrics - per-stage timings and counters of one ingestion, logged and persisted
+
+import contextlib
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Canonical order of the stages in logs and in `file_processing_logs`
+STAGES = ('parse', 'lock_check', 'map', 'store')
+
+
+class IngestionMetrics:
+    """
+    Collects where an upload's time goes: seconds and row counts per stage
+    (parse, lock_check, map, store, ...) plus bytes read and write retries.
+    Stages may be entered many times (once per chunk); durations add up.
+
+    `log()` emits one JSON line with every field, so Cloud Logging can
+    aggregate by stage; `persist()` merges the same fields into the
+    upload's `file_processing_logs/{upload_id}` document, where
+    get_upload_status serves them.
+
+    Usage:
+        metrics = IngestionMetrics(upload_id, filename, mode)
+        with metrics.stage('map', rows=len(chunk)):
+            ...
+        metrics.persist(doc_ref, status)
+    """
+
+    def __init__(self, upload_id: str, filename: str, mode: str, clock=time.perf_counter):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.mode = mode
+        self._clock = clock
+        self._started_at = clock()
+        self._stages = {}
+        self.counters = {'bytes_read': 0, 'rows_written': 0, 'write_retries': 0}
+        self._bytes_source = None
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows: int = 0):
+        """Times the block; set `['rows']` on the yielded dict when the count is only known at the end."""
+        started_at = self._clock()
+        counts = {'rows': rows}
+        try:
+            yield counts
+        finally:
+            self.add(name, self._clock() - started_at, counts['rows'])
+
+    def add(self, name: str, seconds: float, rows: int = 0):
+        stage = self._stages.setdefault(name, {'sec': 0.0, 'rows': 0, 'calls': 0})
+        stage['sec'] += seconds
+        stage['rows'] += rows
+        stage['calls'] += 1
+
+    def timed(self, name: str, iterable):
+        """Yields from `iterable`, charging the time spent waiting for each item to stage `name`."""
+        it = iter(iterable)
+        while True:
+            started_at = self._clock()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add(name, self._clock() - started_at)
+                return
+            sized = hasattr(item, '__len__') and not isinstance(item, (str, bytes))
+            self.add(name, self._clock() - started_at, len(item) if sized else 1)
+            yield item
+
+    def track_bytes(self, read_bytes):
+        """Adds `read_bytes()` (e.g. a stream's fetched bytes) to bytes_read whenever a summary is taken."""
+        self._bytes_source = read_bytes
+
+    def count(self, name: str, value: int):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def record_writes(self, write_stats: dict):
+        """Written rows and retries from BulkWriter.stats()."""
+        if write_stats:
+            self.count('rows_written', write_stats.get('rows_written', 0))
+            self.count('write_retries', write_stats.get('retries', 0))
+
+    def summary(self) -> dict:
+        ordered = [s for s in STAGES if s in self._stages] + sorted(s for s in self._stages if s not in STAGES)
+        stages = {}
+        for name in ordered:
+            stage = self._stages[name]
+            stages[name] = {
+                'sec': round(stage['sec'], 3),
+                'rows': stage['rows'],
+                'rows_per_sec': round(stage['rows'] / stage['sec'], 1) if stage['sec'] > 0 and stage['rows'] else 0.0
+            }
+        counters = dict(self.counters)
+        if self._bytes_source is not None:
+            counters['bytes_read'] += int(self._bytes_source())
+        return dict(counters, stages=stages, total_sec=round(self._clock() - self._started_at, 3))
+
+    def log(self, status: str):
+        logger.info(json.dumps(dict(
+            self.summary(),
+            message=f"Ingestion metrics for {self.filename}",
+            event='ingestion_metrics',
+            upload_id=self.upload_id,
+            file_name=self.filename,
+            mode=self.mode,
+            status=status
+        )))
+
+    def persist(self, doc_ref, status: str, **fields) -> dict:
+        """Logs the metrics, then merges them (and `fields`) into the upload document."""
+        from google.cloud import firestore
+
+        self.log(status)
+        summary = self.summary()
+        doc_ref.set(dict(fields, status=status, file_name=self.filename, mode=self.mode, metrics=summary,
+                         timestamp=firestore.SERVER_TIMESTAMP), merge=True)
+        return summary
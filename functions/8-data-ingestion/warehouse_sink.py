@@ -0,0 +1,301 @@
+# Warehouse Sink - ledger entries loaded into BigQuery `consolidated_ledger` in batched Parquet files
+
+import datetime
+import io
+import logging
+import os
+import time
+import uuid
+
+import ledger_entries
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ID = os.environ.get('GCP_PROJECT') or os.environ.get('GOOGLE_CLOUD_PROJECT')
+WAREHOUSE_DATASET = os.environ.get('INGEST_WAREHOUSE_DATASET', 'financial_data')
+WAREHOUSE_TABLE = os.environ.get('INGEST_WAREHOUSE_TABLE', 'consolidated_ledger')
+# Load into BigQuery when set to 1 (deployments with the dataset); off by default
+WAREHOUSE_ENABLED = os.environ.get('INGEST_WAREHOUSE') == '1'
+# Local directory stand-in for BigQuery: each batch becomes a Parquet file under it (tests, local runs)
+LOCAL_WAREHOUSE_DIR = os.environ.get('INGEST_LOCAL_WAREHOUSE_DIR')
+# A batch is loaded once it holds this many entries, or this long after the previous load
+FLUSH_ROWS = int(os.environ.get('INGEST_WAREHOUSE_FLUSH_ROWS', '100000'))
+FLUSH_SEC = float(os.environ.get('INGEST_WAREHOUSE_FLUSH_SEC', '60'))
+
+# Table columns, in the camelCase the analysis service queries (transactionDate, itemCode, amount)
+COLUMNS = ('entryId', 'companyId', 'transactionDate', 'period', 'category', 'subCategory', 'department',
+           'account', 'entryType', 'itemCode', 'description', 'amount', 'sourceFile', 'ingestedAt')
+# Columns taken from the mapped row (shared by both legs), with the row key they are read from
+# (strings set by apply_mapping); None where the value is derived in WarehouseSink
+ROW_FIELDS = {
+    'date': 'date',
+    'companyId': 'company_id',
+    'category': 'category',
+    'subCategory': 'sub_category',
+    'department': 'department',
+    'description': None,
+    'itemCode': None,
+    'amount': None,
+    'sourceFile': None,
+    'ingestedAt': None,
+}
+
+
+def schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('entryId', pa.string()),
+        ('companyId', pa.string()),
+        ('transactionDate', pa.date32()),
+        ('period', pa.string()),
+        ('category', pa.string()),
+        ('subCategory', pa.string()),
+        ('department', pa.string()),
+        ('account', pa.string()),
+        ('entryType', pa.string()),
+        ('itemCode', pa.string()),
+        ('description', pa.string()),
+        ('amount', pa.float64()),
+        ('sourceFile', pa.string()),
+        ('ingestedAt', pa.timestamp('us', tz='UTC')),
+    ])
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def parquet_bytes(table) -> bytes:
+    import pyarrow.parquet as pq
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression='snappy')
+    return buffer.getvalue()
+
+
+class LocalParquetLoader:
+    """
+    Offline stand-in for the BigQuery load: each batch is written as
+    `directory/<table>/part-NNNNN-*.parquet`. Like the BigQuery merge, an
+    entry already in the directory is replaced: its row is dropped from the
+    older part file before the batch is written.
+    """
+
+    def __init__(self, directory: str, table: str = WAREHOUSE_TABLE):
+        self.directory = os.path.join(directory, table)
+        self.batches = 0
+        self._parts = None  # entryId -> part file holding it, read from the directory on the first load
+
+    def _index(self) -> dict:
+        if self._parts is None:
+            import pyarrow.parquet as pq
+            self._parts = {}
+            for name in sorted(os.listdir(self.directory)):
+                path = os.path.join(self.directory, name)
+                self._parts.update(dict.fromkeys(pq.read_table(path, columns=['entryId'])['entryId'].to_pylist(), path))
+        return self._parts
+
+    def _drop(self, path: str, entry_ids) -> int:
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        part = pq.read_table(path)
+        kept = part.filter(pc.invert(pc.is_in(part['entryId'], value_set=entry_ids)))
+        if kept.num_rows:
+            pq.write_table(kept, path, compression='snappy')
+        else:
+            os.remove(path)
+        return part.num_rows - kept.num_rows
+
+    def load(self, table) -> dict:
+        os.makedirs(self.directory, exist_ok=True)
+        parts = self._index()
+        entry_ids = table['entryId'].to_pylist()
+        stale = {parts[entry_id] for entry_id in entry_ids if entry_id in parts}
+        batch_ids = table['entryId'].combine_chunks()
+        replaced = sum(self._drop(part, batch_ids) for part in sorted(stale))
+        data = parquet_bytes(table)
+        path = os.path.join(self.directory, f"part-{self.batches:05d}-{uuid.uuid4().hex[:8]}.parquet")
+        with open(path, 'wb') as f:
+            f.write(data)
+        parts.update(dict.fromkeys(entry_ids, path))
+        self.batches += 1
+        return {'rows': table.num_rows, 'bytes': len(data), 'path': path, 'replaced': replaced}
+
+
+def merge_statement(table_id: str, staging_id: str) -> str:
+    """MERGE of a staged batch into the table on entryId: a reloaded entry replaces its row, a new one is inserted."""
+    updates = ', '.join(f"{name} = S.{name}" for name in COLUMNS if name != 'entryId')
+    return (f"MERGE `{table_id}` T USING `{staging_id}` S ON T.entryId = S.entryId "
+            f"WHEN MATCHED THEN UPDATE SET {updates} "
+            f"WHEN NOT MATCHED THEN INSERT ROW")
+
+
+class BigQueryLoader:
+    """
+    Loads each batch into `dataset.table` with one Parquet load job (batch
+    loads, not streaming inserts) into a staging table, merged into the
+    table on entryId. A replayed job chunk or a re-uploaded file replaces
+    its rows instead of appending them a second time.
+    """
+
+    def __init__(self, project_id: str = PROJECT_ID, dataset: str = WAREHOUSE_DATASET, table: str = WAREHOUSE_TABLE):
+        self.table_id = f"{project_id}.{dataset}.{table}" if project_id else f"{dataset}.{table}"
+        self._client = None
+        self._table_ready = False
+
+    def load(self, table) -> dict:
+        from google.cloud import bigquery
+        if self._client is None:
+            self._client = bigquery.Client()
+        data = parquet_bytes(table)
+        staging_id = f"{self.table_id}_staging_{uuid.uuid4().hex[:12]}"
+        job_config = bigquery.LoadJobConfig(source_format=bigquery.SourceFormat.PARQUET,
+                                            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+        try:
+            self._client.load_table_from_file(io.BytesIO(data), staging_id, job_config=job_config).result()
+            if not self._table_ready:
+                # MERGE needs the table; the first load of a new dataset creates it with the batch's schema
+                schema = self._client.get_table(staging_id).schema
+                self._client.create_table(bigquery.Table(self.table_id, schema=schema), exists_ok=True)
+                self._table_ready = True
+            job = self._client.query(merge_statement(self.table_id, staging_id))
+            job.result()
+        finally:
+            self._client.delete_table(staging_id, not_found_ok=True)
+        return {'rows': table.num_rows, 'bytes': len(data), 'job_id': job.job_id}
+
+
+class WarehouseSink:
+    """
+    Second sink of an ingestion run, next to Firestore: ledger entries are
+    buffered as columns and loaded in large Parquet batches once FLUSH_ROWS
+    entries are buffered or FLUSH_SEC have passed since the last load, and
+    at close. The time trigger is checked as entries arrive, so a slow run
+    still loads regularly; nothing is buffered across runs.
+
+    Entries carry their Firestore document id (`entryId`, a content hash),
+    and loads merge on it, so a replayed chunk or a re-upload replaces rows
+    rather than adding them twice. Both legs of a double entry carry the
+    row's amount in GEL: totals sum one side (entryType = 'Debit'), as the
+    ingestion's total_value_gel does. A failed load is
+    logged and counted in `rows_failed` rather than failing the ingestion,
+    whose Firestore writes are the record of truth.
+    """
+
+    def __init__(self, loader, flush_rows: int = FLUSH_ROWS, flush_sec: float = FLUSH_SEC, clock=time.monotonic):
+        self._loader = loader
+        self._flush_rows = flush_rows
+        self._flush_sec = flush_sec
+        self._clock = clock
+        self._last_flush = clock()
+        self._reset()
+        self.rows_buffered = 0
+        self.rows_loaded = 0
+        self.rows_failed = 0
+        self.batches = 0
+        self.bytes_loaded = 0
+        self.load_sec = 0.0
+
+    def _reset(self):
+        # Both legs of a double entry share their mapped row: row fields are buffered once per row,
+        # leg fields once per entry, with the index of the entry's row
+        self._rows = {name: [] for name in ROW_FIELDS}
+        self._legs = {'entryId': [], 'account': [], 'entryType': [], 'row': []}
+
+    def add(self, records, entry_ids, source_file: str):
+        """Buffers ledger entries (LedgerEntry or dict) with their document ids; loads a batch when one is due."""
+        rows, legs = self._rows, self._legs
+        base = len(rows['date'])
+        index_of = {}
+        fresh = []
+        for record, entry_id in zip(records, entry_ids):
+            row = record.row if isinstance(record, ledger_entries.LedgerEntry) else record
+            index = index_of.get(id(row))
+            if index is None:
+                index = index_of[id(row)] = base + len(fresh)
+                fresh.append(row)
+            legs['row'].append(index)
+            legs['entryId'].append(entry_id)
+            legs['account'].append(record.get('account'))
+            legs['entryType'].append(record.get('entry_type'))
+
+        if fresh:
+            for name, key in ROW_FIELDS.items():
+                if key is not None:
+                    rows[name].extend([row.get(key) for row in fresh])
+            # Raw source columns: numbers in some exports
+            rows['description'].extend([_text(row.get('description')) for row in fresh])
+            rows['itemCode'].extend([_text(row.get('itemCode', row.get('item_code'))) for row in fresh])
+            rows['amount'].extend([float(row.get('amount_gel', 0) or 0) for row in fresh])
+            rows['sourceFile'].extend([source_file] * len(fresh))
+            rows['ingestedAt'].extend([datetime.datetime.now(datetime.timezone.utc)] * len(fresh))
+        self.rows_buffered = len(legs['row'])
+
+        if self.rows_buffered >= self._flush_rows or \
+                (self.rows_buffered and self._clock() - self._last_flush >= self._flush_sec):
+            self.flush()
+
+    def _table(self, rows: dict, legs: dict):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        fields = schema()
+        columns = {name: pa.array(legs[name], type=fields.field(name).type) for name in ('entryId', 'account', 'entryType')}
+        dates = pa.array(rows['date'], type=pa.string())
+        row_columns = {name: pa.array(rows[name], type=fields.field(name).type) for name in ROW_FIELDS if name != 'date'}
+        # Dates that did not normalize to ISO load as NULL
+        row_columns['transactionDate'] = pc.cast(pc.strptime(dates, format='%Y-%m-%d', unit='s', error_is_null=True), pa.date32())
+        row_columns['period'] = pc.utf8_slice_codeunits(dates, 0, 7)
+        positions = pa.array(legs['row'], type=pa.int64())
+        columns.update((name, array.take(positions)) for name, array in row_columns.items())
+        return pa.Table.from_arrays([columns[name] for name in COLUMNS], schema=fields)
+
+    def flush(self) -> dict:
+        """Loads the buffered entries as one batch."""
+        if not self.rows_buffered:
+            return {}
+        count = self.rows_buffered
+        rows, legs = self._rows, self._legs
+        self._reset()
+        self.rows_buffered = 0
+        self._last_flush = self._clock()
+        started_at = time.perf_counter()
+        try:
+            result = self._loader.load(self._table(rows, legs))
+        except Exception as e:
+            self.rows_failed += count
+            logger.error(f"Warehouse load of {count} entries failed: {e}")
+            return {}
+        finally:
+            self.load_sec += time.perf_counter() - started_at
+
+        self.rows_loaded += count
+        self.batches += 1
+        self.bytes_loaded += result.get('bytes', 0)
+        logger.info(f"Loaded {count} entries into the warehouse: {result}")
+        return result
+
+    def close(self) -> dict:
+        self.flush()
+        return self.stats()
+
+    def stats(self) -> dict:
+        return {
+            'rows_loaded': self.rows_loaded,
+            'rows_failed': self.rows_failed,
+            'rows_buffered': self.rows_buffered,
+            'batches': self.batches,
+            'bytes_loaded': self.bytes_loaded,
+            'load_sec': round(self.load_sec, 3),
+            'rows_per_sec': round(self.rows_loaded / self.load_sec, 1) if self.load_sec > 0 else 0.0
+        }
+
+
+def open_sink(flush_rows: int = FLUSH_ROWS, flush_sec: float = FLUSH_SEC):
+    """A sink for one ingestion run: local Parquet files, BigQuery, or None when neither is configured."""
+    if LOCAL_WAREHOUSE_DIR:
+        loader = LocalParquetLoader(LOCAL_WAREHOUSE_DIR)
+    elif WAREHOUSE_ENABLED:
+        loader = BigQueryLoader()
+    else:
+        return None
+    return WarehouseSink(loader, flush_rows=flush_rows, flush_sec=flush_sec)
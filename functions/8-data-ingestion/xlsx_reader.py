@@ -0,0 +1,107 @@
+# Streaming XLSX Reader - read-only openpyxl iteration with header detection
+
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Rows scanned for the header before falling back to the first non-empty row
+HEADER_SCAN_ROWS = 30
+
+
+def _is_blank(row) -> bool:
+    return all(v is None or (isinstance(v, str) and not v.strip()) for v in row)
+
+
+class XlsxRecordReader:
+    """
+    Iterates a worksheet as record dicts without building the workbook object
+    model: openpyxl's read-only mode parses the sheet XML as it is consumed,
+    so memory stays flat regardless of the workbook size.
+
+    Exports often start with a title block (company name, report period) above
+    the real header. The first row within `header_scan_rows` accepted by
+    `is_header` is used; otherwise the first non-empty row.
+    With `as_tuples`, rows are tuples aligned to `headers` instead of dicts.
+
+    Usage:
+        reader = XlsxRecordReader(file_stream, is_header=...)
+        for record in reader:
+            ...
+        reader.stats()
+    """
+
+    def __init__(self, file_stream, is_header=None, sheet_name: str = None, header_scan_rows: int = HEADER_SCAN_ROWS,
+                 as_tuples: bool = False):
+        self._file_stream = file_stream
+        self._as_tuples = as_tuples
+        self._is_header = is_header
+        self._sheet_name = sheet_name
+        self._header_scan_rows = header_scan_rows
+
+        self.header_row = None  # 1-based sheet row of the detected header
+        self.headers = []
+        self.rows = 0
+        self.skipped_blank = 0
+        self._started_at = None
+        self._finished_at = None
+
+    def __iter__(self):
+        import openpyxl
+
+        self._started_at = time.perf_counter()
+        self._file_stream.seek(0)
+        wb = openpyxl.load_workbook(self._file_stream, read_only=True, data_only=True)
+        try:
+            ws = wb[self._sheet_name] if self._sheet_name else wb.active
+            # Dimensions written by some exporters are wrong; read to the real end
+            ws.reset_dimensions()
+            rows_iter = ws.iter_rows(values_only=True)
+
+            scanned = list(itertools.islice(rows_iter, self._header_scan_rows))
+            header_index = self._find_header(scanned)
+            if header_index is None:
+                return
+            self.header_row = header_index + 1
+            columns = [(i, str(h).strip()) for i, h in enumerate(scanned[header_index])
+                       if h is not None and str(h).strip()]
+            self.headers = [name for _, name in columns]
+            logger.info(f"XLSX header found on row {self.header_row}: {self.headers}")
+
+            for row in itertools.chain(scanned[header_index + 1:], rows_iter):
+                if _is_blank(row):
+                    self.skipped_blank += 1
+                    continue
+                self.rows += 1
+                if self._as_tuples:
+                    yield tuple(row[i] if i < len(row) else None for i, _ in columns)
+                else:
+                    yield {name: (row[i] if i < len(row) else None) for i, name in columns}
+        finally:
+            wb.close()
+            self._finished_at = time.perf_counter()
+
+    def _find_header(self, scanned):
+        first_non_empty = None
+        for index, row in enumerate(scanned):
+            if _is_blank(row):
+                continue
+            if first_non_empty is None:
+                first_non_empty = index
+            if self._is_header is not None and self._is_header([str(v) for v in row if v is not None]):
+                return index
+        return first_non_empty
+
+    def stats(self) -> dict:
+        if self._started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._finished_at or time.perf_counter()) - self._started_at
+        return {
+            'header_row': self.header_row,
+            'rows': self.rows,
+            'skipped_blank_rows': self.skipped_blank,
+            'elapsed_sec': round(elapsed, 3),
+            'rows_per_sec': round(self.rows / elapsed, 1) if elapsed > 0 else 0.0
+        }
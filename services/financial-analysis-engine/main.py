@@ -146,6 +146,7 @@ def generate_forecast():
                 SUM(amount) as y
             FROM `{PROJECT_ID}.financial_data.consolidated_ledger`
             WHERE itemCode = '{item_code}'
+              AND entryType = 'Debit'  -- both legs of an entry carry its amount
             GROUP BY ds
             ORDER BY ds DESC
             LIMIT 12
@@ -368,7 +369,15 @@ def get_upload_status(upload_id: str):
             'status': status_data.get('status', 'unknown'),
             'file_name': status_data.get('file_name'),
             'rows_processed': status_data.get('rows_processed', 0),
+            # Progress of chunked and async ingestion (rows_total is an estimate until completed)
+            'rows_done': status_data.get('raw_rows_committed'),
+            'rows_total': status_data.get('rows_total'),
+            'progress': status_data.get('progress'),
             'quality_score': status_data.get('quality_score', 0),
+            'mode': status_data.get('mode'),
+            'error': status_data.get('error'),
+            # Per-stage timings, bytes read and write retries recorded by 8-data-ingestion
+            'metrics': status_data.get('metrics'),
             'timestamp': status_data.get('timestamp')
         })
         
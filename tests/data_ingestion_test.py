@@ -0,0 +1,1346 @@
+import functools
+import importlib.util
+import io
+import itertools
+import json
+import os
+import re
+import sys
+
+import pytest
+
+# Testing Framework for the Data Ingestion function (8-data-ingestion)
+# Firestore side effects are replaced per-test; no live GCP calls are made.
+
+INGESTION_DIR = os.path.join(os.path.dirname(__file__), '..', 'functions', '8-data-ingestion')
+sys.path.insert(0, os.path.abspath(INGESTION_DIR))
+
+
+def load_ingestion_main():
+    spec = importlib.util.spec_from_file_location('data_ingestion_main', os.path.join(INGESTION_DIR, 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+SAMPLE_CSV = (
+    "date,Company,gl_account,description,amount,currency\n"
+    "2024-07-01,SGG,4001,Social gas sale,100.00,GEL\n"
+    "2024-07-02,SOG Export,5100,Pipeline cost,50.00,USD\n"
+    "2024-07-03,Telavi Branch,1200,Office equipment,25.50,EUR\n"
+    "2024-08-01,SGG,2100,Supplier invoice,10.00,GEL\n"
+    "2024-08-02,SGG,3000,Retained earnings,5.00,GEL\n"
+)
+
+
+@pytest.fixture
+def ingestion(monkeypatch):
+    module = load_ingestion_main()
+    stored = []
+    monkeypatch.setattr(module, 'get_db', lambda: None)
+    monkeypatch.setattr(module, 'store_data', lambda records, filename, writer=None, ids=None, sink=None, aggregates=None: stored.extend(dict(r, source_file=filename) for r in records))
+    monkeypatch.setattr(module, 'find_locked_periods', lambda contexts: [])
+    module.stored = stored
+    return module
+
+
+SAMPLE_HEADER, *SAMPLE_ROWS = SAMPLE_CSV.splitlines(keepends=True)
+
+
+def row_path(module, csv_text, mapping_rules=None):
+    """Ledger entries of the production row path: read_rows -> normalize_row_dates -> transform_values."""
+    plan, rows, _ = module.read_rows(io.BytesIO(csv_text.encode('utf-8')), 'july.csv')
+    rows = module.normalize_row_dates(plan, rows, module.date_normalizer_for(plan))
+    return module.transform_values(plan, rows, mapping_rules or {})
+
+
+def stream_chunks(module, csv_text, chunk_rows, skip=0):
+    """Chunks of the row path after the first `skip` rows, and the ingest_chunks arguments that map them."""
+    plan, rows, _ = module.read_rows(io.BytesIO(csv_text.encode('utf-8')), 'july.csv')
+    rows = module.normalize_row_dates(plan, itertools.islice(rows, skip, None), module.date_normalizer_for(plan))
+    return module.iter_chunks(rows, chunk_rows), {'transform': functools.partial(module.transform_values, plan),
+                                                  'lock_contexts': functools.partial(module.plan_lock_contexts, plan)}
+
+
+def full_mode_summary(module, csv_text):
+    ledger = row_path(module, csv_text)
+    total = sum(float(r.get('amount_gel', 0)) for r in ledger if r.get('entry_type') == 'Debit')
+    return len(ledger), total
+
+
+def test_stream_summary_matches_full_mode(ingestion):
+    """
+    Streaming with a chunk size smaller than the file must report the same
+    totals as the in-memory path and store every ledger entry.
+    """
+    chunks, path = stream_chunks(ingestion, SAMPLE_CSV, 2)
+    summary = ingestion.ingest_chunks(chunks, {}, 'july.csv', **path)
+
+    expected_rows, expected_total = full_mode_summary(ingestion, SAMPLE_CSV)
+    assert summary['rows_processed'] == expected_rows == len(ingestion.stored)
+    assert summary['unique_raw_rows'] == 5
+    assert summary['total_value_gel'] == pytest.approx(expected_total)
+    assert 'entry_type' in summary['columns'] and 'account' in summary['columns']
+
+
+def test_stream_stops_before_locked_chunk(ingestion, monkeypatch):
+    monkeypatch.setattr(ingestion, 'find_locked_periods', lambda contexts: sorted(c for c in contexts if c[1] == '2024-08'))
+    chunks, path = stream_chunks(ingestion, SAMPLE_CSV, 3)
+
+    with pytest.raises(ingestion.PeriodLockedError) as exc:
+        ingestion.ingest_chunks(chunks, {}, 'july.csv', **path)
+
+    # First chunk (July only) was committed, the chunk touching August was not
+    assert exc.value.period == '2024-08'
+    assert exc.value.rows_committed == 6 and exc.value.raw_rows_committed == 3
+    assert len(ingestion.stored) == 6
+
+    # The stored chunk is reported as a partial ingestion, not a bare rejection
+    response = ingestion.period_locked_response(exc.value, 'up1')
+    body = json.loads(response.get_data())
+    assert response.status_code == 207
+    assert body['status'] == 'partially_ingested' and body['stopped_at_raw_row'] == 3 and body['rows_committed'] == 6
+    nothing_stored = ingestion.PeriodLockedError('SGG-001', '2024-07')
+    assert ingestion.period_locked_response(nothing_stored, 'up1').status_code == 403
+
+
+def test_iter_chunks_is_lazy():
+    module = load_ingestion_main()
+
+    def endless():
+        i = 0
+        while True:
+            yield i
+            i += 1
+
+    chunks = module.iter_chunks(endless(), 4)
+    assert next(chunks) == [0, 1, 2, 3]
+    assert next(chunks) == [4, 5, 6, 7]
+
+
+def test_rule_matcher_keeps_first_match_priority():
+    import rule_matcher
+
+    rules = {
+        'gas sale': 'Revenue > Gas Sales',
+        'sale': 'Revenue > Other Sales',
+        '5100': 'COGS > Pipeline',
+        'pipe': 'Expenses > Maintenance',
+    }
+    matcher = rule_matcher.compile_rules(rules)
+
+    cases = [
+        ('social gas sale', ''),      # both 'gas sale' and 'sale' occur: earlier rule wins
+        ('spare sale', ''),
+        ('pipeline repair', '5100'),  # GL rule listed before the substring rule
+        ('pipeline repair', '9999'),
+        ('unrelated', ''),
+    ]
+    for desc, gl in cases:
+        assert matcher.match(desc, gl) == rule_matcher.match_linear(rules, desc, gl)
+    assert matcher.match('social gas sale', '') == ('Revenue', 'Gas Sales')
+    assert matcher.match('unrelated', '') is None
+
+
+def test_rule_matcher_matches_linear_on_random_rules():
+    import random
+    import rule_matcher
+
+    rng = random.Random(3)
+    alphabet = 'abcab 12'
+    rules = {}
+    while len(rules) < 60:
+        rules[''.join(rng.choices(alphabet, k=rng.randint(1, 4)))] = f"Cat > Sub {len(rules)}"
+    matcher = rule_matcher.compile_rules(rules)
+
+    for _ in range(500):
+        desc = ''.join(rng.choices(alphabet, k=rng.randint(0, 12)))
+        gl = ''.join(rng.choices('12', k=rng.randint(0, 2)))
+        assert matcher.match(desc, gl) == rule_matcher.match_linear(rules, desc, gl)
+
+
+def test_mapping_rules_cache_reloads_only_on_version_change():
+    import rules_cache
+
+    state = {'version': 1, 'rules': {'gas': 'Revenue > Gas'}, 'loads': 0, 'now': 0.0}
+
+    def load_rules():
+        state['loads'] += 1
+        return dict(state['rules'])
+
+    cache = rules_cache.MappingRulesCache(load_rules, lambda: state['version'], ttl_sec=60, clock=lambda: state['now'])
+
+    first = cache.get()
+    assert cache.get() is first
+    assert (cache.hits, cache.misses, state['loads']) == (1, 1, 1)
+
+    # TTL expiry reloads, but unchanged rules keep the compiled matcher
+    state['now'] = 120.0
+    assert cache.get() is first
+    assert (cache.misses, cache.rebuilds) == (2, 1)
+
+    # A version bump forces a reload and a rebuild
+    state['version'] = 2
+    state['rules']['pipe'] = 'COGS > Transport'
+    second = cache.get()
+    assert second is not first and len(second) == 2
+    assert cache.stats()['rebuilds'] == 2 and cache.stats()['version'] == 2
+
+
+class FlakyBatchClient:
+    """Minimal Firestore client whose batch commits can fail with contention; get_all reads the committed writes."""
+
+    def __init__(self, failures=0, delay=0.0):
+        import threading
+        self.failures = failures
+        self.delay = delay
+        self.committed = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def batch(self):
+        client = self
+
+        class Batch:
+            def __init__(self):
+                self.ops = []
+
+            def set(self, doc_ref, data):
+                self.ops.append((doc_ref, data))
+
+            def commit(self):
+                import time
+                from google.api_core import exceptions
+                with client._lock:
+                    client.in_flight += 1
+                    client.max_in_flight = max(client.max_in_flight, client.in_flight)
+                    fail = client.failures > 0
+                    if fail:
+                        client.failures -= 1
+                try:
+                    time.sleep(client.delay)
+                    if fail:
+                        raise exceptions.Aborted('contention')
+                    with client._lock:
+                        client.committed.extend(self.ops)
+                finally:
+                    with client._lock:
+                        client.in_flight -= 1
+
+        return Batch()
+
+    def get_all(self, refs):
+        with self._lock:
+            stored = {ref: data for ref, data in self.committed}
+        return [FakeLockSnapshot(ref, dict(stored[ref]) if ref in stored else None) for ref in refs]
+
+
+def test_bulk_writer_overlaps_commits_and_retries_contention():
+    import bulk_writer
+
+    client = FlakyBatchClient(failures=2, delay=0.01)
+    with bulk_writer.BulkWriter(client, batch_size=10, max_in_flight=3, sleep=lambda s: None) as writer:
+        for i in range(95):
+            writer.set(f"doc-{i}", {'n': i})
+
+    stats = writer.stats()
+    assert len(client.committed) == 95
+    assert sorted(ref for ref, _ in client.committed) == sorted(f"doc-{i}" for i in range(95))
+    assert 1 < client.max_in_flight <= 3
+    assert stats['rows_written'] == 95 and stats['commits'] == 10 and stats['retries'] == 2
+    assert stats['commit_latency_ms']['p50'] <= stats['commit_latency_ms']['p99']
+
+
+def test_bulk_writer_surfaces_non_retryable_errors():
+    import bulk_writer
+
+    class BrokenClient(FlakyBatchClient):
+        def batch(self):
+            batch = super().batch()
+            batch.commit = lambda: (_ for _ in ()).throw(ValueError('bad document'))
+            return batch
+
+    writer = bulk_writer.BulkWriter(BrokenClient(), batch_size=5, sleep=lambda s: None)
+    for i in range(5):
+        writer.set(f"doc-{i}", {})
+    with pytest.raises(ValueError):
+        writer.close()
+    assert writer.stats()['retries'] == 0
+
+
+def test_columnar_transform_matches_row_path(ingestion):
+    import columnar
+
+    frames = list(columnar.read_csv_frames(io.BytesIO(SAMPLE_CSV.encode('utf-8')), chunk_rows=2))
+    assert [len(frame) for frame in frames] == [2, 2, 1]
+
+    rules = {'equipment': 'Assets > Fixed Assets', '5100': 'COGS > Pipeline'}
+    expected = row_path(ingestion, SAMPLE_CSV, rules)
+    actual = [r for frame in frames for r in ingestion.transform_frame(frame, rules)]
+    assert actual == expected
+    assert [list(r.keys()) for r in actual] == [list(r.keys()) for r in expected]
+
+
+def test_columnar_transform_matches_row_path_on_dotted_dates(ingestion):
+    import columnar
+
+    # SGG exports write dd.mm.yyyy dates
+    data = re.sub(r'(\d{4})-(\d\d)-(\d\d)', r'\3.\2.\1', SAMPLE_CSV).encode('utf-8')
+
+    plan, rows, _ = ingestion.read_rows(io.BytesIO(data), 'july.csv')
+    rows = ingestion.normalize_row_dates(plan, rows, ingestion.date_normalizer_for(plan))
+    expected = ingestion.transform_values(plan, rows, {})
+    actual = [r for frame in columnar.read_csv_frames(io.BytesIO(data)) for r in ingestion.transform_frame(frame, {})]
+    assert actual == expected and actual[0]['date'] == '2024-07-01'
+
+
+def test_columnar_chunks_report_stream_totals(ingestion):
+    import columnar
+
+    frames = columnar.read_csv_frames(io.BytesIO(SAMPLE_CSV.encode('utf-8')), chunk_rows=2)
+    summary = ingestion.ingest_chunks(frames, {}, 'july.csv', transform=ingestion.transform_frame,
+                                     lock_contexts=ingestion.frame_lock_contexts)
+
+    expected_rows, expected_total = full_mode_summary(ingestion, SAMPLE_CSV)
+    assert summary['rows_processed'] == expected_rows == len(ingestion.stored)
+    assert summary['unique_raw_rows'] == 5
+    assert summary['total_value_gel'] == pytest.approx(expected_total)
+
+
+class FakeLockSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+
+class FakeLockClient:
+    """Serves `period_controls` documents and counts get_all round trips."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.get_all_calls = []
+
+    def collection(self, name):
+        assert name == 'period_controls'
+
+        class Collection:
+            def document(self, doc_id):
+                return doc_id
+
+        return Collection()
+
+    def get_all(self, refs):
+        refs = list(refs)
+        self.get_all_calls.append(refs)
+        return [FakeLockSnapshot(ref, self.docs.get(ref)) for ref in refs]
+
+
+def test_period_locks_resolved_in_one_get_all_and_cached(monkeypatch):
+    import period_locks
+
+    module = load_ingestion_main()
+    client = FakeLockClient({'SGG-001_2024-08': {'status': 'Locked'}, 'SGG-002_2024-07': {'status': 'Open'}})
+    monkeypatch.setattr(module, 'get_db', lambda: client)
+    now = {'t': 0.0}
+    module.period_lock_cache = period_locks.PeriodLockCache(module.fetch_period_locks, ttl_sec=30, clock=lambda: now['t'])
+
+    plan, rows, _ = module.read_rows(io.BytesIO(SAMPLE_CSV.encode('utf-8')), 'july.csv')
+    contexts = module.plan_lock_contexts(plan, rows)
+    assert contexts == {('SGG-001', '2024-07'), ('SGG-002', '2024-07'), ('SGG-003', '2024-07'), ('SGG-001', '2024-08')}
+
+    assert module.find_locked_periods(contexts) == [('SGG-001', '2024-08')]
+    assert len(client.get_all_calls) == 1 and len(client.get_all_calls[0]) == 4
+
+    # Cached: no round trip for known months, one batch for new ones
+    assert module.check_period_lock('SGG-001', '2024-08') is True
+    assert module.find_locked_periods(contexts | {('SGG-001', '2024-09')}) == [('SGG-001', '2024-08')]
+    assert [len(refs) for refs in client.get_all_calls] == [4, 1]
+
+    # A lock placed after the TTL expires is picked up
+    client.docs['SGG-001_2024-07'] = {'status': 'Locked'}
+    now['t'] = 31.0
+    assert module.find_locked_periods(contexts) == [('SGG-001', '2024-07'), ('SGG-001', '2024-08')]
+
+
+def test_stream_rejects_locked_chunk_before_mapping(ingestion, monkeypatch):
+    import columnar
+
+    monkeypatch.setattr(ingestion, 'find_locked_periods', lambda contexts: sorted(c for c in contexts if c[1] == '2024-08'))
+    mapped = []
+    monkeypatch.setattr(ingestion, 'map_values', lambda plan, values, rules: mapped.append(values) or {})
+
+    chunks, path = stream_chunks(ingestion, SAMPLE_CSV, 3)
+    with pytest.raises(ingestion.PeriodLockedError):
+        ingestion.ingest_chunks(chunks, {}, 'july.csv', **path)
+    assert len(mapped) == 3
+
+    frame = next(columnar.read_csv_frames(io.BytesIO(SAMPLE_CSV.encode('utf-8'))))
+    plan, rows, _ = ingestion.read_rows(io.BytesIO(SAMPLE_CSV.encode('utf-8')), 'july.csv')
+    assert columnar.lock_contexts(frame) == ingestion.plan_lock_contexts(plan, rows)
+
+
+def make_xlsx(rows, title_rows=()):
+    import openpyxl
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in list(title_rows) + list(rows):
+        ws.append(list(row))
+    out = io.BytesIO()
+    wb.save(out)
+    out.seek(0)
+    return out
+
+
+def test_xlsx_reader_finds_header_below_title_block():
+    module = load_ingestion_main()
+    stream = make_xlsx(
+        [
+            ('Date', 'Company', None, 'Amount', 'Currency'),
+            ('2024-07-01', 'SGG', 'note', 100.0, 'GEL'),
+            (None, None, None, None, None),
+            ('2024-07-02', 'SOG Export', None, 50.0, 'USD'),
+        ],
+        title_rows=[('SOCAR Georgia Gas - General Ledger',), ('Period: July 2024',), ()]
+    )
+
+    reader = module.iter_xlsx_records(stream)
+    records = list(reader)
+
+    assert reader.header_row == 4
+    assert records == [
+        {'Date': '2024-07-01', 'Company': 'SGG', 'Amount': 100.0, 'Currency': 'GEL'},
+        {'Date': '2024-07-02', 'Company': 'SOG Export', 'Amount': 50.0, 'Currency': 'USD'},
+    ]
+    stats = reader.stats()
+    assert stats['rows'] == 2 and stats['skipped_blank_rows'] == 1 and stats['header_row'] == 4
+
+
+def test_xlsx_reader_falls_back_to_first_non_empty_row():
+    module = load_ingestion_main()
+    stream = make_xlsx([('Account', 'Total'), ('1200', 5)], title_rows=[()])
+    assert list(module.iter_xlsx_records(stream)) == [{'Account': '1200', 'Total': 5}]
+
+
+class FakeDocRef:
+    """In-memory stand-in for a Firestore document reference (merge writes only)."""
+
+    def __init__(self):
+        self.data = None
+
+    def get(self, transaction=None):
+        ref = self
+
+        class Snapshot:
+            exists = ref.data is not None
+
+            def to_dict(self):
+                return dict(ref.data)
+
+        return Snapshot()
+
+    def set(self, data, merge=False):
+        self.data = dict(self.data or {}, **data)
+
+    def collection(self, name):
+        children = self.__dict__.setdefault('children', {}).setdefault(name, {})
+        doc_class = type(self)
+
+        class Collection:
+            def document(self, doc_id):
+                return children.setdefault(doc_id, doc_class())
+
+            def stream(self):
+                return [doc_ref.get() for doc_ref in children.values() if doc_ref.data is not None]
+
+        return Collection()
+
+
+def test_job_resumes_from_checkpoint_without_duplicates(ingestion, monkeypatch):
+    import dedup
+    import job_checkpoints
+
+    # The first two rows come back at the end: identical rows on both sides of the checkpoints
+    csv_text = SAMPLE_CSV + ''.join(SAMPLE_ROWS[:2])
+    written = {}
+    monkeypatch.setattr(ingestion, 'store_data', lambda records, filename, writer=None, ids=None, sink=None, aggregates=None: written.update(
+        zip(ids.assign(records), records)))
+    client = FakeFirestore()
+    monkeypatch.setattr(ingestion, 'get_db', lambda: client)
+    doc_ref = client.collection(job_checkpoints.JOB_COLLECTION).document('job1')
+
+    def run(budget_chunks, fail_after=None):
+        ticks = iter(range(100))
+        checkpoint = job_checkpoints.JobCheckpoint(doc_ref, 'job1', 'july.csv', time_budget_sec=budget_chunks,
+                                                   clock=lambda: next(ticks)).load()
+        chunks, path = stream_chunks(ingestion, csv_text, 2, skip=checkpoint.rows_committed)
+        if fail_after is not None:
+            chunks = itertools.chain(itertools.islice(chunks, fail_after), iter(lambda: 1 / 0, None))
+        return checkpoint, ingestion.ingest_chunks(chunks, {}, 'july.csv', checkpoint=checkpoint, **path)
+
+    # Invocation 1: budget for one chunk only
+    checkpoint, summary = run(budget_chunks=2)
+    assert summary['complete'] is False and doc_ref.data['raw_rows_committed'] == 2
+
+    # Invocation 2 crashes after one more chunk; its commit is checkpointed
+    with pytest.raises(ZeroDivisionError):
+        run(budget_chunks=50, fail_after=1)
+    assert doc_ref.data['raw_rows_committed'] == 4
+
+    # Invocation 3 finishes the file, with the ids one uninterrupted run gives
+    checkpoint, summary = run(budget_chunks=50)
+    expected_rows, expected_total = full_mode_summary(ingestion, csv_text)
+    assert summary['complete'] is True and checkpoint.invocations == 3
+    assert summary['unique_raw_rows'] == 7
+    assert summary['rows_processed'] == expected_rows == len(written) == 14
+    assert set(written) == set(dedup.RecordIds('july.csv').assign(row_path(ingestion, csv_text)))
+    assert summary['total_value_gel'] == pytest.approx(expected_total)
+
+    # A replay of already-written chunks keeps the same ids
+    doc_ref.data['raw_rows_committed'] = 2
+    run(budget_chunks=50)
+    assert len(written) == expected_rows
+
+
+def test_stage_metrics_time_each_stage_and_persist_with_the_status(ingestion, monkeypatch):
+    """
+    Every chunk is charged to parse (waiting for it), lock_check, map and
+    store; the summary, write counters and status land in the upload document.
+    """
+    import stage_metrics
+
+    ticks = itertools.count()
+    metrics = stage_metrics.IngestionMetrics('up1', 'july.csv', 'stream', clock=lambda: next(ticks))
+    metrics.track_bytes(lambda: 1234)
+    chunks, path = stream_chunks(ingestion, SAMPLE_CSV, 2)
+    summary = ingestion.ingest_chunks(metrics.timed('parse', chunks), {}, 'july.csv', metrics=metrics, **path)
+
+    stages = metrics.summary()['stages']
+    assert list(stages) == ['parse', 'lock_check', 'map', 'store']
+    assert stages['parse']['rows'] == stages['lock_check']['rows'] == stages['map']['rows'] == 5
+    assert stages['store']['rows'] == summary['rows_processed']
+    assert all(stage['sec'] > 0 for stage in stages.values())
+
+    doc_ref = FakeDocRef()
+    persisted = metrics.persist(doc_ref, 'completed', rows_processed=summary['rows_processed'])
+    assert doc_ref.data['status'] == 'completed' and doc_ref.data['mode'] == 'stream'
+    assert doc_ref.data['rows_processed'] == summary['rows_processed']
+    assert doc_ref.data['metrics']['bytes_read'] == 1234 and persisted['stages'] == doc_ref.data['metrics']['stages']
+    assert {'rows_written', 'write_retries', 'total_sec'} <= set(persisted)
+
+
+class FakeClient:
+    """In-memory stand-in for a Firestore client: documents of any collection are FakeDocRefs."""
+
+    doc_class = FakeDocRef
+
+    def __init__(self):
+        self.docs = {}
+
+    def collection(self, name):
+        client = self
+
+        class Collection:
+            def document(self, doc_id):
+                doc_ref = client.docs.setdefault((name, doc_id), client.doc_class())
+                doc_ref.id = doc_id
+                return doc_ref
+
+        return Collection()
+
+    def get_all(self, refs):
+        return [FakeLockSnapshot(ref.id, dict(ref.data) if ref.data is not None else None) for ref in refs]
+
+
+def merge_fields(current, data):
+    """Firestore write semantics for the fakes: nested maps merge, Increment adds, SERVER_TIMESTAMP is dropped."""
+    from google.cloud import firestore
+
+    merged = dict(current or {})
+    for key, value in data.items():
+        if isinstance(value, dict):
+            merged[key] = merge_fields(merged.get(key) if isinstance(merged.get(key), dict) else {}, value)
+        elif isinstance(value, firestore.Increment):
+            merged[key] = merged.get(key, 0) + value.value
+        elif value is not firestore.SERVER_TIMESTAMP:
+            merged[key] = value
+    return merged
+
+
+class MergingDocRef(FakeDocRef):
+    def set(self, data, merge=False):
+        self.data = merge_fields(self.data if merge else None, data)
+
+
+class FakeFirestore(FakeClient):
+    """FakeClient with write batches and transactions (applied on commit), nested merges and increments."""
+
+    doc_class = MergingDocRef
+
+    def __init__(self):
+        super().__init__()
+        self.commits = 0
+        self.transactions = 0
+        # Called before a transaction commits; raising google.api_core.exceptions.Aborted makes it retry
+        self.before_transaction_commit = None
+
+    def transaction(self):
+        client = self
+
+        class Transaction:
+            """Enough of firestore.Transaction for @firestore.transactional."""
+            _read_only = False
+            _max_attempts = 5
+            _id = None
+
+            def __init__(self):
+                self.writes = []
+
+            def _clean_up(self):
+                self.writes = []
+                self._id = None
+
+            def _begin(self, retry_id=None):
+                self._id = b'txn'
+
+            def set(self, doc_ref, data, merge=False):
+                self.writes.append((doc_ref, data, merge))
+
+            def _commit(self):
+                if client.before_transaction_commit is not None:
+                    client.before_transaction_commit()
+                for doc_ref, data, merge in self.writes:
+                    doc_ref.set(data, merge=merge)
+                client.transactions += 1
+                self._clean_up()
+
+            def _rollback(self):
+                self._clean_up()
+
+        return Transaction()
+
+    def batch(self):
+        client = self
+
+        class Batch:
+            def __init__(self):
+                self.writes = []
+
+            def set(self, doc_ref, data, merge=False):
+                self.writes.append((doc_ref, data, merge))
+
+            def commit(self):
+                for doc_ref, data, merge in self.writes:
+                    doc_ref.set(data, merge=merge)
+                client.commits += 1
+
+        return Batch()
+
+
+def test_async_mode_queues_with_202_and_worker_reports_progress(ingestion, monkeypatch, tmp_path):
+    """
+    Async mode answers 202 before any row is mapped; the worker ingests the
+    queued upload one checkpointed chunk per delivery, re-queuing the rest,
+    and the upload document carries progress until it is completed.
+    """
+    import blob_stream
+    import flask
+    import ingest_queue
+    import job_checkpoints
+
+    (tmp_path / 'uploads').mkdir()
+    (tmp_path / 'uploads' / 'july.csv').write_text(SAMPLE_CSV)
+    client = FakeFirestore()
+    queue = ingest_queue.LocalQueue()
+    monkeypatch.setattr(blob_stream, 'LOCAL_STORAGE_ROOT', str(tmp_path))
+    monkeypatch.setattr(ingest_queue, 'get_publisher', lambda: queue)
+    monkeypatch.setattr(ingestion, 'get_db', lambda: client)
+    monkeypatch.setattr(ingestion.mapping_rules_cache, 'get', lambda: {})
+    monkeypatch.setattr(ingestion.fx_rates_cache, 'get', ingestion.fx_rates_cache.table)
+    monkeypatch.setattr(ingestion, 'log_audit_event', lambda *args: None)
+    monkeypatch.setattr(job_checkpoints, 'JOB_CHUNK_ROWS', 2)
+    # One chunk per worker invocation
+    monkeypatch.setattr(job_checkpoints.JobCheckpoint, 'should_stop', lambda self: self.chunks_committed >= self.invocations)
+
+    with flask.Flask(__name__).test_request_context(json={'storagePath': 'uploads/july.csv', 'mode': 'async', 'uploadId': 'up-async'}):
+        response = ingestion.ingest_data(flask.request)
+    body = __import__('json').loads(response.get_data())
+    doc = client.docs[(job_checkpoints.JOB_COLLECTION, 'up-async')]
+
+    assert response.status_code == 202 and body['upload_id'] == 'up-async' and body['status'] == 'queued'
+    assert doc.data['status'] == 'queued' and ingestion.stored == [] and len(queue) == 1
+
+    assert queue.drain(ingestion.run_queued_ingestion, limit=1) == 1
+    assert doc.data['status'] == 'processing' and doc.data['raw_rows_committed'] == 2
+    # The next delivery reads on from the byte offset after row 2
+    assert doc.data['raw_bytes_committed'] == len(''.join(SAMPLE_CSV.splitlines(keepends=True)[:3]).encode('utf-8'))
+    assert 'progress' in doc.data and len(queue) == 1
+
+    assert queue.drain(ingestion.run_queued_ingestion, limit=10) == 2
+    expected_rows, _ = full_mode_summary(ingestion, SAMPLE_CSV)
+    assert doc.data['status'] == 'completed' and doc.data['mode'] == 'async'
+    assert doc.data['raw_rows_committed'] == doc.data['rows_total'] == 5 and doc.data['progress'] == 1.0
+    assert doc.data['rows_processed'] == expected_rows == len(ingestion.stored)
+    assert doc.data['metrics']['bytes_read'] > 0 and len(queue) == 0
+
+
+def test_storage_stream_is_closed_after_every_mode(ingestion, monkeypatch, tmp_path):
+    """The ranged storage stream (and its read-ahead pool) is closed whether the upload succeeds or fails."""
+    import blob_stream
+    import flask
+
+    (tmp_path / 'uploads').mkdir()
+    (tmp_path / 'uploads' / 'july.csv').write_text(SAMPLE_CSV)
+    rows = [tuple(line.split(',')) for line in SAMPLE_CSV.splitlines()]
+    (tmp_path / 'uploads' / 'july.xlsx').write_bytes(make_xlsx(rows).getvalue())
+    opened = []
+    open_blob = blob_stream.open_blob
+    monkeypatch.setattr(blob_stream, 'LOCAL_STORAGE_ROOT', str(tmp_path))
+    monkeypatch.setattr(blob_stream, 'open_blob', lambda blob: opened.append(open_blob(blob)) or opened[-1])
+    monkeypatch.setattr(ingestion, 'get_db', lambda: FakeClient())
+    monkeypatch.setattr(ingestion.mapping_rules_cache, 'get', lambda: {})
+    monkeypatch.setattr(ingestion.fx_rates_cache, 'get', ingestion.fx_rates_cache.table)
+    monkeypatch.setattr(ingestion, 'log_audit_event', lambda *args: None)
+
+    def store_failure(*args, **kwargs):
+        raise RuntimeError("Firestore unavailable")
+
+    stored = lambda *args, **kwargs: {}
+    cases = [(path, mode, store, status) for path in ('uploads/july.csv', 'uploads/july.xlsx')
+             for mode, store, status in [('full', stored, 201), ('stream', stored, 201), ('stream', store_failure, 500)]]
+    for path, mode, store, status in cases:
+        monkeypatch.setattr(ingestion, 'store_data', store)
+        with flask.Flask(__name__).test_request_context(json={'storagePath': path, 'mode': mode}):
+            assert ingestion.ingest_data(flask.request).status_code == status
+        assert opened[-1].closed, (path, mode, status)
+
+    assert len(opened) == len(cases)
+
+
+def test_csv_row_reader_resumes_at_the_byte_offset_of_a_row():
+    import csv_reader
+
+    data = (SAMPLE_CSV + '2024-08-03,SGG,5100,"Multi-line\nmemo, quoted",7.00,GEL\n\n2024-08-04,SGG\n').encode('utf-8')
+    full = csv_reader.CsvRowReader(io.BytesIO(data))
+    rows = list(full)
+    assert full.headers[0] == 'date' and len(rows) == 7 and rows[-1][2:] == (None, None, None, None)
+    assert rows == list(load_ingestion_main().iter_csv_rows(io.BytesIO(data))[1])
+
+    for done in range(1, 8):
+        reader = csv_reader.CsvRowReader(io.BytesIO(data))
+        list(itertools.islice(reader, done + 1))  # read ahead of the committed row
+        offset = reader.offset_after(done)
+        resumed = csv_reader.CsvRowReader(io.BytesIO(data), start=offset, first_row=done)
+        assert list(resumed) == rows[done:] and resumed.rows == 7
+
+
+def test_record_id_is_stable_per_leg_and_ignores_derived_fields():
+    import dedup
+
+    module = load_ingestion_main()
+    row = {'date': '2024-07-01', 'Company': 'SGG', 'gl_account': '4001', 'description': 'Gas', 'amount': '10', 'transaction_id': 'T1'}
+    plan = module.column_plan.plan_for(list(row))
+
+    def legs(row, rules):
+        return module.generate_ledger_entries_for_row(module.map_values(plan, tuple(row.values()), rules))
+
+    debit, credit = legs(row, {})
+    remapped_debit, _ = legs(row, {'gas': 'Revenue > Gas Sales'})
+    other_debit, other_credit = legs(dict(row, amount='11'), {})
+
+    undated_debit, _ = legs(dict(row, date=''), {})
+
+    assert dedup.record_id(debit, 'a.csv') != dedup.record_id(credit, 'a.csv')
+    assert dedup.record_id(debit, 'a.csv') == dedup.record_id(dict(debit), 'a.csv') == dedup.record_id(remapped_debit, 'a.csv')
+    assert dedup.record_id(debit, 'a.csv') != dedup.record_id(debit, 'b.csv')
+    # A missing date is filled with today's; the id must not change with it
+    assert undated_debit['date'] and dedup.record_id(undated_debit, 'a.csv') == dedup.record_id(debit, 'a.csv')
+
+    # Identical rows are numbered by occurrence, across batches; other rows moving around do not change an id
+    ids = dedup.RecordIds('a.csv')
+    assert ids.assign([debit, credit, other_debit, other_credit, debit, credit]) == [
+        dedup.record_id(debit, 'a.csv', 0), dedup.record_id(credit, 'a.csv', 0),
+        dedup.record_id(other_debit, 'a.csv', 0), dedup.record_id(other_credit, 'a.csv', 0),
+        dedup.record_id(debit, 'a.csv', 1), dedup.record_id(credit, 'a.csv', 1)]
+    assert ids.assign([debit, other_debit]) == [dedup.record_id(debit, 'a.csv', 2), dedup.record_id(other_debit, 'a.csv', 1)]
+    assert dedup.RecordIds('a.csv').assign([debit, credit, debit]) == ids_of([debit, credit, debit], 'a.csv')
+    assert ids.stats()['entries'] == 8 and ids.stats()['repeated_entries'] == 4
+
+
+def ids_of(records, source_file):
+    import dedup
+
+    counts = {}
+    ids = []
+    for record in records:
+        key = dedup.content_key(record)
+        ids.append(dedup.record_id(record, source_file, counts.get(key, 0)))
+        counts[key] = counts.get(key, 0) + 1
+    return ids
+
+
+def test_record_ids_restore_counts_from_checkpointed_digests():
+    import random
+    import dedup
+
+    rng = random.Random(7)
+    records = [{'entry_type': rng.choice(['Debit', 'Credit']), 'amount': str(rng.randrange(20))} for _ in range(500)]
+    batches = [records[i:i + 37] for i in range(0, len(records), 37)]
+
+    ids = dedup.RecordIds('a.csv', checkpointed=True)
+    digests = []
+    expected = []
+    for batch in batches:
+        expected.extend(ids.assign(batch))
+        digests.append(ids.take_digests())
+    assert expected == ids_of(records, 'a.csv')
+
+    # Resuming after any batch from its digests numbers the rest like one uninterrupted run
+    for done in (1, 5, len(batches) - 1):
+        resumed = dedup.RecordIds('a.csv').restore(digests[:done])
+        rest = [doc_id for batch in batches[done:] for doc_id in resumed.assign(batch)]
+        assert rest == expected[sum(len(batch) for batch in batches[:done]):]
+
+
+def test_store_data_keeps_identical_rows_and_skips_unchanged_entries(monkeypatch):
+    module = load_ingestion_main()
+    client = FlakyBatchClient()
+    client.collection = lambda name: type('Collection', (), {'document': staticmethod(lambda doc_id: doc_id)})()
+    monkeypatch.setattr(module, 'get_db', lambda: client)
+
+    # Two genuine rows with the same content are two transactions
+    ledger = row_path(module, SAMPLE_CSV + ''.join(SAMPLE_ROWS[:2]))
+    stats = module.store_data(ledger, 'july.csv')
+
+    assert stats['rows_written'] == len(client.committed) == len(ledger) == 14
+    assert stats['dedup']['repeated_entries'] == 4 and stats['dedup']['unchanged_skipped'] == 0
+    assert len({ref for ref, _ in client.committed}) == 14
+
+    # An unchanged re-upload with a row inserted at the top writes only that row
+    inserted = SAMPLE_ROWS[0].replace('100.00', '7.00')
+    stats = module.store_data(row_path(module, SAMPLE_HEADER + inserted + ''.join(SAMPLE_ROWS + SAMPLE_ROWS[:2])), 'july.csv')
+    assert stats['rows_written'] == 2 and stats['dedup']['unchanged_skipped'] == 14
+    assert stats['dedup']['existing_checked'] == 16 and len({ref for ref, _ in client.committed}) == 16
+
+    # A changed entry (another mapping) is written over its own id
+    stats = module.store_data(row_path(module, SAMPLE_HEADER + SAMPLE_ROWS[0], {'social gas': 'Revenue > Gas Sales'}), 'july.csv')
+    assert stats['rows_written'] == 2 and len({ref for ref, _ in client.committed}) == 16
+
+
+def test_warehouse_sink_loads_new_entries_in_parquet_batches_by_size_and_time(monkeypatch, tmp_path):
+    """
+    Entries written by store_data are buffered once (unchanged entries are
+    skipped) and loaded as Parquet batches when the size or time trigger
+    fires, and at close; the files hold the consolidated_ledger columns.
+    """
+    import pyarrow.parquet as pq
+    import dedup
+    import warehouse_sink
+
+    module = load_ingestion_main()
+    client = FlakyBatchClient()
+    client.collection = lambda name: type('Collection', (), {'document': staticmethod(lambda doc_id: doc_id)})()
+    monkeypatch.setattr(module, 'get_db', lambda: client)
+    now = [0.0]
+    sink = warehouse_sink.WarehouseSink(warehouse_sink.LocalParquetLoader(str(tmp_path)), flush_rows=4,
+                                        flush_sec=30, clock=lambda: now[0])
+
+    ledger = row_path(module, SAMPLE_CSV)
+    ids = dedup.RecordIds('july.csv')
+    # Size trigger: 6 entries >= 4 load at once; an unchanged entry stored again is not buffered again
+    module.store_data(ledger[:6], 'july.csv', ids=ids, sink=sink)
+    module.store_data(ledger[:2], 'july.csv', sink=sink)
+    assert sink.batches == 1 and sink.rows_buffered == 0
+    # Below the size trigger nothing loads until the time trigger passes
+    module.store_data(ledger[6:8], 'july.csv', ids=ids, sink=sink)
+    assert sink.batches == 1 and sink.rows_buffered == 2
+    now[0] = 31.0
+    module.store_data(ledger[8:9], 'july.csv', ids=ids, sink=sink)
+    assert sink.batches == 2
+    module.store_data(ledger[9:], 'july.csv', ids=ids, sink=sink)
+    stats = sink.close()
+
+    assert stats['rows_loaded'] == len(ledger) == 10 and stats['batches'] == 3 and stats['rows_failed'] == 0
+    table = pq.read_table(str(tmp_path / warehouse_sink.WAREHOUSE_TABLE)).to_pandas()
+    assert list(table.columns) == list(warehouse_sink.COLUMNS)
+    assert sorted(table['entryId']) == sorted(ref for ref, _ in client.committed)
+    # Both legs carry the row's amount: the debits add up to the upload's total_value_gel
+    debits = table[table['entryType'] == 'Debit']
+    assert len(debits) == 5 and debits['amount'].sum() == pytest.approx(full_mode_summary(module, SAMPLE_CSV)[1])
+    assert str(table['transactionDate'].iloc[0]) == '2024-07-01' and table['period'].iloc[0] == '2024-07'
+    assert set(table['entryType']) == {'Debit', 'Credit'} and set(table['sourceFile']) == {'july.csv'}
+
+    # Reloading the file with changed entries (a new run, as on a re-upload) replaces them instead of appending
+    reload = warehouse_sink.WarehouseSink(warehouse_sink.LocalParquetLoader(str(tmp_path)), flush_rows=6)
+    module.store_data(row_path(module, SAMPLE_CSV, {'gas': 'Revenue > Gas Sales'}), 'july.csv', sink=reload)
+    assert reload.close()['rows_loaded'] == 2
+    reloaded = pq.read_table(str(tmp_path / warehouse_sink.WAREHOUSE_TABLE)).to_pandas()
+    assert len(reloaded) == 10 and sorted(reloaded['entryId']) == sorted(table['entryId'])
+    assert 'WHEN MATCHED THEN UPDATE SET companyId = S.companyId' in warehouse_sink.merge_statement('d.t', 'd.s')
+
+
+def reference_mapping(module, row, mapping_rules):
+    """
+    (mapped row, lock context) by per-row key normalization of a dict row,
+    the lookups the ColumnPlan resolves once per header layout.
+    """
+    import column_plan
+
+    norm_row = {k.lower().strip().replace(' ', '_'): v for k, v in row.items()}
+    entities = [str(norm_row[col]) for col in column_plan.ENTITY_COLUMNS if col in norm_row]
+    context = (module.ledger_rules.company_from_entities(entities), module.date_or_today(norm_row.get('date', ''))[:7])
+    mapped = module.apply_mapping(
+        norm_row, entities, norm_row.get('gl_account', norm_row.get('gl', '')),
+        norm_row.get('description', norm_row.get('memo', '')), norm_row.get('department', ''),
+        norm_row.get('date', ''), norm_row.get('amount', 0), norm_row.get('currency', 'GEL'), mapping_rules)
+    return mapped, context
+
+
+def test_column_plan_maps_like_per_row_key_lookups():
+    import random
+    import column_plan
+
+    module = load_ingestion_main()
+    rng = random.Random(8)
+    names = ['Date', 'date', 'Company', 'Entity', 'GL', 'GL Account', 'gl_account', 'Memo', 'Description',
+             'Department', 'Amount', 'Currency', 'company_id', 'Category', 'Sub', ' Branch ']
+    values = ['2024-07-01', '', 'SOG Export', 'Telavi', '4001', '5100', None, 'social gas', 'Ops',
+              '12.5', 'x', 'USD', 'EUR', 'SGG-003']
+    rules = {'gas': 'Revenue > Gas', '5100': 'COGS > Pipeline'}
+
+    for _ in range(300):
+        headers = rng.sample(names, rng.randint(1, 8)) + rng.choices(names, k=rng.randint(0, 2))
+        plan = column_plan.plan_for(headers)
+        for _ in range(5):
+            row = tuple(rng.choice(values) for _ in headers)
+            expected, context = reference_mapping(module, dict(zip(headers, row)), rules)
+            actual = module.map_values(plan, row, rules)
+            assert actual == expected
+            assert list(actual) == list(expected)
+            assert module.plan_lock_contexts(plan, [row]) == {context}
+
+
+def test_column_plan_is_cached_by_header_layout():
+    import column_plan
+
+    module = load_ingestion_main()
+    first, rows = module.iter_csv_rows(io.BytesIO(SAMPLE_CSV.encode('utf-8')))
+    second, _ = module.iter_csv_rows(io.BytesIO(SAMPLE_CSV.encode('utf-8')))
+    assert first is second and first.fingerprint == column_plan.header_fingerprint(first.headers)
+    assert column_plan.plan_for(['date', 'amount']) is not first
+
+    assert module.transform_values(first, rows, {}) == row_path(module, SAMPLE_CSV)
+
+
+def test_read_rows_gives_same_tuples_for_csv_and_xlsx():
+    module = load_ingestion_main()
+    stream = make_xlsx([('Date', 'Company', 'Amount'), ('2024-07-01', 'SGG', '100.00')], title_rows=[('Ledger',)])
+    plan, rows, parser = module.read_rows(stream, 'july.xlsx')
+    assert plan.headers == ('Date', 'Company', 'Amount') and list(rows) == [('2024-07-01', 'SGG', '100.00')]
+    assert parser.stats()['header_row'] == 2
+
+    plan, rows, parser = module.read_rows(io.BytesIO(b"Date,Company,Amount\n\n2024-07-01,SGG\n"), 'july.csv')
+    assert list(rows) == [('2024-07-01', 'SGG', None)] and parser is None
+
+
+def mapped_categories(filename, open_stream, mapping_rules, fx_table, source_key):
+    """Manifest `ingest` for the pool test (module level, so workers can unpickle it): counts only."""
+    module = load_ingestion_main()
+    with open_stream() as stream:
+        plan, rows, _ = module.read_rows(stream, filename)
+        mapped = [module.map_values(plan, values, mapping_rules, fx_table) for values in rows]
+    return {'status': 'ingested', 'raw_rows': len(mapped), 'source_key': source_key,
+            'categories': sorted({(m['category'], m['sub_category']) for m in mapped})}
+
+
+def test_manifest_ingests_files_in_worker_processes_like_inline(monkeypatch):
+    import manifest
+
+    rules = {'pipeline': 'COGS > Pipeline Transport'}
+    files = [('july.csv', SAMPLE_CSV.encode('utf-8'), 'gs://b/july.csv'), ('notes.pdf', b'%PDF', 'gs://b/notes.pdf'),
+             ('august.xlsx', make_xlsx([('Date', 'Company', 'Amount'), ('2024-08-01', 'SGG', '7.5')]).getvalue(),
+              'gs://b/august.xlsx')]
+
+    inline = manifest.ingest_files(files, mapped_categories, rules, workers=1)
+    pooled = manifest.ingest_files(files, mapped_categories, rules, workers=2)
+    assert [r['file'] for r in pooled] == ['july.csv', 'notes.pdf', 'august.xlsx']
+    for a, b in zip(inline, pooled):
+        for key in ('status', 'error', 'raw_rows', 'categories', 'bytes_read', 'source_key'):
+            assert a.get(key) == b.get(key)
+    assert pooled[0]['raw_rows'] == 5 and ('COGS', 'Pipeline Transport') in pooled[0]['categories']
+    assert pooled[1]['status'] == 'failed' and 'error' in pooled[1]
+    assert pooled[2]['raw_rows'] == 1 and pooled[2]['bytes_read'] == len(files[2][1])
+    assert pooled[2]['source_key'] == 'gs://b/august.xlsx'
+
+    # The pool never outgrows the function's memory, however many cores there are
+    monkeypatch.setattr(manifest, 'WORKER_MEMORY_MB', 160)
+    monkeypatch.setattr(manifest, 'PARENT_MEMORY_MB', 192)
+    assert manifest.memory_workers(16, memory_mb=512) == 2
+    assert manifest.memory_workers(16, memory_mb=2048) == 11
+    assert manifest.memory_workers(4, memory_mb=256) == 1
+
+
+def test_manifest_checks_each_file_before_storing_and_reports_counts(ingestion, monkeypatch, tmp_path):
+    import blob_stream
+    import manifest
+
+    july = "date,Company,amount\n2024-07-01,SGG,100.00\n2024-07-02,SGG,50.00\n"
+    august = "date,Company,amount\n2024-08-01,SGG,10.00\n"
+    blobs = {'uploads/july.csv': july.encode('utf-8'), 'uploads/august.csv': august.encode('utf-8'),
+             'uploads/bad.txt': b'x'}
+    (tmp_path / 'uploads').mkdir()
+    for path, data in blobs.items():
+        (tmp_path / path).write_bytes(data)
+    lock_calls = []
+    monkeypatch.setattr(blob_stream, 'LOCAL_STORAGE_ROOT', str(tmp_path))
+    monkeypatch.setattr(manifest, 'MANIFEST_WORKERS', 1)
+    # Both passes stream the file a row at a time
+    monkeypatch.setattr(ingestion, 'STREAM_CHUNK_ROWS', 1)
+    monkeypatch.setattr(ingestion, 'find_locked_periods',
+                        lambda contexts: lock_calls.append(set(contexts)) or [c for c in contexts if c[1] == '2024-08'])
+    monkeypatch.setattr(ingestion.mapping_rules_cache, 'get', lambda: {})
+    monkeypatch.setattr(ingestion, 'log_audit_event', lambda *args: None)
+
+    response = ingestion.ingest_manifest(list(blobs), None, 'tester')
+    body = json.loads(response.get_data())
+
+    assert response.status_code == 207
+    # One lookup per file for the contexts of all its chunks, before any of its rows is stored
+    assert lock_calls == [{('SGG-001', '2024-07')}, {('SGG-001', '2024-08')}]
+    assert [f['status'] for f in body['files']] == ['ingested', 'locked', 'failed']
+    assert body['files'][0]['rows_processed'] == 4 and body['files'][0]['total_value_gel'] == 150.0
+    assert body['files'][1]['locked_periods'] == [['SGG-001', '2024-08']] and body['files'][1]['rows_processed'] == 0
+    assert body['summary']['files_ingested'] == 1 and body['summary']['rows_processed'] == 4
+    assert {r['source_file'] for r in ingestion.stored} == {'july.csv'}
+    assert set(body['summary']['metrics']['stages']) == {'parse', 'lock_check', 'map', 'store'}
+
+
+def test_ranged_blob_reader_streams_csv_and_xlsx_like_bytes(tmp_path):
+    import blob_stream
+
+    module = load_ingestion_main()
+    wide = SAMPLE_CSV + "".join(f"2024-07-{i % 28 + 1:02d},SGG,{4000 + i},Row {i},{i}.25,GEL\n" for i in range(2000))
+    xlsx = make_xlsx([('Date', 'Company', 'Amount')] + [(f'2024-07-{i % 28 + 1:02d}', 'SGG', str(i)) for i in range(3000)],
+                     title_rows=[('Ledger',)]).getvalue()
+    for name, data in (('july.csv', wide.encode('utf-8')), ('july.xlsx', xlsx)):
+        (tmp_path / name).write_bytes(data)
+        blob = blob_stream.LocalBlob(str(tmp_path / name))
+        raw = blob_stream.RangedBlobReader(blob, range_bytes=1024, cached_ranges=2)
+        with io.BufferedReader(raw, buffer_size=512) as stream:
+            streamed = list(module.read_rows(stream, name)[1])
+            assert raw.stats()['range_reads'] >= len(data) // 1024
+        assert streamed == list(module.read_rows(io.BytesIO(data), name)[1])
+
+    stream = blob_stream.open_local(str(tmp_path / 'july.csv'))
+    assert stream.seek(-10, io.SEEK_END) == len(wide) - 10 and stream.read() == wide[-10:].encode('utf-8')
+    stream.seek(5)
+    assert stream.read(4) == wide[5:9].encode('utf-8')
+
+
+def test_date_normalizer_detects_column_formats_and_counts_failures():
+    import datetime
+    import date_normalizer
+
+    today = datetime.date.today().isoformat()
+    dotted = date_normalizer.DateNormalizer(key=('test-layout', 0))
+    converted = dotted.convert(['01.07.2024', '15.08.2024', '01.07.2024', '', None, 'n/a',
+                                datetime.datetime(2024, 9, 3, 10, 30), '2024-07-01 00:00:00'])
+    assert list(converted) == ['2024-07-01', '2024-08-15', '2024-07-01', today, today, 'n/a', '2024-09-03', '2024-07-01']
+    assert dotted.stats() == {'format': 'dmy_dot', 'rows': 8, 'failed': 1, 'empty': 2}
+
+    hits = date_normalizer.cache_stats()['hits']
+    again = date_normalizer.DateNormalizer(key=('test-layout', 0))
+    assert list(again.convert(['31.12.2023'])) == ['2023-12-31'] and again.format == 'dmy_dot'
+    assert date_normalizer.cache_stats()['hits'] == hits + 1
+
+    cases = [
+        (['2024-07-01', '2024-12-31'], 'iso', ['2024-07-01', '2024-12-31']),
+        (['45474', 45474.75, '45657'], 'excel_serial', ['2024-07-01', '2024-07-01', '2024-12-31']),
+        (['01/07/2024', '13/07/2024'], 'dmy_slash', ['2024-07-01', '2024-07-13']),
+        (['07/13/2024', '07/01/2024'], 'mdy_slash', ['2024-07-13', '2024-07-01']),
+    ]
+    for values, name, expected in cases:
+        normalizer = date_normalizer.DateNormalizer()
+        assert list(normalizer.convert(values)) == expected and normalizer.format == name
+
+
+def test_row_dates_are_normalized_before_lock_checks():
+    import columnar
+
+    module = load_ingestion_main()
+    csv_text = "date,Company,amount\n01.07.2024,SGG,100.00\n02.08.2024,Telavi,5.00\n"
+    plan, rows, _ = module.read_rows(io.BytesIO(csv_text.encode('utf-8')), 'july.csv')
+    dates = module.date_normalizer_for(plan)
+    normalized = list(module.normalize_row_dates(plan, rows, dates, batch_rows=1))
+    assert normalized == [('2024-07-01', 'SGG', '100.00'), ('2024-08-02', 'Telavi', '5.00')]
+    assert module.plan_lock_contexts(plan, normalized) == {('SGG-001', '2024-07'), ('SGG-003', '2024-08')}
+    assert dates.stats()['format'] == 'dmy_dot'
+
+    frame = next(columnar.read_csv_frames(io.BytesIO(csv_text.encode('utf-8'))))
+    assert module.frame_lock_contexts(frame) == {('SGG-001', '2024-07'), ('SGG-003', '2024-08')}
+    assert module.transform_frame(frame, {}) == module.transform_values(plan, normalized, {})
+
+
+def test_fx_rate_table_uses_the_rate_in_effect_on_the_transaction_date():
+    import numpy as np
+    import fx_rates
+
+    table = fx_rates.RateTable({
+        'usd': [('2024-07-02', 2.71), ('2024-07-01', 2.70), ('2024-07-05', 2.75)],
+        'EUR': [('2024-07-01', 2.95)]
+    })
+    assert [table.rate('USD', d) for d in ['2024-06-30', '2024-07-01', '2024-07-03', '2024-07-05', '2025-01-01']] == \
+           [2.70, 2.70, 2.71, 2.75, 2.75]
+    assert table.rate('usd', '2024-07-02') == 2.71 and table.rate('EUR', '2030-01-01') == 2.95
+    assert table.rate('GEL', '2024-07-01') == 1.0 and table.rate('TRY', '2024-07-01') == 1.0
+    assert fx_rates.RateTable().rate('USD', '2024-07-01') == 2.7  # No history loaded: fallback rate
+
+    currencies = np.array(['USD', 'gel', 'EUR', 'USD', 'TRY'], dtype=object)
+    dates = np.array(['2024-07-03', '2024-07-03', '2024-07-01', '2024-06-01', '2024-07-01'], dtype=object)
+    assert list(table.rates(currencies, dates)) == [table.rate(c, d) for c, d in zip(currencies, dates)]
+
+
+def test_fx_rates_cache_reloads_only_on_version_change():
+    import fx_rates
+
+    loads, version, published = [], ['v1'], [2.65, 2.8]
+    cache = fx_rates.FxRatesCache(lambda: loads.append(1) or {'USD': [('2024-07-01', published[len(loads) - 1])]},
+                                  lambda: version[0])
+    assert cache.table().rate('USD', '2024-07-01') == 2.7  # Before the first load: fallback rate
+    assert cache.get().rate('USD', '2024-07-01') == 2.65
+    assert cache.get() is cache.table() and len(loads) == 1
+    version[0] = 'v2'
+    assert cache.get().rate('USD', '2024-07-01') == 2.8 and len(loads) == 2
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_amount_gel_converts_at_daily_rates_in_row_and_columnar_paths(ingestion):
+    import columnar
+    import fx_rates
+
+    table = fx_rates.RateTable({'USD': [('2024-07-01', 2.70), ('2024-07-02', 2.80)], 'EUR': [('2024-07-01', 3.10)]})
+    plan, rows, _ = ingestion.read_rows(io.BytesIO(SAMPLE_CSV.encode('utf-8')), 'july.csv')
+    rows = list(rows)
+    mapped = [ingestion.map_values(plan, values, {}, table) for values in rows]
+    assert [m['amount_gel'] for m in mapped] == [100.0, 50.0 * 2.80, 25.5 * 3.10, 10.0, 5.0]
+
+    frame = next(columnar.read_csv_frames(io.BytesIO(SAMPLE_CSV.encode('utf-8'))))
+    ledger = columnar.to_records(columnar.transform_frame(frame, {}, table))
+    assert ledger == [e.to_dict() for m in mapped for e in ingestion.generate_ledger_entries_for_row(m)]
+
+
+def make_pdf(page_texts):
+    """Minimal text PDF, one Helvetica line per page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def test_pdf_pages_extract_in_order_with_first_page_preview(tmp_path):
+    import blob_stream
+    import pdf_pages
+
+    pdf = make_pdf([f"Statement page {i}" for i in range(1, 21)])
+    events = []
+
+    def pages():
+        for text in pdf_pages.iter_page_texts(pdf, workers=2, on_first_page=lambda t, n: events.append(('preview', t, n))):
+            events.append(('page', text))
+            yield text
+
+    texts = list(pages())
+    assert texts == [f"Statement page {i}" for i in range(1, 21)]
+    assert events[0] == ('preview', 'Statement page 1', 20) and events[1] == ('page', 'Statement page 1')
+    assert texts == list(pdf_pages.iter_page_texts(pdf, workers=1))
+    path = tmp_path / 'statement.pdf'
+    path.write_bytes(pdf)
+    opener = functools.partial(blob_stream.open_local, str(path))
+    assert list(pdf_pages.iter_page_texts(opener, workers=2)) == texts
+
+
+def test_pdf_chunks_are_bounded_and_rejoin_to_the_full_text():
+    import pdf_pages
+
+    pages = ['a' * 30, 'b' * 5, 'c' * 95, '', 'd' * 10]
+    chunks = list(pdf_pages.chunk_pages(pages, max_chars=40))
+    assert all(len(c['content']) <= 40 for c in chunks)
+    assert ''.join(c['content'] for c in chunks) == ''.join(p + '\n' for p in pages)
+    assert (chunks[0]['page_start'], chunks[0]['page_end']) == (1, 2)
+    assert [c['page_start'] for c in chunks[1:4]] == [3, 3, 3] and chunks[-1]['page_end'] == 5
+
+
+def aggregate(client, company_id, period):
+    import metric_aggregates
+    return client.docs[(metric_aggregates.AGGREGATES_COLLECTION, metric_aggregates.aggregate_document_id(company_id, period))].data
+
+
+def test_metric_aggregates_follow_uploads_and_reverse_a_reupload(monkeypatch):
+    """
+    Stored Debit legs land in per-(company, period) totals; re-uploading a
+    file replaces its contribution (unchanged, remapped, or with fewer rows).
+    """
+    import metric_aggregates
+
+    module = load_ingestion_main()
+    client = FakeFirestore()
+    monkeypatch.setattr(module, 'get_db', lambda: client)
+    def upload(mapping, rows=SAMPLE_ROWS):
+        aggregates = metric_aggregates.MetricAggregates(client)
+        ledger = row_path(module, SAMPLE_HEADER + ''.join(rows), mapping)
+        stats = module.store_data(ledger, 'july.csv', aggregates=aggregates)
+        aggregates.close()
+        return ledger, stats
+
+    ledger, stats = upload({})
+    pipeline_gel = next(r['amount_gel'] for r in ledger if r['entry_type'] == 'Debit' and r['company_id'] == 'SGG-002')
+    july, august = aggregate(client, 'SGG-001', '2024-07'), aggregate(client, 'SGG-001', '2024-08')
+    assert july['totals']['revenue'] == 100.0 and july['rows'] == 1 and july['version'] == 1
+    assert august['totals']['liabilities'] == 10.0 and august['totals']['equity'] == 5.0 and august['rows'] == 2
+    assert aggregate(client, 'SGG-002', '2024-07')['totals']['expenses'] == pytest.approx(pipeline_gel)
+
+    # Unchanged re-upload: same totals, new version
+    upload({})
+    assert aggregate(client, 'SGG-001', '2024-07') == dict(july, version=2)
+
+    # Remapped: the amount moves from revenue to COGS (and its tax detail)
+    upload({'social gas': 'COGS > Gas Excise Tax'})
+    july = aggregate(client, 'SGG-001', '2024-07')
+    assert july['totals']['revenue'] == 0.0 and july['totals']['cogs'] == 100.0 and july['totals']['tax'] == 100.0
+    assert july['rows'] == 1 and aggregate(client, 'SGG-001', '2024-08')['rows'] == 2
+
+    # A context the file no longer touches is reversed to zero
+    upload({}, rows=SAMPLE_ROWS[:3])
+    august = aggregate(client, 'SGG-001', '2024-08')
+    assert august['rows'] == 0 and not any(august['totals'].values())
+    assert aggregate(client, 'SGG-001', '2024-07')['totals']['revenue'] == 100.0
+
+
+def test_metric_aggregates_key_sources_by_storage_path_and_replace_in_a_transaction(monkeypatch):
+    """
+    Two folders' july.csv are separate sources: uploading one does not
+    reverse the other. A re-upload that loses the race to another upload of
+    the same file re-reads the contribution and reverses what that one added.
+    """
+    from google.api_core import exceptions
+    import metric_aggregates
+
+    module = load_ingestion_main()
+    client = FakeFirestore()
+    monkeypatch.setattr(module, 'get_db', lambda: client)
+    ledger = row_path(module, SAMPLE_CSV)
+
+    def upload(source_key):
+        aggregates = metric_aggregates.MetricAggregates(client, source_key=source_key)
+        module.store_data(ledger, 'july.csv', aggregates=aggregates)
+        return aggregates.close()
+
+    upload('gs://bucket/sgg/july.csv')
+    assert upload('gs://bucket/sog/july.csv')['files_reversed'] == 0
+    assert aggregate(client, 'SGG-001', '2024-07')['rows'] == 2 and client.transactions == 2
+
+    # Another upload of sgg/july.csv commits between this one's read and its commit
+    def racing_upload():
+        client.before_transaction_commit = None
+        upload('gs://bucket/sgg/july.csv')
+        raise exceptions.Aborted("contention")
+
+    client.before_transaction_commit = racing_upload
+    stats = upload('gs://bucket/sgg/july.csv')
+    assert stats['files_reversed'] == 1 and stats['contexts_updated'] == 4
+    assert aggregate(client, 'SGG-001', '2024-07')['rows'] == 2
+    assert aggregate(client, 'SGG-001', '2024-07')['totals']['revenue'] == 200.0
+    contribution = client.docs[(metric_aggregates.CONTRIBUTIONS_COLLECTION,
+                                metric_aggregates.contribution_document_id('gs://bucket/sgg/july.csv'))]
+    assert contribution.data['source'] == 'gs://bucket/sgg/july.csv'
+    assert sum(context['rows'] for context in contribution.data['contexts'].values()) == 5
+
+
+def test_multipart_uploads_without_an_upload_id_are_sources_by_content(monkeypatch):
+    """
+    Two different july.csv sent without an uploadId keep their own
+    contributions; sending the same bytes again replaces its own.
+    """
+    import flask
+
+    module = load_ingestion_main()
+    client = FakeFirestore()
+    monkeypatch.setattr(module, 'get_db', lambda: client)
+    monkeypatch.setattr(module, 'find_locked_periods', lambda contexts: [])
+    monkeypatch.setattr(module.mapping_rules_cache, 'get', lambda: {})
+    monkeypatch.setattr(module.fx_rates_cache, 'get', module.fx_rates_cache.table)
+    monkeypatch.setattr(module, 'log_audit_event', lambda *args: None)
+
+    def upload(csv_text):
+        data = {'file': (io.BytesIO(csv_text.encode('utf-8')), 'july.csv')}
+        with flask.Flask(__name__).test_request_context(method='POST', data=data, content_type='multipart/form-data'):
+            assert module.ingest_data(flask.request).status_code == 201
+
+    upload(SAMPLE_CSV)
+    upload(SAMPLE_HEADER + SAMPLE_ROWS[0].replace('100.00', '40.00'))
+    july = aggregate(client, 'SGG-001', '2024-07')
+    assert july['rows'] == 2 and july['totals']['revenue'] == 140.0
+
+    upload(SAMPLE_CSV)
+    assert aggregate(client, 'SGG-001', '2024-07') == dict(july, version=july['version'] + 1)
+
+
+def test_job_aggregates_commit_with_checkpoints_and_survive_a_replay(monkeypatch):
+    """
+    A job's deltas are committed in the checkpoint's batch: a chunk whose
+    checkpoint never landed is replayed without being counted twice.
+    """
+    import job_checkpoints
+    import metric_aggregates
+
+    module = load_ingestion_main()
+    client = FakeFirestore()
+    monkeypatch.setattr(module, 'get_db', lambda: client)
+    monkeypatch.setattr(module, 'find_locked_periods', lambda contexts: [])
+    doc_ref = client.collection(job_checkpoints.JOB_COLLECTION).document('job1')
+    # Per checkpoint: True makes the run die after storing the chunk, before its checkpoint
+    failures = []
+    commit_chunk = module.commit_chunk
+    monkeypatch.setattr(module, 'commit_chunk', lambda *args: 1 / 0 if failures and failures.pop(0) else commit_chunk(*args))
+
+    def run():
+        checkpoint = job_checkpoints.JobCheckpoint(doc_ref, 'job1', 'july.csv', time_budget_sec=3600).load()
+        chunks, path = stream_chunks(module, SAMPLE_CSV, 2, skip=checkpoint.rows_committed)
+        return module.ingest_chunks(chunks, {}, 'july.csv', checkpoint=checkpoint, **path)
+
+    failures.extend([False, True])
+    with pytest.raises(ZeroDivisionError):
+        run()
+    assert doc_ref.data['raw_rows_committed'] == 2
+    assert aggregate(client, 'SGG-001', '2024-07')['rows'] == 1
+
+    summary = run()
+    assert summary['complete'] and doc_ref.data['raw_rows_committed'] == 5
+    assert summary['write_stats']['aggregates']['rows_added'] == 3
+    assert aggregate(client, 'SGG-003', '2024-07')['rows'] == 1
+    assert aggregate(client, 'SGG-001', '2024-08')['rows'] == 2
+    contribution = client.docs[(metric_aggregates.CONTRIBUTIONS_COLLECTION, metric_aggregates.contribution_document_id('july.csv'))]
+    assert sum(context['rows'] for context in contribution.data['contexts'].values()) == 5
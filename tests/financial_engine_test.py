@@ -0,0 +1,320 @@
+import importlib.util
+import json
+import os
+import random
+import sys
+
+import pytest
+
+# Testing Framework for the Financial Engine (5-financial-engine)
+# Runs the engine modules in-process; no Firestore or HTTP calls are made.
+
+ENGINE_DIR = os.path.join(os.path.dirname(__file__), '..', 'functions', '5-financial-engine')
+# Appended: the ingestion tests resolve `main` to 8-data-ingestion
+sys.path.append(os.path.abspath(ENGINE_DIR))
+
+import metrics
+
+CATEGORIES = ['Assets', 'Capital Expenditures', 'Liabilities', 'Equity', 'Retained Earnings', 'Revenue', 'Sales',
+              'Expenses', 'Operating Expenses', 'Human Resources', 'Marketing', 'COGS', 'Unmapped', '']
+SUB_CATEGORIES = ['Depreciation', 'Interest Expense', 'Income Tax', 'Tax on Interest', 'Social Gas Sales', '',
+                  'Accumulated Depreciation of Tax Assets']
+
+
+def loop_metrics(transactions):
+    """The row-at-a-time calculate_metrics the vectorized engine replaced (reference)."""
+    totals = dict.fromkeys(["assets", "liabilities", "equity", "revenue", "expenses", "cogs",
+                            "depreciation", "interest", "tax"], 0.0)
+    for t in transactions:
+        try:
+            amt = float(t.get("amount", 0))
+        except:
+            amt = 0.0
+        cat = t.get("category", "")
+        sub_cat = t.get("sub_category", "")
+        target_bucket = None
+        if cat in ["Assets", "Capital Expenditures"]: target_bucket = "assets"
+        elif cat in ["Liabilities"]: target_bucket = "liabilities"
+        elif cat in ["Equity", "Retained Earnings"]: target_bucket = "equity"
+        elif cat in ["Revenue", "Sales"]: target_bucket = "revenue"
+        elif cat in ["Expenses", "Operating Expenses", "Human Resources", "Marketing"]: target_bucket = "expenses"
+        elif cat in ["COGS"]: target_bucket = "cogs"
+        if target_bucket:
+            totals[target_bucket] += amt
+        if "Depreciation" in sub_cat: totals["depreciation"] += amt
+        if "Interest" in sub_cat: totals["interest"] += amt
+        if "Tax" in sub_cat: totals["tax"] += amt
+
+    net_income = totals["revenue"] - totals["cogs"] - totals["expenses"]
+    ebitda = net_income + totals["interest"] + totals["tax"] + totals["depreciation"]
+    totals["equity"] += net_income
+    for k in totals:
+        totals[k] = round(totals[k], 2)
+    totals["net_income"] = round(net_income, 2)
+    totals["ebitda"] = round(ebitda, 2)
+    return totals
+
+
+def make_transactions(count, seed):
+    rng = random.Random(seed)
+    transactions = []
+    for _ in range(count):
+        amount = rng.choice([round(rng.uniform(-5e5, 5e5), 2), rng.uniform(0, 1e7), rng.randint(-1000, 1000)])
+        transactions.append({'amount': amount, 'category': rng.choice(CATEGORIES),
+                             'sub_category': rng.choice(SUB_CATEGORIES), 'entry_type': 'Debit'})
+    return transactions
+
+
+def test_vectorized_metrics_match_the_row_loop_exactly():
+    transactions = make_transactions(20000, seed=3)
+    # Amounts as JSON may send them: numeric strings, junk, missing, None
+    transactions[0]['amount'] = '1234.56'
+    transactions[1]['amount'] = 'n/a'
+    transactions[2]['amount'] = None
+    del transactions[3]['amount']
+    del transactions[4]['category']
+    transactions[5]['category'] = ['Revenue']
+
+    result = metrics.calculate_metrics(transactions)
+    assert result == loop_metrics(transactions)
+    assert list(result) == list(loop_metrics(transactions))
+    assert metrics.calculate_metrics([]) == loop_metrics([])
+
+
+def test_vectorized_metrics_accept_columns_and_keep_summation_order():
+    transactions = make_transactions(5000, seed=11)
+    columns = metrics.calculate_metrics_columns(
+        [t['amount'] for t in transactions], [t['category'] for t in transactions],
+        [t['sub_category'] for t in transactions])
+    assert columns == loop_metrics(transactions)
+
+    # Values whose float sum depends on the order of the additions
+    drift = [{'amount': a, 'category': 'Revenue', 'sub_category': ''} for a in [1e16, 1.0, -1e16, 0.1, 0.2] * 50]
+    assert metrics.calculate_metrics(drift) == loop_metrics(drift)
+
+
+def test_sub_category_none_still_raises_like_the_loop():
+    with pytest.raises(TypeError):
+        metrics.calculate_metrics([{'amount': 1, 'category': 'Revenue', 'sub_category': None}])
+
+
+def load_engine_main():
+    spec = importlib.util.spec_from_file_location('financial_engine_main', os.path.join(ENGINE_DIR, 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def post(module, body):
+    import flask
+
+    with flask.Flask(__name__).test_request_context(json=body):
+        response = module.process_transaction(flask.request)
+    return response.status_code, json.loads(response.get_data())
+
+
+def test_metrics_for_a_context_come_from_its_aggregate_in_one_read(monkeypatch):
+    transactions = make_transactions(2000, seed=5)
+    totals = dict.fromkeys(metrics.BUCKETS + tuple(name for name, _ in metrics.DETAILS), 0.0)
+    for t in transactions:
+        bucket = metrics.CATEGORY_BUCKETS.get(t['category'])
+        if bucket:
+            totals[bucket] += t['amount']
+        for name, marker in metrics.DETAILS:
+            if marker in t['sub_category']:
+                totals[name] += t['amount']
+
+    import context_metrics
+
+    module = load_engine_main()
+    reads = []
+    monkeypatch.setattr(module, 'context_metrics_cache', context_metrics.ContextMetricsCache(
+        lambda company_id, period: reads.append((company_id, period)) or {
+            'company_id': company_id, 'period': period, 'totals': totals, 'rows': len(transactions), 'version': 7},
+        lambda company_id, period: pytest.fail('an aggregated context must not be queried')))
+
+    status, body = post(module, {'company_id': 'SGG-001', 'period': '2024-07', 'action': 'metrics'})
+    assert status == 200 and reads == [('SGG-001', '2024-07')]
+    assert body['metrics'] == metrics.calculate_metrics(transactions)
+    assert body['context'] == {'company_id': 'SGG-001', 'period': '2024-07', 'source': 'aggregate', 'rows': 2000,
+                               'data_version': 7, 'cache': 'miss'}
+
+    # The same question again: answered from the warm cache without a read
+    status, body = post(module, {'company_id': 'SGG-001', 'period': '2024-07', 'action': 'metrics'})
+    assert body['context']['cache'] == 'hit' and len(reads) == 1
+
+    # Transactions sent with the request are still computed directly
+    status, body = post(module, {'action': 'metrics', 'data': transactions[:10]})
+    assert body['metrics'] == loop_metrics(transactions[:10]) and 'context' not in body and len(reads) == 1
+
+
+def test_context_cache_keys_on_data_version_queries_unaggregated_contexts_and_evicts_lru():
+    import context_metrics
+
+    now = [0.0]
+    versions = {('SGG-001', '2024-07'): 1}
+    reads, queries = [], []
+    transactions = make_transactions(300, seed=9)
+
+    def read_aggregate(company_id, period):
+        reads.append((company_id, period))
+        version = versions.get((company_id, period))
+        return {'totals': {'revenue': 100.0 * version}, 'rows': 1, 'version': version} if version else {}
+
+    def query_columns(company_id, period):
+        queries.append((company_id, period))
+        return ([t['amount'] for t in transactions], [t['category'] for t in transactions],
+                [t['sub_category'] for t in transactions])
+
+    cache = context_metrics.ContextMetricsCache(read_aggregate, query_columns, max_entries=2, ttl_sec=10,
+                                                clock=lambda: now[0])
+    assert cache.get('SGG-001', '2024-07')['cache'] == 'miss'
+    assert cache.get('SGG-001', '2024-07')['cache'] == 'hit' and len(reads) == 1
+
+    # After the TTL the version is re-read; unchanged data is still a hit
+    now[0] = 11.0
+    assert cache.get('SGG-001', '2024-07')['cache'] == 'hit' and len(reads) == 2
+
+    # A new ingestion bumps the version: recomputed
+    versions[('SGG-001', '2024-07')] = 2
+    now[0] = 22.0
+    result = cache.get('SGG-001', '2024-07')
+    assert result['cache'] == 'miss' and result['data_version'] == 2 and result['metrics']['revenue'] == 200.0
+
+    # No aggregate: the period's rows are queried once, then cached
+    result = cache.get('SGG-002', '2024-07')
+    assert result['source'] == 'query' and result['rows'] == 300 and result['data_version'] == 0
+    assert result['metrics'] == loop_metrics(transactions)
+    assert cache.get('SGG-002', '2024-07')['cache'] == 'hit' and queries == [('SGG-002', '2024-07')]
+
+    # A third context evicts the least recently used entry
+    cache.get('SGG-003', '2024-07')
+    assert cache.stats()['evictions'] == 1 and cache.stats()['entries'] == 2
+    assert cache.get('SGG-001', '2024-07')['cache'] == 'miss'
+
+
+def exact_metrics(transactions):
+    """Reference for the minor-unit mode: the row loop in Decimal, rounded per amount to the cent."""
+    from decimal import Decimal
+
+    totals = dict.fromkeys(metrics.BUCKETS + tuple(name for name, _ in metrics.DETAILS), Decimal(0))
+    for t in transactions:
+        amount = Decimal(repr(t['amount']) if isinstance(t['amount'], float) else str(t['amount'])).quantize(Decimal('0.01'))
+        bucket = metrics.CATEGORY_BUCKETS.get(t['category'])
+        if bucket:
+            totals[bucket] += amount
+        for name, marker in metrics.DETAILS:
+            if marker in t['sub_category']:
+                totals[name] += amount
+    net_income = totals['revenue'] - totals['cogs'] - totals['expenses']
+    ebitda = net_income + totals['interest'] + totals['tax'] + totals['depreciation']
+    totals['equity'] += net_income
+    return {name: float(value) for name, value in dict(totals, net_income=net_income, ebitda=ebitda).items()}
+
+
+def test_minor_unit_mode_sums_exactly_where_floats_drift():
+    import money
+
+    rng = random.Random(17)
+    transactions = [{'amount': round(rng.uniform(-1e11, 1e11), 2), 'category': rng.choice(CATEGORIES),
+                     'sub_category': rng.choice(SUB_CATEGORIES)} for _ in range(20000)]
+    transactions[0]['amount'] = '1234.10'
+
+    exact = exact_metrics(transactions)
+    assert metrics.calculate_metrics(transactions, arithmetic='minor') == exact
+    assert metrics.calculate_metrics(transactions, arithmetic='float') != exact  # float sums lose cents at this scale
+    assert list(metrics.calculate_metrics(transactions, arithmetic='minor')) == list(loop_metrics(transactions))
+
+    assert [money.to_minor(v) for v in ['0.10', 0.1, 2.675, '1e3', 'n/a', None, float('nan'), 7]] == [10, 10, 268, 100000, 0, 0, 0, 700]
+    amounts = [0.1, 2.675, 1.005, -0.015, 12345.67, 3]
+    assert money.to_minor_array(amounts).tolist() == [money.to_minor(a) for a in amounts]
+
+    with pytest.raises(ValueError):
+        metrics.calculate_metrics(transactions, arithmetic='decimal')
+
+
+def test_minor_unit_reconciliation_is_exact_to_the_cent():
+    import ledger
+    import reconciliation
+
+    balanced = reconciliation.reconcile(1000000000000.3, 999999999999.1, 1.2, arithmetic='minor')
+    assert balanced == {'is_balanced': True, 'discrepancy': 0.0, 'equation': '1000000000000.3 = 999999999999.1 + 1.2'}
+    off_by_a_cent = reconciliation.reconcile_minor(10001, 5000, 5000)
+    assert off_by_a_cent['is_balanced'] is False and off_by_a_cent['discrepancy'] == 0.01
+
+    entries = ledger.apply_double_entry({'amount': '19.999', 'category': 'Revenue'}, arithmetic='minor')
+    assert [e['amount'] for e in entries] == [20.0, 20.0]
+
+
+def branch_double_entry(txn):
+    """The if/elif apply_double_entry the posting rules replaced (reference)."""
+    try:
+        amount = float(txn.get("amount", 0))
+    except (ValueError, TypeError):
+        amount = 0.0
+    category = txn.get("category", "Unknown")
+    if category in ["Revenue", "Sales"]:
+        accounts = ("Assets:Cash", "Revenue:Sales")
+    elif category in ["Expenses", "COGS", "Operating Expenses"]:
+        accounts = ("Expenses:General", "Assets:Cash")
+    elif category in ["Assets", "Capital Expenditures"]:
+        accounts = ("Assets:PPE", "Assets:Cash")
+    else:
+        accounts = ("Uncategorized", "Assets:Cash")
+    return [{"account": accounts[0], "type": "Debit", "amount": amount},
+            {"account": accounts[1], "type": "Credit", "amount": amount}]
+
+
+def test_configured_posting_rules_post_batches_like_the_branches():
+    import ledger
+    import posting_rules
+
+    transactions = make_transactions(3000, seed=21)
+    transactions[0]['amount'] = 'n/a'
+    del transactions[1]['category']
+    transactions[2]['category'] = ['Revenue']
+    expected = [entry for t in transactions for entry in branch_double_entry(t)]
+
+    assert [entry for t in transactions for entry in ledger.apply_double_entry(t)] == expected
+    posted = ledger.post_batch(transactions)
+    assert len(posted['debit']) == len(posted['credit']) == len(posted['amount']) == 3000
+    assert len(posted['accounts']) == 5 and posting_rules.to_entries(posted) == expected
+
+
+def test_posting_rules_dispatch_on_sub_category_first_rule_wins():
+    import posting_rules
+
+    rules = posting_rules.PostingRules({
+        "default": {"debit": "Suspense", "credit": "Assets:Cash"},
+        "rules": [
+            {"category": "Expenses", "sub_category": ["Depreciation"], "debit": "Expenses:Depreciation",
+             "credit": "Assets:Accumulated Depreciation"},
+            {"category": ["Expenses", "COGS"], "debit": "Expenses:General", "credit": "Assets:Cash"},
+            {"category": "Expenses", "debit": "Expenses:Ignored", "credit": "Assets:Cash"},
+        ]
+    })
+    assert rules.accounts_for("Expenses", "Depreciation") == ("Expenses:Depreciation", "Assets:Accumulated Depreciation")
+    assert rules.accounts_for("Expenses", "Rent") == rules.accounts_for("Expenses") == ("Expenses:General", "Assets:Cash")
+    assert rules.accounts_for("COGS", "Depreciation") == ("Expenses:General", "Assets:Cash")
+    assert rules.accounts_for(["Expenses"], "Depreciation") == rules.accounts_for("Gifts") == ("Suspense", "Assets:Cash")
+
+    posted = rules.post([{'amount': '0.105', 'category': 'Expenses', 'sub_category': 'Depreciation'},
+                         {'amount': 2, 'category': 'Expenses', 'sub_category': ['Rent']}], arithmetic='minor')
+    assert posted == {'accounts': ['Expenses:Depreciation', 'Assets:Accumulated Depreciation', 'Expenses:General', 'Assets:Cash'],
+                      'debit': [0, 2], 'credit': [1, 3], 'amount': [0.1, 2.0]}
+
+
+def test_process_returns_entries_by_default_and_columnar_on_request():
+    module = load_engine_main()
+    transactions = make_transactions(500, seed=2)
+    expected = [entry for t in transactions for entry in branch_double_entry(t)]
+
+    status, body = post(module, transactions)
+    assert status == 200 and body['processed_count'] == 500 and body['ledger_entries'] == expected and 'ledger' not in body
+
+    status, body = post(module, {'action': 'process', 'transactions': transactions, 'format': 'columnar'})
+    assert status == 200 and set(body['ledger']) == {'accounts', 'debit', 'credit', 'amount'} and 'ledger_entries' not in body
+    assert module.posting_rules.to_entries(body['ledger']) == expected
+
+    status, body = post(module, dict(transactions[0], action='process'))
+    assert body['processed_count'] == 1 and body['ledger_entries'] == branch_double_entry(transactions[0])